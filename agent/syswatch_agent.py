@@ -6,6 +6,9 @@ Download this file and read the instructions below carefully.
 
 This small program monitors your computer's system performance (CPU, RAM, Disk,
 and Internet Ping Speed) and sends it to your SysWatch Dashboard in real-time.
+It also reports load average, per-core CPU, usage of every disk, disk and
+network traffic, and the busiest programs (set EXTENDED_INTERVAL = 0 to turn
+this off).
 
 You can run this on **any computer you want to monitor**.
 
@@ -41,6 +44,8 @@ HOW TO USE (BEGINNER FRIENDLY):
 WHAT YOU WILL SEE:
 - A unique ID will be created for this computer.
 - The dashboard link will be printed once data is received by your server.
+- If the server can't be reached, readings are saved in a "syswatch_spool"
+  folder next to this file and sent automatically once it is back.
 
 --------------------------------------------------------------------------------
 
@@ -49,9 +54,58 @@ WHAT YOU WILL SEE:
 # ============================= CONFIGURATION ==================================
 
 SERVER_URL = "https://syswatch-6c1r.onrender.com/api/agent/metrics/"  
-UPDATE_INTERVAL = 5   # How often to send metrics (seconds)
+UPDATE_INTERVAL = 5   # How often to send metrics (seconds) until the server says otherwise
+# The server replies with the interval it wants (fast while someone watches
+# this computer's dashboard, slow otherwise or when it is busy); it is kept
+# within these bounds (seconds)
+MIN_INTERVAL = 1
+MAX_INTERVAL = 300
 IDENTITY_FILE = "syswatch_id.json"
 
+# How often each metric is sampled (seconds). Sampling runs on its own
+# schedule, separately from sending, so a slow ping or a slow network
+# never delays the other metrics.
+METRIC_INTERVALS = {
+    "cpu": 5,      # usage since the previous sample (non-blocking)
+    "ram": 5,
+    "disk": 60,    # disk usage changes slowly
+    "ping": 15,
+}
+
+# Pre-aggregation mode: sample FAST_METRICS every FAST_SAMPLE_INTERVAL
+# seconds into a ring buffer and send, with each sample, a summary per
+# metric (count, min, max, mean, p95) of the readings since the previous
+# send. Short spikes then reach the dashboard without sending any more
+# often. 0 turns it off; 1 is a good value to turn it on.
+FAST_SAMPLE_INTERVAL = 0
+FAST_METRICS = ["cpu", "ram"]
+
+# Extended metrics (per-core CPU, load average, every mounted disk, disk
+# and network I/O rates, top processes) are gathered in one pass this
+# often (seconds; 0 disables them) and sent with the next sample.
+EXTENDED_INTERVAL = 15
+TOP_PROCESSES = 5     # busiest processes reported, by CPU
+MOUNTS_REFRESH = 300  # seconds between re-listing mounted filesystems
+
+# "binary" sends each sample as a compact fixed-layout record (about 34
+# bytes instead of ~150 of JSON), with the hostname only when it changes
+# and values delta-encoded against the previous sample. "json" is the
+# plain format. Spooled samples are always replayed as JSON.
+WIRE_FORMAT = "binary"
+
+# Samples that cannot be delivered are kept on disk and replayed later
+SPOOL_DIR = "syswatch_spool"
+SPOOL_MAX_BYTES = 50 * 1024 * 1024   # drop the oldest samples beyond this
+SPOOL_SEGMENT_SAMPLES = 500          # samples per spool file / replay request
+SPOOL_REJECTED_MAX_BYTES = 5 * 1024 * 1024  # dead letters kept for samples the server refused
+GZIP_MIN_BYTES = 1024                # compress request bodies at least this big
+BACKOFF_BASE = 5                     # first retry delay after a failure (seconds)
+BACKOFF_MAX = 300                    # longest retry delay (seconds)
+
+# Latency is measured by timing a TCP connect to these "host:port" targets
+PING_TARGETS = ["8.8.8.8:53", "1.1.1.1:53"]
+PING_TIMEOUT = 2      # seconds before a target counts as timed out
+
 # ============================== DEPENDENCIES ==================================
 
 # Try importing requirements. Install if missing.
@@ -67,8 +121,12 @@ except ImportError:
 
 import time
 import json
-import platform
-import subprocess
+import collections
+import gzip
+import heapq
+import random
+import struct
+import threading
 import uuid
 import os
 import socket
@@ -87,62 +145,659 @@ def get_or_create_system_id():
     return system_id
 
 
-def get_ping_latency(host="8.8.8.8"):
-    """Check internet ping speed."""
+def tcp_rtt(target, timeout=None):
+    """
+    Milliseconds to open a TCP connection to "host:port", or None on timeout.
+    A refused connection still counts: the host answered.
+    """
+    host, port = target.rsplit(":", 1)
+    started = time.perf_counter()
     try:
-        cmd = ["ping", "-n" if platform.system().lower() == "windows" else "-c", "1", host]
-        output = subprocess.check_output(cmd, universal_newlines=True)
-        for line in output.split("\n"):
-            if "time=" in line:
-                return float(line.split("time=")[1].replace("ms", "").strip())
-    except:
-        return 0.0
-    return 0.0
-
-
-def collect_metrics():
-    """Collect local system resource usage."""
+        socket.create_connection((host, int(port)), timeout=timeout or PING_TIMEOUT).close()
+    except ConnectionRefusedError:
+        pass
+    except OSError:
+        return None
+    return (time.perf_counter() - started) * 1000
+
+
+def get_ping_latency():
+    """
+    Check internet latency: probe every PING_TARGETS entry at once (no
+    ping subprocess) and return the fastest round trip in ms.
+    Returns None if every target timed out.
+    """
+    results = {}
+    threads = [
+        threading.Thread(target=lambda t=t: results.__setitem__(t, tcp_rtt(t)), daemon=True)
+        for t in PING_TARGETS
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(PING_TIMEOUT + 1)
+
+    rtts = [rtt for rtt in results.values() if rtt is not None]
+    return round(min(rtts), 2) if rtts else None
+
+
+# Latest sampled value of each metric, shared by the sampler and the sender
+LATEST = {"cpu": 0.0, "ram": 0.0, "disk": 0.0, "ping": None}
+LATEST_LOCK = threading.Lock()
+
+# Pre-aggregation mode: readings of each FAST_METRICS entry since the last
+# send, in bounded ring buffers (created in run_agent)
+RINGS = {}
+
+
+def summarize(readings):
+    """[count, min, max, mean, p95] of some readings."""
+    ordered = sorted(readings)
+    count = len(ordered)
+    p95 = ordered[(95 * count - 1) // 100]  # nearest rank
+    return [count, round(ordered[0], 2), round(ordered[-1], 2), round(sum(ordered) / count, 2), round(p95, 2)]
+
+
+def sample_cpu():
+    # interval=None: usage since the previous call, returns immediately
+    return psutil.cpu_percent(interval=None)
+
+
+def sample_ram():
+    return psutil.virtual_memory().percent
+
+
+def sample_disk():
+    return psutil.disk_usage("/").percent
+
+
+class ExtendedProbe:
+    """
+    Collects the extended metrics in one pass, as cheaply as psutil allows:
+    per-core CPU and load average are single calls, I/O rates come from
+    the difference between two counter reads, the mount list is cached
+    for MOUNTS_REFRESH seconds, and processes are read through
+    psutil.process_iter, which reuses its Process handles between calls
+    (so per-process CPU has a baseline) and reads each one's attributes
+    in a single oneshot() pass.
+    """
+
+    PROCESS_ATTRS = ["pid", "name", "cpu_percent", "memory_info"]
+
+    def __init__(self):
+        self._counters = None     # (monotonic time, disk io counters, net io counters)
+        self._mounts = []
+        self._mounts_at = None
+        # Baselines: the first reading of each is "since now" and meaningless
+        psutil.cpu_percent(interval=None, percpu=True)
+        self.io_rates()
+        for _ in psutil.process_iter(["cpu_percent"]):
+            pass
+
+    def sample(self):
+        ext = {"cores": [round(v, 1) for v in psutil.cpu_percent(interval=None, percpu=True)]}
+        if hasattr(psutil, "getloadavg"):
+            ext["load"] = [round(v, 2) for v in psutil.getloadavg()]
+        ext.update(self.io_rates())
+        ext["mounts"] = self.mount_usage()
+        ext["procs"] = self.top_processes()
+        return ext
+
+    def io_rates(self):
+        """{"disk_io": [read, write], "net_io": [sent, recv]} in bytes/s since the last call."""
+        now = time.monotonic()
+        disk, net = psutil.disk_io_counters(), psutil.net_io_counters()
+        previous, self._counters = self._counters, (now, disk, net)
+        if previous is None:
+            return {}
+        elapsed = now - previous[0]
+        rates = {}
+        if disk and previous[1] and elapsed > 0:
+            rates["disk_io"] = [round(max(0, disk.read_bytes - previous[1].read_bytes) / elapsed),
+                                round(max(0, disk.write_bytes - previous[1].write_bytes) / elapsed)]
+        if net and previous[2] and elapsed > 0:
+            rates["net_io"] = [round(max(0, net.bytes_sent - previous[2].bytes_sent) / elapsed),
+                               round(max(0, net.bytes_recv - previous[2].bytes_recv) / elapsed)]
+        return rates
+
+    def mount_usage(self):
+        """{mountpoint: percent used} for every real filesystem."""
+        now = time.monotonic()
+        if self._mounts_at is None or now - self._mounts_at > MOUNTS_REFRESH:
+            self._mounts = sorted({p.mountpoint for p in psutil.disk_partitions(all=False)})[:64]
+            self._mounts_at = now
+        usage = {}
+        for mountpoint in self._mounts:
+            try:
+                usage[mountpoint] = psutil.disk_usage(mountpoint).percent
+            except OSError:  # unmounted since, no media, or no permission
+                continue
+        return usage
+
+    def top_processes(self):
+        """[[pid, name, cpu %, rss bytes], ...] for the TOP_PROCESSES busiest processes."""
+        procs = []
+        for proc in psutil.process_iter(self.PROCESS_ATTRS):
+            info = proc.info
+            if info["cpu_percent"] is None or info["memory_info"] is None:
+                continue  # access denied
+            procs.append((info["cpu_percent"], info["memory_info"].rss, info["pid"], info["name"] or ""))
+        return [[pid, name, round(cpu, 1), rss] for cpu, rss, pid, name in heapq.nlargest(TOP_PROCESSES, procs)]
+
+
+PROBE = None  # ExtendedProbe, created at startup when EXTENDED_INTERVAL is set
+
+
+def sample_extended():
+    return PROBE.sample()
+
+
+SAMPLERS = {
+    "cpu": sample_cpu,
+    "ram": sample_ram,
+    "disk": sample_disk,
+    "ping": get_ping_latency,
+    "ext": sample_extended,
+}
+
+
+def record_sample(metric):
+    """Run one sampler and store its value in LATEST."""
     try:
-        return {
-            "cpu": psutil.cpu_percent(interval=1),
-            "ram": psutil.virtual_memory().percent,
-            "disk": psutil.disk_usage("/").percent,
-            "ping": get_ping_latency(),
-            "hostname": socket.gethostname(),
-        }
+        value = SAMPLERS[metric]()
     except Exception as e:
-        print("⚠️ Error collecting metrics:", e)
-        return None
+        print(f"⚠️ Error collecting {metric}:", e)
+        return
+    with LATEST_LOCK:
+        # A timed-out ping stays None and is sent as null, not as a fake 0 ms
+        LATEST[metric] = value
+        if metric in RINGS and value is not None:
+            RINGS[metric].append(value)
 
 
-def send_metrics(system_id, metrics):
-    """Send metrics to the backend server with detailed logging."""
-    try:
-        print(f"\n📡 Sending metrics for {metrics['hostname']} ({system_id[:8]}...) to {SERVER_URL}")
-        print("   Payload:", json.dumps({"system_id": system_id, **metrics}, indent=2))
+def collect_metrics():
+    """
+    Return the latest sampled system resource usage. Extended metrics are
+    included only in the first sample after each refresh; in
+    pre-aggregation mode the readings since the last call are summarized.
+    """
+    with LATEST_LOCK:
+        metrics = dict(LATEST)
+        LATEST.pop("ext", None)
+        summary = {metric: summarize(ring) for metric, ring in RINGS.items() if ring}
+        for ring in RINGS.values():
+            ring.clear()
+    if summary:
+        metrics["summary"] = summary
+    metrics["hostname"] = socket.gethostname()
+    return metrics
+
+
+class Scheduler:
+    """
+    Runs tasks at fixed rates without drift: each run is scheduled at
+    start + n * interval on the monotonic clock, not "interval after the
+    previous run finished". Tasks marked `blocking` run in their own
+    thread so they cannot hold up the others; a blocking task that is
+    still running when it comes due again skips that turn.
+    set_interval() changes a task's rate while running (the server
+    decides how often this agent reports).
+    """
+
+    def __init__(self):
+        self._queue = []        # heap of (due, name)
+        self._tasks = {}        # name -> [interval, func, blocking]
+        self._running = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def every(self, interval, name, func, blocking=False, delay=0):
+        """Run func every `interval` seconds, the first time after `delay`."""
+        with self._lock:
+            self._tasks[name] = [interval, func, blocking]
+            heapq.heappush(self._queue, (time.monotonic() + delay, name))
+        self._wake.set()
+
+    def set_interval(self, name, interval):
+        """Change a task's interval; its next run moves to its last run + interval."""
+        with self._lock:
+            task = self._tasks.get(name)
+            if task is None or task[0] == interval:
+                return
+            previous, task[0] = task[0], interval
+            now = time.monotonic()
+            self._queue = [
+                (max(now, due - previous + interval) if queued == name else due, queued)
+                for due, queued in self._queue
+            ]
+            heapq.heapify(self._queue)
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stop.is_set():
+            with self._lock:
+                if not self._queue:
+                    return
+                due, name = self._queue[0]
+                delay = due - time.monotonic()
+                if delay <= 0:
+                    heapq.heappop(self._queue)
+                    _, func, blocking = self._tasks[name]
+            if delay > 0:
+                self._wake.wait(delay)
+                self._wake.clear()
+                continue
+
+            if blocking:
+                self._start_thread(name, func)
+            else:
+                func()
+
+            # Next slot on the fixed grid; skip slots we were too late for
+            with self._lock:
+                interval = self._tasks[name][0]
+                now = time.monotonic()
+                due += interval
+                if due <= now:
+                    due += ((now - due) // interval + 1) * interval
+                heapq.heappush(self._queue, (due, name))
+
+    def _start_thread(self, name, func):
+        if name in self._running:
+            return
+        self._running.add(name)
+
+        def target():
+            try:
+                func()
+            finally:
+                self._running.discard(name)
+
+        threading.Thread(target=target, name=f"syswatch-{name}", daemon=True).start()
+
+
+class Spool:
+    """
+    Disk buffer for samples the server has not accepted yet.
+
+    Samples are appended as JSON lines to numbered segment files in
+    SPOOL_DIR. A segment is closed after SPOOL_SEGMENT_SAMPLES lines, so
+    each one can be replayed as a single bulk POST and deleted once the
+    server accepts it. When the spool grows past SPOOL_MAX_BYTES the
+    oldest segments are dropped.
+
+    Samples the server refuses outright (a permanent 4xx) are moved to
+    rejected.jsonl in the same directory for inspection instead of being
+    retried; that file is started afresh once it passes rejected_max_bytes.
+    """
+
+    REJECTED = "rejected.jsonl"
+
+    def __init__(self, directory, max_bytes, segment_samples, rejected_max_bytes=SPOOL_REJECTED_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_samples = segment_samples
+        self.rejected_max_bytes = rejected_max_bytes
+        os.makedirs(directory, exist_ok=True)
+        segments = self.segments()
+        self._next = int(segments[-1].split("-")[1].split(".")[0]) + 1 if segments else 1
+        self._current = None
+        self._current_lines = 0
+
+    def segments(self):
+        """Segment file names, oldest first."""
+        names = [n for n in os.listdir(self.directory) if n.startswith("seg-") and n.endswith(".jsonl")]
+        return sorted(names)
+
+    def __bool__(self):
+        return bool(self.segments())
+
+    def append(self, sample):
+        if self._current is None or self._current_lines >= self.segment_samples:
+            self._current = f"seg-{self._next:010d}.jsonl"
+            self._current_lines = 0
+            self._next += 1
+        with open(os.path.join(self.directory, self._current), "a") as f:
+            f.write(json.dumps(sample, separators=(",", ":")) + "\n")
+        self._current_lines += 1
+        self._enforce_cap()
+
+    def oldest(self):
+        """(name, samples) of the oldest segment, or None if empty."""
+        segments = self.segments()
+        if not segments:
+            return None
+        name = segments[0]
+        if name == self._current:
+            self._current = None  # start a new segment for further appends
+        with open(os.path.join(self.directory, name)) as f:
+            samples = [json.loads(line) for line in f if line.strip()]
+        return name, samples
+
+    def remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def reject(self, samples, name=None):
+        """Dead-letters samples the server will never accept, and segment `name` if given."""
+        path = os.path.join(self.directory, self.REJECTED)
+        if os.path.exists(path) and os.path.getsize(path) > self.rejected_max_bytes:
+            os.remove(path)
+        with open(path, "a") as f:
+            for sample in samples:
+                f.write(json.dumps(sample, separators=(",", ":")) + "\n")
+        if name is not None:
+            self.remove(name)
+
+    def _enforce_cap(self):
+        segments = self.segments()
+        sizes = {n: os.path.getsize(os.path.join(self.directory, n)) for n in segments}
+        total = sum(sizes.values())
+        for name in segments[:-1]:
+            if total <= self.max_bytes:
+                break
+            self.remove(name)
+            total -= sizes[name]
+            print(f"⚠️ Spool full, dropped oldest segment {name}")
+
+
+class BinaryEncoder:
+    """
+    Encodes samples in the server's application/x-syswatch format
+    (see myapp/wire.py on the server for the full layout):
+
+        "SW" | version | count | flags | id length | id | [hostname] | body | [summary] | [ext]
+
+    Values are sent in hundredths, a timed-out ping as NULL. After the
+    first sample, records are deltas against the previous one the server
+    accepted (full again whenever either has no ping), and the hostname
+    is omitted unless it changed. Summaries (pre-aggregation mode) follow
+    the body as a metric mask and fixed-size records, then extended
+    metrics, if any, as length-prefixed JSON. reset() forces the next record to be a
+    full one (after a failed send, or when the server asks to resync).
+    """
+
+    CONTENT_TYPE = "application/x-syswatch"
+    FRAME = struct.Struct("<2sBH")
+    RECORD = struct.Struct("<BB")
+    FULL = struct.Struct("<q4I")
+    DELTA = struct.Struct("<qi4h")
+    EXT_LENGTH = struct.Struct("<H")
+    SUMMARY = struct.Struct("<H4I")
+    SUMMARY_METRICS = ("cpu", "ram", "disk", "ping")
+    FLAG_HOSTNAME = 0x01
+    FLAG_DELTA = 0x02
+    FLAG_EXTENDED = 0x04
+    FLAG_SUMMARY = 0x08
+    NULL = 0xFFFFFFFF
+
+    def __init__(self):
+        self.previous = None      # (ts_ms, values) of the last accepted sample
+        self.hostname = None      # hostname the server last received
+
+    def reset(self):
+        self.previous = None
+        self.hostname = None
+
+    def encode(self, sample):
+        """Returns (body, state) where state is passed to accepted() on success."""
+        ts = int(sample["ts"] * 1000)
+        # A timed-out ping is NULL, and never part of a delta
+        values = [self.NULL if sample[m] is None else max(0, round(sample[m] * 100))
+                  for m in ("cpu", "ram", "disk", "ping")]
 
-        response = requests.post(
-            SERVER_URL,
-            json={"system_id": system_id, **metrics},
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
+        try:
+            system_id = uuid.UUID(sample["system_id"])
+            id_field = system_id.bytes if str(system_id) == sample["system_id"] else None
+        except ValueError:
+            id_field = None
+        id_length = 0 if id_field else len(sample["system_id"].encode())
+        id_field = id_field or sample["system_id"].encode()
+
+        flags = 0
+        host = b""
+        if sample["hostname"] != self.hostname:
+            flags |= self.FLAG_HOSTNAME
+            host = sample["hostname"].encode()[:255].decode(errors="ignore").encode()
+            host = bytes([len(host)]) + host
+
+        body = None
+        if self.previous is not None and self.NULL not in values and self.NULL not in self.previous[1]:
+            base_ts, base_values = self.previous
+            deltas = [v - b for v, b in zip(values, base_values)]
+            if all(-32768 <= d <= 32767 for d in deltas) and 0 <= ts - base_ts < 2**31:
+                flags |= self.FLAG_DELTA
+                body = self.DELTA.pack(base_ts, ts - base_ts, *deltas)
+        if body is None:
+            body = self.FULL.pack(ts, *values)
+
+        summary = b""
+        if sample.get("summary"):
+            flags |= self.FLAG_SUMMARY
+            mask = 0
+            for i, metric in enumerate(self.SUMMARY_METRICS):
+                stats = sample["summary"].get(metric)
+                if stats:
+                    mask |= 1 << i
+                    summary += self.SUMMARY.pack(min(stats[0], 0xFFFF), *(max(0, round(v * 100)) for v in stats[1:]))
+            summary = bytes([mask]) + summary
+
+        ext = b""
+        if sample.get("ext"):
+            flags |= self.FLAG_EXTENDED
+            ext = json.dumps(sample["ext"], separators=(",", ":")).encode()
+            ext = self.EXT_LENGTH.pack(len(ext)) + ext
+
+        frame = (self.FRAME.pack(b"SW", 1, 1) + self.RECORD.pack(flags, id_length)
+                 + id_field + host + body + summary + ext)
+        return frame, (ts, values, sample["hostname"])
+
+    def accepted(self, state):
+        ts, values, hostname = state
+        self.previous = (ts, values)
+        self.hostname = hostname
+
+
+class ServerBusy(Exception):
+    """The server answered 429: come back after `retry_after` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"server busy, asked to retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class Rejected(Exception):
+    """The server refused the payload itself: a 4xx it would give again on every retry."""
+
+    # Anything else outside 2xx is treated as transient and retried
+    PERMANENT = {400, 413, 415, 422}
+
+    def __init__(self, status, message):
+        super().__init__(f"server rejected metrics ({status}): {message}")
+        self.status = status
+
+
+class Transport:
+    """
+    Sends samples over one keep-alive HTTP session. Bodies larger than
+    GZIP_MIN_BYTES are gzip-compressed. If the server cannot be reached,
+    samples go to the Spool and are replayed oldest-first in bulk once it
+    answers again; retries back off exponentially with jitter so a fleet
+    of agents does not reconnect in lockstep. A busy server (429) sets
+    the retry delay itself with Retry-After. Samples refused with a
+    permanent 4xx are dead-lettered to the spool's rejected file rather
+    than retried; any other non-2xx reply counts as a failed delivery.
+
+    Replies may carry "interval", the seconds the server wants between
+    samples; on_interval(seconds) is called when it changes.
+    """
+
+    def __init__(self, url, spool, on_interval=None):
+        self.url = url
+        self.spool = spool
+        self.session = requests.Session()
+        self.failures = 0
+        self.retry_at = 0.0
+        self.dashboard_url = None
+        self.encoder = BinaryEncoder() if WIRE_FORMAT == "binary" else None
+        self.interval = UPDATE_INTERVAL
+        self.on_interval = on_interval
+
+    def send(self, sample):
+        """Deliver one sample now, or spool it. Returns True if delivered."""
+        if self.spool or time.monotonic() < self.retry_at:
+            # Keep order: anything newer waits behind the spooled backlog
+            self.spool.append(sample)
+            if time.monotonic() >= self.retry_at:
+                self.replay()
+            return False
 
-        print(f"🖥 Server responded with status: {response.status_code}")
         try:
-            print("   Response body:", response.json())
-        except Exception:
-            print("   Response body is not valid JSON:", response.text)
-
-        if response.status_code == 200:
-            print(f"✅ Metrics successfully sent for {metrics['hostname']} ({system_id[:8]}...)")
-            if "dashboard_url" in response.json():
-                print(f"🌍 View dashboard: {response.json()['dashboard_url']}\n")
+            reply = self._send_live(sample)
+        except Rejected as e:
+            # Retrying would be refused again: keep it aside, but the server is up
+            print(f"⚠️ {e}; moved to {self.spool.REJECTED}")
+            self.spool.reject([sample])
+            if self.encoder is not None:
+                self.encoder.reset()
+            return False
+        except ServerBusy as e:
+            self._failed(e, e.retry_after)
+            self.spool.append(sample)
+            return False
+        except Exception as e:
+            self._failed(e)
+            self.spool.append(sample)
+            return False
+
+        self._succeeded()
+        if reply.get("dashboard_url") and reply["dashboard_url"] != self.dashboard_url:
+            self.dashboard_url = reply["dashboard_url"]
+            print(f"🌍 View dashboard: {self.dashboard_url}")
+        return True
+
+    def _send_live(self, sample):
+        """POST one fresh sample in the configured wire format."""
+        if self.encoder is None:
+            return self._post(sample)
+
+        body, state = self.encoder.encode(sample)
+        reply = self._post_raw(body, BinaryEncoder.CONTENT_TYPE)
+        if reply.get("resync"):
+            # Server no longer holds our delta base: send it in full
+            self.encoder.reset()
+            body, state = self.encoder.encode(sample)
+            reply = self._post_raw(body, BinaryEncoder.CONTENT_TYPE)
+        if reply.get("status") == "ok":
+            self.encoder.accepted(state)
         else:
-            print(f"⚠️ Warning: Server returned status {response.status_code}")
+            self.encoder.reset()
+        return reply
+
+    def replay(self):
+        """Send spooled segments oldest-first until one fails."""
+        if self.encoder is not None:
+            self.encoder.reset()  # the server's latest sample will be a spooled one
+        while True:
+            oldest = self.spool.oldest()
+            if oldest is None:
+                return
+            name, samples = oldest
+            try:
+                if samples:
+                    self._post(samples)
+            except Rejected as e:
+                print(f"⚠️ {e}; moved {len(samples)} spooled samples to {self.spool.REJECTED}")
+                self.spool.reject(samples, name)
+                continue
+            except ServerBusy as e:
+                self._failed(e, e.retry_after)
+                return
+            except Exception as e:
+                self._failed(e)
+                return
+            self.spool.remove(name)
+            self._succeeded()
+            print(f"📤 Replayed {len(samples)} spooled samples")
+
+    def _post(self, payload):
+        """POST payload as JSON; returns the decoded reply or raises."""
+        return self._post_raw(json.dumps(payload, separators=(",", ":")).encode(), "application/json")
+
+    def _post_raw(self, body, content_type):
+        """POST an encoded body; returns the decoded reply or raises."""
+        headers = {"Content-Type": content_type}
+        if len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        response = self.session.post(self.url, data=body, headers=headers, timeout=10)
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.headers.get("Retry-After", BACKOFF_BASE))
+            except ValueError:
+                retry_after = BACKOFF_BASE
+            raise ServerBusy(min(max(retry_after, 1), BACKOFF_MAX))
+        try:
+            reply = response.json()
+        except ValueError:
+            reply = {}
+        if response.status_code in Rejected.PERMANENT:
+            raise Rejected(response.status_code, reply.get("message", response.text[:200]))
+        if not 200 <= response.status_code < 300:
+            raise requests.exceptions.HTTPError(f"server returned {response.status_code}")
+        if reply.get("interval"):
+            self._set_interval(reply["interval"])
+        return reply
+
+    def _set_interval(self, interval):
+        try:
+            interval = min(max(float(interval), MIN_INTERVAL), MAX_INTERVAL)
+        except (TypeError, ValueError):
+            return
+        if interval != self.interval:
+            self.interval = interval
+            print(f"⏱ Server asks for a sample every {interval:g}s")
+            if self.on_interval:
+                self.on_interval(interval)
+
+    def _failed(self, error, delay=None):
+        """Schedules the next attempt: after `delay` if the server chose one, else backing off."""
+        self.failures += 1
+        if delay is None:
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.failures - 1))
+            delay *= random.uniform(0.5, 1.5)
+        self.retry_at = time.monotonic() + delay
+        print(f"❌ Could not deliver to server ({error}); buffering to disk, retrying in {delay:.0f}s")
+
+    def _succeeded(self):
+        if self.failures:
+            print("✅ Server reachable again")
+        self.failures = 0
+        self.retry_at = 0.0
+
+
+TRANSPORT = None
 
-    except requests.exceptions.RequestException as e:
-        print("❌ Network error while sending metrics:", e)
+
+def send_metrics(system_id, metrics):
+    """Send one sample to the backend server (spooled if unreachable)."""
+    global TRANSPORT
+    if TRANSPORT is None:
+        TRANSPORT = Transport(SERVER_URL, Spool(SPOOL_DIR, SPOOL_MAX_BYTES, SPOOL_SEGMENT_SAMPLES))
+
+    sample = {"system_id": system_id, "ts": round(time.time(), 3), **metrics}
+    try:
+        if TRANSPORT.send(sample):
+            ping = "timeout" if metrics["ping"] is None else f"{metrics['ping']:.1f}ms"
+            print(f"✅ Sent cpu {metrics['cpu']:.1f}% ram {metrics['ram']:.1f}% "
+                  f"disk {metrics['disk']:.1f}% ping {ping}")
     except Exception as e:
         print("❌ Unexpected error while sending metrics:", e)
 
@@ -150,7 +805,7 @@ def send_metrics(system_id, metrics):
 def run_agent():
     """Main background loop."""
     print("\n🚀 SysWatch Agent Running")
-    print(f"📡 Sending data every {UPDATE_INTERVAL} seconds to:\n   {SERVER_URL}\n")
+    print(f"📡 Sending data every {UPDATE_INTERVAL} seconds (until the server asks otherwise) to:\n   {SERVER_URL}\n")
 
     system_id = get_or_create_system_id()
 
@@ -158,11 +813,44 @@ def run_agent():
     print(f"💻 Device Name: {socket.gethostname()}")
     print("🛑 Press CTRL + C to stop.\n")
 
-    while True:
-        metrics = collect_metrics()
-        if metrics:
-            send_metrics(system_id, metrics)
-        time.sleep(UPDATE_INTERVAL)
+    # First cpu_percent(interval=None) call only sets the baseline
+    psutil.cpu_percent(interval=None)
+    global PROBE
+    if EXTENDED_INTERVAL:
+        PROBE = ExtendedProbe()
+
+    intervals = dict(METRIC_INTERVALS)
+    if FAST_SAMPLE_INTERVAL:
+        for metric in FAST_METRICS:
+            intervals[metric] = FAST_SAMPLE_INTERVAL
+            # Two of the longest send intervals; if sending stalls the oldest readings drop out
+            RINGS[metric] = collections.deque(maxlen=2 * max(1, round(MAX_INTERVAL / FAST_SAMPLE_INTERVAL)))
+
+    scheduler = Scheduler()
+    for metric, interval in intervals.items():
+        # ping waits on the network, so it runs in its own thread
+        scheduler.every(interval, metric, lambda m=metric: record_sample(m),
+                        blocking=(metric == "ping"), delay=1 if metric == "cpu" else 0)
+    if EXTENDED_INTERVAL:
+        # Walking the process table takes a few ms: keep it off the sampling thread
+        scheduler.every(EXTENDED_INTERVAL, "ext", lambda: record_sample("ext"), blocking=True, delay=1)
+
+    def follow_server(interval):
+        scheduler.set_interval("send", interval)
+        # Without fast sampling, read cpu and ram once per report, so cpu is
+        # the average over the whole interval rather than its last seconds
+        for metric in ("cpu", "ram"):
+            if metric not in RINGS:
+                scheduler.set_interval(metric, interval)
+
+    global TRANSPORT
+    TRANSPORT = Transport(SERVER_URL, Spool(SPOOL_DIR, SPOOL_MAX_BYTES, SPOOL_SEGMENT_SAMPLES), follow_server)
+
+    # Sending runs in its own thread too, so sampling keeps its cadence
+    # while a request is in flight. The first send waits for the first samples.
+    scheduler.every(UPDATE_INTERVAL, "send", lambda: send_metrics(system_id, collect_metrics()),
+                    blocking=True, delay=1.5)
+    scheduler.run()
 
 
 # ================================ START AGENT =================================
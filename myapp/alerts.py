@@ -0,0 +1,280 @@
+"""
+Server-side alert evaluation.
+
+Every accepted sample is fed to one small state machine per
+(system_id, metric), so the cost is O(1) per sample and independent of
+how many dashboards are open. A level (warning/critical) fires once the
+value has stayed at or above its threshold for `for_seconds`, and only
+clears once the value drops below threshold * (1 - hysteresis), so a
+value oscillating around a threshold does not flap. Dropping to a lower
+level is immediate.
+
+Thresholds come from SYSWATCH_ALERT_THRESHOLDS and can be overridden per
+host and metric with AlertRule rows (reloaded every
+SYSWATCH_ALERT_RULES_TTL seconds). State lives in the ingesting process;
+transitions are recorded as Alert rows, which is what /api/alerts/ reads.
+"""
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from . import telemetry
+from .history import HISTORY_FIELDS
+from .models import Alert, AlertRule
+
+logger = logging.getLogger(__name__)
+
+OK, WARNING, CRITICAL = 0, 1, 2
+SEVERITIES = {WARNING: "warning", CRITICAL: "critical"}
+PERCENT_METRICS = ("cpu", "ram", "disk")  # thresholds above 100 could never fire
+RULE_FIELDS = ("warning", "critical", "for_seconds", "hysteresis")
+
+
+class Rule:
+    __slots__ = ("warning", "critical", "for_ms", "hysteresis")
+
+    def __init__(self, warning, critical, for_seconds, hysteresis):
+        self.warning = warning
+        self.critical = critical
+        self.for_ms = int(for_seconds * 1000)
+        self.hysteresis = hysteresis
+
+    def threshold(self, level):
+        return self.critical if level == CRITICAL else self.warning
+
+    def as_dict(self):
+        return {
+            "warning": self.warning,
+            "critical": self.critical,
+            "for_seconds": self.for_ms / 1000,
+            "hysteresis": self.hysteresis,
+        }
+
+
+def default_rules():
+    return {
+        metric: Rule(
+            limits["warning"], limits["critical"],
+            limits.get("for_seconds", settings.SYSWATCH_ALERT_FOR_SECONDS),
+            limits.get("hysteresis", settings.SYSWATCH_ALERT_HYSTERESIS),
+        )
+        for metric, limits in settings.SYSWATCH_ALERT_THRESHOLDS.items()
+    }
+
+
+def parse_override(metric, override):
+    """
+    Validates one per-host override from the rules API and returns the
+    AlertRule fields ({name: float or None}, None keeping the default).
+    Raises ValueError with a short message if it is out of range or would
+    put warning above critical once merged with the defaults.
+    """
+    base = default_rules().get(metric)
+    if base is None:
+        raise ValueError(f"unknown metric {metric}")
+    if not isinstance(override, dict):
+        raise ValueError(f"override for {metric} must be an object or null")
+    unknown = set(override) - set(RULE_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown field {metric}.{sorted(unknown)[0]}")
+
+    fields = {}
+    for name in RULE_FIELDS:
+        value = override.get(name)
+        if value is not None:
+            if isinstance(value, bool):
+                raise ValueError(f"invalid {metric}.{name}")
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid {metric}.{name}")
+            if not math.isfinite(value) or value < 0:
+                raise ValueError(f"{metric}.{name} must be a number >= 0")
+        fields[name] = value
+
+    for name in ("warning", "critical"):
+        if metric in PERCENT_METRICS and fields[name] is not None and fields[name] > 100:
+            raise ValueError(f"{metric}.{name} must be at most 100")
+    if fields["hysteresis"] is not None and fields["hysteresis"] >= 1:
+        raise ValueError(f"{metric}.hysteresis must be below 1")
+    warning = base.warning if fields["warning"] is None else fields["warning"]
+    critical = base.critical if fields["critical"] is None else fields["critical"]
+    if warning > critical:
+        raise ValueError(f"{metric}.warning ({warning:g}) must not exceed critical ({critical:g})")
+    return fields
+
+
+class AlertState:
+    """Where one (system_id, metric) stands; `since` holds when the value
+    last rose to each level (None while below it)."""
+    __slots__ = ("level", "since", "value", "last_ts", "changed_at")
+
+    def __init__(self):
+        self.level = OK
+        self.since = [None, None, None]
+        self.value = None
+        self.last_ts = None
+        self.changed_at = None
+
+
+class AlertEngine:
+    def __init__(self, rules_ttl):
+        self.rules_ttl = rules_ttl
+        self._states = {}  # (system_id, metric) -> AlertState
+        self._defaults = None
+        self._overrides = {}  # (system_id, metric) -> Rule
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    # ---- rules ----
+    def rule(self, system_id, metric):
+        return self._overrides.get((system_id, metric)) or self._defaults.get(metric)
+
+    def rules_for(self, system_id):
+        self._refresh_rules()
+        return {metric: self.rule(system_id, metric) for metric in self._defaults}
+
+    def reload_rules(self):
+        self._loaded_at = None
+
+    def _refresh_rules(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < self.rules_ttl:
+            return
+        defaults = default_rules()
+        overrides = {}
+        try:
+            for row in AlertRule.objects.all():
+                base = defaults.get(row.metric)
+                if base is None:
+                    continue
+                overrides[(row.system_id, row.metric)] = Rule(
+                    row.warning if row.warning is not None else base.warning,
+                    row.critical if row.critical is not None else base.critical,
+                    row.for_seconds if row.for_seconds is not None else base.for_ms / 1000,
+                    row.hysteresis if row.hysteresis is not None else base.hysteresis,
+                )
+        except DatabaseError:
+            logger.exception("loading alert rules failed; keeping previous overrides")
+            overrides = self._overrides
+        self._defaults, self._overrides, self._loaded_at = defaults, overrides, now
+
+    # ---- evaluation ----
+    def observe(self, samples):
+        """
+        Advances the state machines with accepted ingest.Samples and
+        returns the transitions as (system_id, metric, level, value,
+        threshold, ts) tuples. Samples older than the last one seen for
+        a system are ignored one by one; the last-seen watermark never
+        moves past server time plus SYSWATCH_INGEST_MAX_SKEW, so one
+        future-dated sample cannot mute a host. A missing value (timed-out
+        ping) leaves that metric's state as it was.
+        """
+        transitions = []
+        horizon = int(time.time() * 1000 + settings.SYSWATCH_INGEST_MAX_SKEW * 1000)
+        with self._lock:
+            self._refresh_rules()
+            for sample in samples:
+                for metric in self._defaults:
+                    value = getattr(sample, metric)
+                    if value is None:
+                        continue
+                    rule = self.rule(sample.system_id, metric)
+                    key = (sample.system_id, metric)
+                    state = self._states.get(key)
+                    if state is None:
+                        state = self._states[key] = AlertState()
+                    level = self._step(state, rule, value, sample.ts, horizon)
+                    if level is not None:
+                        threshold = rule.threshold(level) if level else None
+                        transitions.append((sample.system_id, metric, level, state.value, threshold, sample.ts))
+        return transitions
+
+    @staticmethod
+    def _step(state, rule, value, ts, horizon=None):
+        """
+        Applies one value; returns the new level if it changed, else None.
+        `horizon` (epoch ms) caps the timestamp used for ordering and timing.
+        """
+        if horizon is not None:
+            ts = min(ts, horizon)
+        if state.last_ts is not None and ts < state.last_ts:
+            return None
+        state.last_ts = ts
+        state.value = value
+
+        since = state.since
+        for level in (WARNING, CRITICAL):
+            threshold = rule.threshold(level)
+            if state.level >= level:
+                threshold *= 1 - rule.hysteresis  # held until it clearly drops
+            if value >= threshold:
+                if since[level] is None:
+                    since[level] = ts
+            else:
+                since[level] = None
+
+        new = OK
+        for level in (CRITICAL, WARNING):
+            if since[level] is not None and (state.level >= level or ts - since[level] >= rule.for_ms):
+                new = level
+                break
+        if new == state.level:
+            return None
+        state.level = new
+        state.changed_at = ts
+        return new
+
+    # ---- reads ----
+    def open_for(self, system_id):
+        """Open alerts for one system from this process' state."""
+        alerts = []
+        for metric in HISTORY_FIELDS:
+            state = self._states.get((system_id, metric))
+            if state is None or state.level == OK:
+                continue
+            alerts.append({
+                "metric": metric,
+                "severity": SEVERITIES[state.level],
+                "value": state.value,
+                "threshold": self.rule(system_id, metric).threshold(state.level),
+                "since": ms_to_datetime(state.changed_at).isoformat(),
+            })
+        return alerts
+
+
+def ms_to_datetime(ts):
+    return datetime.fromtimestamp(ts / 1000, tz=timezone.utc)
+
+
+def record(transitions):
+    """
+    Persists transitions: the open Alert for that (system_id, metric) is
+    resolved, and a new one opened unless the level went back to OK.
+    """
+    if not transitions:
+        return
+    try:
+        with telemetry.span("alerts.record"), transaction.atomic():
+            for system_id, metric, level, value, threshold, ts in transitions:
+                at = ms_to_datetime(ts)
+                Alert.objects.filter(system_id=system_id, metric=metric, resolved_at__isnull=True).update(resolved_at=at)
+                if level != OK:
+                    Alert.objects.create(
+                        system_id=system_id, metric=metric, severity=SEVERITIES[level],
+                        value=value, threshold=threshold, started_at=at,
+                    )
+    except DatabaseError:
+        logger.exception("recording %d alert transitions failed", len(transitions))
+
+
+engine = AlertEngine(rules_ttl=settings.SYSWATCH_ALERT_RULES_TTL)
+
+
+def observe(samples):
+    record(engine.observe(samples))
@@ -0,0 +1,181 @@
+"""
+Fleet-wide anomaly detection against each host's own baseline.
+
+Fixed thresholds (myapp/alerts.py) miss a host that is far from its
+usual level but still under the limit. Here every (host, metric) keeps
+an exponentially weighted mean and variance, stored as rows of
+contiguous NumPy arrays indexed by a dense per-host slot.
+
+Ingest only appends accepted samples' slot and values to two plain lists
+(no NumPy work on the request path). Every SYSWATCH_ANOMALY_INTERVAL
+seconds one tick folds them into per-host sums with np.bincount and
+scores all hosts that reported since the previous tick in a single
+vectorized pass:
+the tick mean x is compared with the baseline as z = |x - mean| / std,
+then the baseline is updated with weight SYSWATCH_ANOMALY_ALPHA. A host
+is anomalous while any metric scores at least SYSWATCH_ANOMALY_Z, once
+that metric has SYSWATCH_ANOMALY_WARMUP ticks of baseline. Baselines
+are kept per metric, so a ping that was timing out when its host first
+reported starts its own from the first value it does get. Scores only
+describe the latest tick: a host, or a metric, without samples in it
+drops back to 0 and out of anomalies().
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from . import telemetry
+from .history import HISTORY_FIELDS
+
+logger = logging.getLogger(__name__)
+
+METRICS = len(HISTORY_FIELDS)
+
+# Per-slot arrays: (attribute, columns or 0 for a vector, dtype)
+ARRAYS = (
+    ("_mean", METRICS, np.float64),  # EWMA baseline
+    ("_var", METRICS, np.float64),  # EWM variance
+    ("_ticks", METRICS, np.int64),  # ticks of baseline so far
+    ("_last", METRICS, np.float64),  # last scored tick mean
+    ("_score", METRICS, np.float64),  # last z-scores
+)
+
+
+class AnomalyDetector:
+    def __init__(self, interval, alpha, threshold, warmup, min_std, capacity=1024):
+        self.interval = interval
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.min_std = min_std
+        self.scored_at = None
+        self._slots = {}  # system_id -> row in the arrays below
+        self._ids = []  # row -> system_id
+        self._pending_slots = []  # samples since the last tick: slot ...
+        self._pending_values = []  # ... and (cpu, ram, disk, ping)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        """(Re)allocates the per-slot arrays, keeping existing rows."""
+        for name, width, dtype in ARRAYS:
+            new = np.zeros((capacity, width) if width else capacity, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, samples):
+        """Queues accepted ingest.Samples for the next tick."""
+        with self._lock:
+            slots = self._slots
+            for sample in samples:
+                slot = slots.get(sample.system_id)
+                if slot is None:
+                    slot = slots[sample.system_id] = len(self._ids)
+                    self._ids.append(sample.system_id)
+                    if slot == len(self._ticks):
+                        self._allocate(2 * slot)
+                self._pending_slots.append(slot)
+                self._pending_values.append((sample.cpu, sample.ram, sample.disk, sample.ping))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="syswatch-anomaly", daemon=True)
+                self._thread.start()
+
+    def tick(self):
+        """Scores and updates every host that reported since the last tick."""
+        with self._lock:
+            n = len(self._ids)
+            pending_slots, self._pending_slots = self._pending_slots, []
+            pending_values, self._pending_values = self._pending_values, []
+            if not pending_slots:
+                self._score[:n] = 0  # nobody reported: nothing is anomalous now
+                return 0
+            # Per-host, per-metric sums and counts of the samples since the
+            # last tick; a missing value (timed-out ping, NaN here) counts for neither
+            slots = np.asarray(pending_slots, dtype=np.int64)
+            values = np.asarray(pending_values, dtype=np.float64)  # None -> NaN
+            present = ~np.isnan(values)
+            values = np.where(present, values, 0.0)
+            counts = np.column_stack([np.bincount(slots, weights=present[:, i], minlength=n) for i in range(METRICS)])
+            sums = np.column_stack([np.bincount(slots, weights=values[:, i], minlength=n) for i in range(METRICS)])
+            update = counts > 0
+            scored = int(np.count_nonzero(update.any(axis=1)))
+            mean, var, ticks = self._mean[:n], self._var[:n], self._ticks[:n]
+
+            # Whole-fleet pass; (host, metric) pairs without a value this
+            # tick keep their baseline, and a pair's first value seeds it
+            x = sums / np.maximum(counts, 1)
+            first = ticks == 0
+            diff = np.where(first, 0.0, x - mean)
+            score = np.abs(diff) / np.maximum(np.sqrt(var), self.min_std)
+            score[(ticks < self.warmup) | ~update] = 0
+
+            np.copyto(mean, np.where(first, x, mean + self.alpha * diff), where=update)
+            np.copyto(var, (1 - self.alpha) * (var + self.alpha * diff * diff), where=update)
+            np.copyto(self._last[:n], x, where=update)
+            self._score[:n] = score
+            ticks += update
+            self.scored_at = time.time()
+        return scored
+
+    def anomalies(self, limit=100, system_id=None):
+        """
+        Hosts whose latest tick scored >= threshold on any metric, highest
+        score first, with per-metric value, baseline and z-score.
+        """
+        with self._lock:
+            n = len(self._ids)
+            if system_id is not None:
+                slot = self._slots.get(system_id)
+                rows = np.array([] if slot is None else [slot], dtype=np.int64)
+            else:
+                rows = np.arange(n)
+            peak = self._score[rows].max(axis=1) if len(rows) else np.empty(0)
+            mask = peak >= self.threshold
+            hits = rows[mask]
+            order = np.argsort(-peak[mask], kind="stable")[:limit]
+
+            result = []
+            for row in hits[order]:
+                metrics = {}
+                for i, metric in enumerate(HISTORY_FIELDS):
+                    metrics[metric] = {
+                        "value": float(self._last[row, i]),
+                        "mean": float(self._mean[row, i]),
+                        "std": float(np.sqrt(self._var[row, i])),
+                        "score": float(self._score[row, i]),
+                    }
+                result.append({
+                    "system_id": self._ids[row],
+                    "score": float(self._score[row].max()),
+                    "metrics": metrics,
+                })
+        return result
+
+    def host_count(self):
+        return len(self._ids)
+
+    def _run(self):
+        next_run = time.monotonic() + self.interval
+        while True:
+            time.sleep(max(0, next_run - time.monotonic()))
+            try:
+                with telemetry.span("anomaly.tick"):
+                    self.tick()
+            except Exception:
+                logger.exception("anomaly tick failed")
+            next_run += self.interval
+
+
+detector = AnomalyDetector(
+    interval=settings.SYSWATCH_ANOMALY_INTERVAL,
+    alpha=settings.SYSWATCH_ANOMALY_ALPHA,
+    threshold=settings.SYSWATCH_ANOMALY_Z,
+    warmup=settings.SYSWATCH_ANOMALY_WARMUP,
+    min_std=settings.SYSWATCH_ANOMALY_MIN_STD,
+)
@@ -1,6 +1,36 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+SERVERS = ("uvicorn", "gunicorn", "daphne", "hypercorn")
+
+
+def serving():
+    """
+    True only in a server process: uvicorn/gunicorn/... (also run as
+    "python -m uvicorn"), or the serving child of runserver. Management
+    commands, tests and scripts that call django.setup() get False.
+    """
+    program = os.path.basename(sys.argv[0])
+    if program == "__main__.py":
+        program = os.path.basename(os.path.dirname(sys.argv[0]))
+    if program in SERVERS:
+        return True
+    if program != "manage.py" or sys.argv[1:2] != ["runserver"]:
+        return False
+    return os.environ.get("RUN_MAIN") == "true" or "--noreload" in sys.argv
 
 
 class MyappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'myapp'
+
+    def ready(self):
+        # Sweep from startup, so hosts that died while the server was down
+        # are noticed even if no agent reports to this worker
+        if settings.SYSWATCH_LIVENESS_AUTOSTART and serving():
+            from . import liveness
+            liveness.tracker.start()
@@ -0,0 +1,239 @@
+"""
+Load generator and dashboard-reader simulation for `manage.py bench`.
+
+Simulated agents POST samples to /api/agent/metrics/ on their own
+schedule (random phase, +/- jitter around the agent interval, values
+random-walking like a real host), while simulated dashboards poll
+/api/metrics/<id>/snapshot/ with If-None-Match like dashboard.js does.
+
+Everything runs on one asyncio loop with a small keep-alive HTTP/1.1
+client on raw streams, so thousands of agents need no extra threads or
+dependencies. Latencies are recorded per request kind and summarized as
+throughput and p50/p99.
+"""
+import asyncio
+import json
+import random
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from . import wire
+from .ingest import Sample
+
+
+class HttpClient:
+    """Minimal keep-alive HTTP/1.1 client for one host:port."""
+
+    def __init__(self, url, connections):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self._idle = asyncio.LifoQueue()
+        self._slots = asyncio.Semaphore(connections)
+
+    async def request(self, method, path, body=b"", headers=None):
+        """Returns (status, headers, body)."""
+        async with self._slots:
+            try:
+                conn, reused = self._idle.get_nowait(), True
+            except asyncio.QueueEmpty:
+                conn, reused = await asyncio.open_connection(self.host, self.port), False
+            try:
+                response = await self._send(conn, method, path, body, headers)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                # The server closed an idle keep-alive connection; retry on a fresh one
+                conn = await asyncio.open_connection(self.host, self.port)
+                response = await self._send(conn, method, path, body, headers)
+            if response[1].get("connection", "").lower() == "close":
+                conn[1].close()
+            else:
+                self._idle.put_nowait(conn)
+            return response
+
+    async def _send(self, conn, method, path, body, headers):
+        reader, writer = conn
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                f"Content-Length: {len(body)}"]
+        head.extend(f"{k}: {v}" for k, v in (headers or {}).items())
+        try:
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+            await writer.drain()
+            return await self._read_response(reader)
+        except BaseException:
+            writer.close()
+            raise
+
+    @staticmethod
+    async def _read_response(reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b"".join(chunks)
+        else:
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+        return status, headers, body
+
+    async def close(self):
+        while not self._idle.empty():
+            _, writer = self._idle.get_nowait()
+            writer.close()
+
+
+class Recorder:
+    """Latencies (seconds) and outcome counts for one request kind."""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.late = 0  # sends that started more than one interval behind schedule
+
+    def add(self, status, latency):
+        self.latencies.append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def summary(self, duration):
+        ordered = sorted(self.latencies)
+
+        def percentile(q):
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+        ok = sum(count for status, count in self.statuses.items() if status < 400)
+        return {
+            "requests": len(ordered),
+            "errors": self.errors + len(ordered) - ok,
+            "late": self.late,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items())},
+            "throughput_rps": round(len(ordered) / duration, 1),
+            "ok_per_s": round(ok / duration, 1),
+            "p50_ms": percentile(0.50),
+            "p99_ms": percentile(0.99),
+            "max_ms": percentile(1.0),
+        }
+
+
+class SimulatedAgent:
+    """One host: random-walking metrics sent every `interval` +/- jitter."""
+
+    def __init__(self, index, interval, jitter, binary):
+        self.system_id = str(uuid.uuid4())
+        self.hostname = f"bench-{index:06d}"
+        self.interval = interval
+        self.jitter = jitter
+        self.binary = binary
+        self.values = [random.uniform(5, 60), random.uniform(20, 80), random.uniform(10, 90), random.uniform(1, 50)]
+        self.previous = None  # last Sample sent, base for binary deltas
+
+    def next_sample(self):
+        for i, value in enumerate(self.values):
+            self.values[i] = min(100, max(0, value + random.gauss(0, 2)))
+        return Sample(self.system_id, self.hostname, int(time.time() * 1000), *[round(v, 2) for v in self.values])
+
+    def encode(self, sample):
+        if self.binary:
+            previous = {self.system_id: self.previous} if self.previous else None
+            body = wire.encode_frame([sample], previous, send_hostname=self.previous is None)
+            return body, wire.CONTENT_TYPE
+        data = sample._asdict()
+        data["ts"] = sample.ts / 1000
+        return json.dumps(data).encode(), "application/json"
+
+    async def run(self, client, recorder, deadline):
+        next_send = time.monotonic() + random.uniform(0, self.interval)
+        while True:
+            await asyncio.sleep(max(0, next_send - time.monotonic()))
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            if now - next_send > self.interval:
+                recorder.late += 1
+            sample = self.next_sample()
+            body, content_type = self.encode(sample)
+            started = time.perf_counter()
+            try:
+                status, _, response = await client.request(
+                    "POST", "/api/agent/metrics/", body, {"Content-Type": content_type})
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                recorder.errors += 1
+            else:
+                recorder.add(status, time.perf_counter() - started)
+                if status == 200 and not (self.binary and json.loads(response).get("resync")):
+                    self.previous = sample
+                else:
+                    self.previous = None
+            next_send += self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+async def run_reader(client, system_ids, interval, recorder, deadline):
+    """One dashboard tab: polls a random host's snapshot with If-None-Match."""
+    system_id = random.choice(system_ids)
+    etag = None
+    next_poll = time.monotonic() + random.uniform(0, interval)
+    while True:
+        await asyncio.sleep(max(0, next_poll - time.monotonic()))
+        if time.monotonic() >= deadline:
+            return
+        headers = {"If-None-Match": etag} if etag else None
+        started = time.perf_counter()
+        try:
+            status, response_headers, _ = await client.request(
+                "GET", f"/api/metrics/{system_id}/snapshot/", headers=headers)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            recorder.errors += 1
+        else:
+            recorder.add(status, time.perf_counter() - started)
+            etag = response_headers.get("etag", etag)
+        next_poll += interval
+
+
+async def run_load(url, agents, readers, duration, interval, read_interval, jitter, binary, connections):
+    """
+    Runs the agent and reader simulations side by side for `duration`
+    seconds and returns {"ingest": summary, "read": summary}.
+    """
+    ingest_client = HttpClient(url, connections)
+    read_client = HttpClient(url, max(1, min(connections, readers)))
+    fleet = [SimulatedAgent(i, interval, jitter, binary) for i in range(agents)]
+    ingest, read = Recorder(), Recorder()
+
+    started = time.monotonic()
+    deadline = started + duration
+    tasks = [asyncio.create_task(agent.run(ingest_client, ingest, deadline)) for agent in fleet]
+    # Readers start once every agent has had a chance to register
+    await asyncio.sleep(min(interval, duration / 2))
+    system_ids = [agent.system_id for agent in fleet]
+    tasks += [
+        asyncio.create_task(run_reader(read_client, system_ids, read_interval, read, deadline))
+        for _ in range(readers)
+    ]
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+    await ingest_client.close()
+    await read_client.close()
+    return {
+        "ingest": ingest.summary(elapsed),
+        "read": read.summary(max(0.001, elapsed - min(interval, duration / 2))),
+    }
@@ -0,0 +1,105 @@
+"""
+Bounded, TTL-aware per-process cache of live metric records.
+
+Sits behind load_system_data for values not in the shared store. Entries
+are compact LiveRecord objects (__slots__, no per-entry dict), the cache
+holds at most `capacity` of them and evicts least recently used ones,
+and an entry older than `ttl` seconds counts as a miss so the caller
+refreshes it from the database. Unknown system_ids are cached as None
+(negative entries) so random ids cannot hammer the database either.
+All operations are O(1).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Fields a client may ask for by name via /api/metrics/<id>/<metric>/
+PUBLIC_FIELDS = ("cpu", "ram", "disk", "ping", "hostname")
+
+MISS = object()
+
+
+class LiveRecord:
+    """
+    Latest values for one system. `version` is the sample time in epoch ms
+    (None marks a cached "no such system" entry).
+    """
+    __slots__ = ("hostname", "cpu", "ram", "disk", "ping", "version", "loaded_at")
+
+    def __init__(self, hostname, cpu, ram, disk, ping, version):
+        self.hostname = hostname
+        self.cpu = cpu
+        self.ram = ram
+        self.disk = disk
+        self.ping = ping
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    def field(self, name, default=0):
+        return getattr(self, name) if name in PUBLIC_FIELDS else default
+
+
+class LiveCache:
+    def __init__(self, capacity, ttl):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, system_id):
+        """
+        Returns the cached LiveRecord, None for a cached unknown system, or
+        MISS when there is no fresh entry.
+        """
+        now = time.monotonic()
+        with self._lock:
+            record = self._entries.get(system_id)
+            if record is None:
+                self.misses += 1
+                return MISS
+            if now - record.loaded_at > self.ttl:
+                del self._entries[system_id]
+                self.expirations += 1
+                self.misses += 1
+                return MISS
+            self._entries.move_to_end(system_id)
+            self.hits += 1
+            return None if record.version is None else record
+
+    def put(self, system_id, record):
+        """
+        Caches a LiveRecord, or a negative entry if record is None. A record
+        older than the cached one (e.g. from a replayed batch) is ignored.
+        """
+        if record is None:
+            record = LiveRecord(None, 0, 0, 0, 0, None)
+        with self._lock:
+            current = self._entries.get(system_id)
+            if current is not None and record.version is not None and (current.version or 0) > record.version:
+                return
+            self._entries[system_id] = record
+            self._entries.move_to_end(system_id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,91 @@
+"""
+Ingest control channel: how often each agent should report, and when to
+turn samples away.
+
+Every ingest reply carries "interval", the seconds the agent should wait
+before its next sample:
+
+    a dashboard stream is open for the system    SYSWATCH_INTERVAL_WATCHED (1 s)
+    otherwise                                    SYSWATCH_INTERVAL_IDLE (30 s)
+
+multiplied by the load factor and capped at SYSWATCH_INTERVAL_MAX. The
+load factor is how far this process is over budget: accepted samples/s
+against SYSWATCH_INGEST_TARGET_RATE, or the write-behind backlog against
+one flush batch. Cooperating agents therefore slow down in proportion
+and the total ingest rate settles near the target.
+
+When the write-behind queue holds SYSWATCH_INGEST_SHED_DEPTH samples the
+server is falling behind faster than intervals can react, so ingest
+answers 429 with a jittered Retry-After (agents spool and come back
+spread out instead of in lockstep).
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from . import live, shm, writebehind
+from .history import now_ms
+
+
+class RateMeter:
+    """Events per second, averaged exponentially over about `window` seconds."""
+
+    def __init__(self, window=10.0):
+        self.window = window
+        self.rate = 0.0
+        self._count = 0
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, count):
+        with self._lock:
+            self._count += count
+            now = time.monotonic()
+            elapsed = now - self._started
+            if elapsed >= 1.0:
+                weight = min(1.0, elapsed / self.window)
+                self.rate += weight * (self._count / elapsed - self.rate)
+                self._count = 0
+                self._started = now
+
+
+meter = RateMeter()
+
+
+def load_factor():
+    """1.0 when within budget, else how many times over it this process is."""
+    factor = meter.rate / settings.SYSWATCH_INGEST_TARGET_RATE
+    if writebehind.enabled():
+        factor = max(factor, writebehind.buffer.depth() / settings.SYSWATCH_FLUSH_MAX_PENDING)
+    return max(1.0, factor)
+
+
+def watched(system_id):
+    """True if a dashboard stream is open for system_id in any worker."""
+    if live.hub.watching(system_id):
+        return True
+    return shm.enabled() and shm.store.watched_until(system_id) > now_ms()
+
+
+def mark_watched(system_id):
+    """Called periodically by open streams so other workers see them (via shm)."""
+    if shm.enabled():
+        ttl = 2 * settings.SYSWATCH_STREAM_KEEPALIVE + 5
+        shm.store.mark_watched(system_id, now_ms() + int(ttl * 1000))
+
+
+def interval_for(system_id):
+    """Seconds until the agent of system_id should send its next sample."""
+    base = settings.SYSWATCH_INTERVAL_WATCHED if watched(system_id) else settings.SYSWATCH_INTERVAL_IDLE
+    return round(min(settings.SYSWATCH_INTERVAL_MAX, base * load_factor()), 1)
+
+
+def overloaded():
+    return writebehind.enabled() and writebehind.buffer.depth() >= settings.SYSWATCH_INGEST_SHED_DEPTH
+
+
+def retry_after():
+    """Whole seconds for Retry-After: SYSWATCH_RETRY_AFTER +/- 50%."""
+    return max(1, round(settings.SYSWATCH_RETRY_AFTER * random.uniform(0.5, 1.5)))
@@ -0,0 +1,108 @@
+"""
+Largest-Triangle-Three-Buckets downsampling for chart series.
+
+LTTB keeps the first and last point and, for each of `threshold - 2`
+equal buckets in between, the point forming the largest triangle with
+the point kept from the previous bucket and the average of the next
+bucket. Peaks and dips survive, unlike plain averaging, so a 24 h chart
+of ~17k samples looks the same at 500 points.
+
+All metrics of a host share one time axis, so they are downsampled
+together: bucket bounds and next-bucket averages are computed for every
+metric at once with NumPy prefix sums, and the per-bucket step (which
+depends on the previously kept point) works on an (n, metrics) block,
+one pass over the data for all series.
+
+Agent-side summaries (count/min/max/mean/p95 per interval) are not
+points on a line, so they are merged by time bucket instead of picked
+(merge_summaries).
+"""
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """
+    x: (n,) increasing positions; y: (n, m) values, one column per series.
+    Returns an (k, m) array of row indexes kept for each series, with
+    k = min(n, threshold).
+    """
+    n, m = y.shape
+    if threshold >= n or threshold < 3:
+        return np.repeat(np.arange(n)[:, None], m, axis=1)
+
+    every = (n - 2) / (threshold - 2)
+    # Bucket i covers rows [bounds[i], bounds[i + 1]) for i in 0..threshold-3
+    bounds = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    bounds[-1] = n - 1
+
+    # Average of each bucket's successor (the last bucket looks at the final point)
+    x_sum = np.concatenate(([0.0], np.cumsum(x)))
+    y_sum = np.vstack((np.zeros((1, m)), np.cumsum(y, axis=0)))
+    next_start = bounds[1:]
+    next_end = np.append(bounds[2:], n)
+    width = (next_end - next_start)[:, None]
+    avg_x = (x_sum[next_end] - x_sum[next_start]) / width[:, 0]
+    avg_y = (y_sum[next_end] - y_sum[next_start]) / width
+
+    kept = np.empty((threshold, m), dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    columns = np.arange(m)
+    previous = np.zeros(m, dtype=np.int64)
+    for i in range(threshold - 2):
+        start, end = bounds[i], bounds[i + 1]
+        px = x[previous]  # (m,)
+        py = y[previous, columns]  # (m,)
+        area = np.abs(
+            (px - avg_x[i]) * (y[start:end] - py)
+            - (px - x[start:end, None]) * (avg_y[i] - py)
+        )
+        previous = start + np.argmax(area, axis=0)
+        kept[i + 1] = previous
+    return kept
+
+
+def downsample(rows, fields, threshold):
+    """
+    rows: (ts, *fields) tuples, oldest first. Returns
+    {field: [[ts, value], ...]} with at most `threshold` points per field.
+    Missing values (a timed-out ping) count as 0 when picking points and
+    come back as None, so a chart shows them as a gap.
+    """
+    if not rows:
+        return {field: [] for field in fields}
+    data = np.asarray(rows, dtype=np.float64)  # None -> NaN
+    ts = data[:, 0].astype(np.int64)
+    values = data[:, 1:]
+    kept = lttb_indices(data[:, 0] - data[0, 0], np.nan_to_num(values), threshold)
+    return {
+        field: [[t, None if v != v else v] for t, v in zip(ts[kept[:, i]].tolist(), values[kept[:, i], i].tolist())]
+        for i, field in enumerate(fields)
+    }
+
+
+def merge_summaries(rows, threshold):
+    """
+    rows: (ts, n, min, max, mean, p95) agent-side summaries, oldest first.
+    Merges consecutive rows into at most `threshold` equal-time buckets:
+    total count, min of mins, max of maxes, count-weighted mean and the
+    largest p95 (an upper bound, percentiles do not merge exactly).
+    Returns [[ts, n, min, max, mean, p95], ...], ts of each bucket's first row.
+    """
+    if len(rows) <= threshold:
+        return [list(row) for row in rows]
+    data = np.asarray(rows, dtype=np.float64)
+    ts = data[:, 0]
+    span = ts[-1] - ts[0] + 1
+    bucket = ((ts - ts[0]) * threshold // span).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.add.reduceat(data[:, 1], starts)
+    merged = np.column_stack((
+        ts[starts],
+        counts,
+        np.minimum.reduceat(data[:, 2], starts),
+        np.maximum.reduceat(data[:, 3], starts),
+        np.add.reduceat(data[:, 1] * data[:, 4], starts) / counts,
+        np.maximum.reduceat(data[:, 5], starts),
+    ))
+    return [[int(row[0]), int(row[1]), *row[2:]] for row in merged.tolist()]
@@ -0,0 +1,103 @@
+"""
+Streaming bulk export of raw history, for offline capacity planning.
+
+    parts = export.encode(export.chunks(["host-a"], start_ms, end_ms), "csv", compress=True)
+
+chunks() pages through the history partitions SYSWATCH_EXPORT_CHUNK rows
+at a time and encode() turns each chunk into bytes (gzipped on the fly
+if asked) before the next one is read, so memory stays flat however
+many weeks or hosts an export covers. Both the /api/export/ endpoint
+and `manage.py export_history` are thin wrappers around these two.
+
+Formats:
+    csv      system_id,ts,cpu,ram,disk,ping header, one line per sample
+    ndjson   one {"system_id", "ts", "cpu", ...} object per line
+    columns  NDJSON with one {"system_id", "ts": [...], "cpu": [...], ...}
+             object per host per chunk, roughly half the size of ndjson
+
+Rows come out ordered by partition (day), then host, then ts.
+"""
+import csv
+import io
+import json
+import zlib
+from itertools import groupby
+
+from django.conf import settings
+
+from . import history
+from .models import SystemMetric
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "columns": ("application/x-ndjson", "ndjson"),
+}
+
+
+def chunks(system_ids, start_ms, end_ms, fields=history.HISTORY_FIELDS, size=None):
+    """
+    Yields lists of (system_id, ts, *fields) rows in [start_ms, end_ms).
+    `system_ids` None exports the whole fleet; unknown ids are skipped.
+    """
+    size = size or settings.SYSWATCH_EXPORT_CHUNK
+    if system_ids is None:
+        hosts = names = None
+    else:
+        names = dict(SystemMetric.objects.filter(system_id__in=system_ids).values_list("pk", "system_id"))
+        if not names:
+            return
+        hosts = sorted(names)
+
+    for rows in history.store.scan(start_ms, end_ms, hosts, fields, size):
+        if hosts is None:
+            # Whole fleet: resolve only the hosts in this chunk (rows are clustered by host)
+            names = dict(
+                SystemMetric.objects.filter(pk__in={row[0] for row in rows}).values_list("pk", "system_id")
+            )
+        yield [(names[row[0]], *row[1:]) for row in rows if row[0] in names]
+
+
+def encode(parts, fmt, fields=history.HISTORY_FIELDS, compress=False):
+    """Yields `fmt`-encoded bytes for each chunk of rows, gzipped if `compress`."""
+    encoder = {"csv": encode_csv, "ndjson": encode_ndjson, "columns": encode_columns}[fmt]
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits 31: gzip container
+    for text in encoder(parts, fields):
+        data = text.encode()
+        if compressor:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
+
+
+def encode_csv(parts, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(("system_id", "ts") + tuple(fields))
+    for rows in parts:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()  # header only, for an empty export
+
+
+def encode_ndjson(parts, fields):
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+    keys = ("system_id", "ts") + tuple(fields)
+    for rows in parts:
+        yield "".join(dumps(dict(zip(keys, row))) + "\n" for row in rows)
+
+
+def encode_columns(parts, fields):
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+    for rows in parts:
+        lines = []
+        for system_id, group in groupby(rows, key=lambda row: row[0]):
+            columns = list(zip(*group))
+            record = {"system_id": system_id, "ts": columns[1]}
+            record.update(zip(fields, columns[2:]))
+            lines.append(dumps(record) + "\n")
+        yield "".join(lines)
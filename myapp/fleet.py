@@ -0,0 +1,117 @@
+"""
+Fleet overview: the latest values of every host, sorted and paged.
+
+    rows, cursor = fleet.page("-cpu", 20)                # top 20 CPU
+    rows, cursor = fleet.page("-cpu", 20, after=cursor)  # the next 20
+
+SystemMetric has an index on (field, id) for every sortable field, so a
+page is one index range scan of about `limit` rows wherever it starts:
+no OFFSET, and no sort of the whole table per request. Pages are keyset
+paginated; the cursor is the (value, id) of the last row returned, so a
+host whose value changes between two requests can move across pages (a
+refresh starts over from the top). A null ping (probe timed out) sorts
+below every value: first ascending, last descending. Hosts with a null
+are fetched by a separate query rather than OR-ed into the range, which
+would make SQLite scan the table or sort it.
+
+Values come from the database, so with write-behind enabled they lag by
+up to one flush interval.
+"""
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import F, Q
+
+from .history import HISTORY_FIELDS
+from .models import SystemMetric
+
+SORTS = ("system_id", "updated_at", *HISTORY_FIELDS)
+COLUMNS = ("id", "system_id", "hostname", *HISTORY_FIELDS, "updated_at")
+
+
+def parse_sort(sort):
+    """"cpu" or "-cpu" (descending) to (field, descending). Raises ValueError."""
+    field = sort.lstrip("-")
+    if field not in SORTS or len(sort) - len(field) > 1:
+        raise ValueError(f"sort must be one of {list(SORTS)}, optionally prefixed with -")
+    return field, sort.startswith("-")
+
+
+def encode_cursor(field, row):
+    value = row[field]
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, row["id"]]).encode()).decode()
+
+
+def decode_cursor(field, cursor):
+    """The (value, id) of a cursor made by encode_cursor. Raises ValueError."""
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if field == "updated_at":
+            value = datetime.fromisoformat(value)
+        elif field != "system_id" and value is not None:
+            value = float(value)
+        return value, int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError("invalid cursor")
+
+
+def page(sort, limit, after=None, max_age=None):
+    """
+    Returns (rows, cursor): up to `limit` hosts as dicts of COLUMNS in
+    `sort` order, starting after the `after` cursor, and the cursor of
+    the next page (None on the last one). `max_age` (seconds) leaves out
+    hosts that have not reported for longer. Raises ValueError.
+    """
+    field, descending = parse_sort(sort)
+    hosts = SystemMetric.objects.all()
+    if max_age is not None:
+        hosts = hosts.filter(updated_at__gte=datetime.now(timezone.utc) - timedelta(seconds=max_age))
+    cursor = decode_cursor(field, after) if after else None
+    rows = []
+    for part in parts(hosts, field, descending, cursor):
+        rows.extend(part.values(*COLUMNS)[:limit + 1 - len(rows)])
+        if len(rows) > limit:
+            break
+    cursor = encode_cursor(field, rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], cursor
+
+
+def parts(hosts, field, descending, cursor):
+    """
+    Querysets that, one after the other, hold every host after `cursor`
+    in sort order, each one index range: the non-null values of `field`
+    and, for a nullable field, the nulls (ordered by id alone).
+    """
+    value, pk = cursor or (None, None)
+    after = "lt" if descending else "gt"
+    ids = "-id" if descending else "id"
+    values = hosts.order_by(F(field).desc() if descending else F(field).asc(), ids)
+    if value is not None:
+        # Bound on the indexed column first so the search starts at the
+        # cursor, then break ties on id
+        values = values.filter(**{f"{field}__{after}e": value}).filter(
+            Q(**{f"{field}__{after}": value}) | Q(**{f"id__{after}": pk}))
+    if not SystemMetric._meta.get_field(field).null:
+        return [values]
+
+    values = values.filter(**{f"{field}__isnull": False})
+    nulls = hosts.filter(**{f"{field}__isnull": True}).order_by(ids)
+    in_nulls = cursor is not None and value is None
+    if in_nulls:
+        nulls = nulls.filter(**{f"id__{after}": pk})
+    # Nulls come last descending, first ascending
+    if descending:
+        return [nulls] if in_nulls else [values, nulls]
+    return [values] if value is not None else [nulls, values]
+
+
+def counts(stale_after):
+    """{"hosts": n, "stale": n not updated for `stale_after` seconds}, both from indexes."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=stale_after)
+    return {
+        "hosts": SystemMetric.objects.count(),
+        "stale": SystemMetric.objects.filter(updated_at__lt=cutoff).count(),
+    }
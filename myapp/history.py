@@ -0,0 +1,146 @@
+"""
+Append-only metric history.
+
+Every sample accepted by receive_metrics is appended to the time-
+partitioned store in myapp/partitions.py (one SQLite file per day,
+outside the main database), along with the agent-side summary it may
+carry. Appends are buffered per process and written in batches, so a
+sample costs one list append plus a share of one multi-row INSERT. A
+background thread writes a partial batch once it is `max_delay` old, so
+quiet periods do not leave rows in memory, and exit flushes the rest.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from . import telemetry
+from .models import SystemMetric
+from .partitions import PartitionStore
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FIELDS = ("cpu", "ram", "disk", "ping")
+
+
+def now_ms():
+    """Current unix time in milliseconds (the history ts unit)."""
+    return int(time.time() * 1000)
+
+
+store = PartitionStore(
+    directory=settings.SYSWATCH_PARTITION_DIR,
+    span_seconds=settings.SYSWATCH_PARTITION_SECONDS,
+    retention_days=settings.SYSWATCH_HISTORY_RETENTION_DAYS,
+)
+atexit.register(store.close)
+
+
+def write(rows, summaries=()):
+    """
+    Stores (host_pk, ts, cpu, ram, disk, ping) rows, and summary rows from
+    summary_rows(), right away.
+    """
+    if rows or summaries:
+        with telemetry.span("history.write"):
+            store.write(rows, now_ms(), summaries)
+
+
+def summary_rows(host_pk, ts, summary):
+    """Partition rows for a sample's agent-side summary {metric: [n, min, max, mean, p95]}."""
+    return [(host_pk, HISTORY_FIELDS.index(metric), ts, *stats) for metric, stats in summary.items()]
+
+
+class HistoryBuffer:
+    """
+    Collects history rows and inserts them in batches.
+    A batch is written once it reaches `batch_size` rows or its oldest
+    row is older than `max_delay` seconds, whichever comes first; the
+    age check also runs on a timer, so it holds when appends stop.
+    """
+
+    def __init__(self, batch_size, max_delay):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._rows = []
+        self._summaries = []
+        self._first_at = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def append(self, host_pk, ts, cpu, ram, disk, ping, summaries=()):
+        with self._lock:
+            if not self._rows:
+                self._first_at = time.monotonic()
+            self._rows.append((host_pk, ts, cpu, ram, disk, ping))
+            self._summaries.extend(summaries)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="syswatch-history", daemon=True)
+                self._thread.start()
+            if (len(self._rows) < self.batch_size
+                    and time.monotonic() - self._first_at < self.max_delay):
+                return
+            rows, self._rows = self._rows, []
+            summaries, self._summaries = self._summaries, []
+        write(rows, summaries)
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+            summaries, self._summaries = self._summaries, []
+        write(rows, summaries)
+
+    def flush_due(self):
+        """Writes the buffered rows if the oldest is `max_delay` old."""
+        with self._lock:
+            due = self._rows and time.monotonic() - self._first_at >= self.max_delay
+        if due:
+            self.flush()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _run(self):
+        while True:
+            time.sleep(self.max_delay / 4)
+            try:
+                self.flush_due()
+            except Exception:
+                logger.exception("timed history flush failed")
+
+
+buffer = HistoryBuffer(
+    batch_size=settings.SYSWATCH_HISTORY_BATCH_SIZE,
+    max_delay=settings.SYSWATCH_HISTORY_MAX_DELAY,
+)
+atexit.register(buffer.flush)
+
+
+def append(host_pk, cpu, ram, disk, ping, ts=None, summary=None):
+    """Queue one sample (and its agent-side summary) for `host_pk` (a SystemMetric primary key)."""
+    ts = now_ms() if ts is None else ts
+    buffer.append(host_pk, ts, cpu, ram, disk, ping, summary_rows(host_pk, ts, summary) if summary else ())
+
+
+def samples_between(system_id, start_ms, end_ms, fields=HISTORY_FIELDS):
+    """
+    Yields (ts, *fields) tuples for one system in [start_ms, end_ms),
+    oldest first, reading only the partitions that overlap the window.
+    """
+    host_pk = SystemMetric.objects.filter(system_id=system_id).values_list("pk", flat=True).first()
+    if host_pk is None:
+        return iter(())
+    return store.read(host_pk, start_ms, end_ms, fields)
+
+
+def summaries_between(system_id, metric, start_ms, end_ms):
+    """
+    Yields (ts, n, min, max, mean, p95) agent-side summaries of one metric
+    for one system in [start_ms, end_ms), oldest first.
+    """
+    host_pk = SystemMetric.objects.filter(system_id=system_id).values_list("pk", flat=True).first()
+    if host_pk is None:
+        return iter(())
+    return store.read_summaries(host_pk, HISTORY_FIELDS.index(metric), start_ms, end_ms)
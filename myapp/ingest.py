@@ -0,0 +1,351 @@
+"""
+Sample validation and bulk persistence for the agent ingest endpoint.
+
+receive_metrics accepts either a single sample object or a JSON array of
+samples (e.g. from a relay forwarding many agents). Arrays are validated
+in one pass and written with two bulk statements: an upsert of the
+latest row per system_id (one transaction in the main database) and a
+multi-row insert into the history partitions.
+
+A sample may carry an optional "ext" object with extended host metrics
+(see parse_ext). Its fixed-size parts (load average, disk and network
+I/O rates) are columns of the SystemMetric row; the variable-length
+ones (per-core CPU, per-mount usage, top processes) go to HostDetail,
+which is only written when a sample brings them.
+
+Agents that sample faster than they send attach a "summary" of the
+readings since their previous sample (see parse_summary); the metric
+values of such a sample are the last readings, and the summaries are
+stored next to it in the history partitions.
+"""
+import math
+import zlib
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+from . import history
+from .history import HISTORY_FIELDS, now_ms
+from .models import HostDetail, SystemMetric
+
+Sample = namedtuple(
+    "Sample", ["system_id", "hostname", "ts", "cpu", "ram", "disk", "ping", "ext", "summary"],
+    defaults=(None, None),
+)
+
+LATEST_UPDATE_FIELDS = ["hostname", *HISTORY_FIELDS, "version", "updated_at"]
+EXTENDED_FIELDS = ["load1", "load5", "load15", "disk_read", "disk_write", "net_sent", "net_recv"]
+DETAIL_UPDATE_FIELDS = ["cores", "mounts", "processes", "updated_at"]
+
+# Upper bounds on the variable-length parts of "ext"
+MAX_CORES = 1024
+MAX_MOUNTS = 64
+MAX_PROCESSES = 50
+
+
+def decode_body(body, content_encoding):
+    """
+    Returns the raw request body, gunzipped if the agent sent
+    Content-Encoding: gzip. Raises ValueError on a corrupt stream or one
+    that inflates beyond SYSWATCH_INGEST_MAX_BODY bytes.
+    """
+    if not content_encoding or content_encoding == "identity":
+        return body
+    if content_encoding != "gzip":
+        raise ValueError(f"unsupported Content-Encoding {content_encoding}")
+
+    limit = settings.SYSWATCH_INGEST_MAX_BODY
+    inflater = zlib.decompressobj(wbits=31)  # gzip header + trailer
+    try:
+        data = inflater.decompress(body, limit)
+    except zlib.error:
+        raise ValueError("invalid gzip body")
+    if inflater.unconsumed_tail:
+        raise ValueError("decompressed body too large")
+    return data
+
+
+def parse_sample(data, default_ts):
+    """
+    Validates one decoded JSON sample and returns a Sample.
+    Raises ValueError with a short message if the sample is unusable.
+    Missing metrics default to 0, except that an explicit null ping
+    (the agent's probe timed out) stays None; `ts` (unix seconds) is
+    optional and bounded by bound_ts, with `default_ts` as the server time.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("sample must be a JSON object")
+
+    system_id = data.get("system_id")
+    if not isinstance(system_id, str) or not system_id or len(system_id) > 64:
+        raise ValueError("invalid system_id")
+
+    hostname = data.get("hostname") or ""
+    if not isinstance(hostname, str):
+        raise ValueError("invalid hostname")
+
+    values = []
+    for name in HISTORY_FIELDS:
+        if name == "ping" and "ping" in data and data["ping"] is None:
+            values.append(None)
+            continue
+        try:
+            value = float(data.get(name) or 0)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid {name}")
+        if not math.isfinite(value):
+            raise ValueError(f"invalid {name}")
+        values.append(value)
+
+    ts = data.get("ts")
+    if ts is None:
+        ts = default_ts
+    else:
+        try:
+            ts = int(float(ts) * 1000)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError("invalid ts")
+        ts = bound_ts(ts, default_ts)
+
+    ext = data.get("ext")
+    if ext is not None:
+        ext = parse_ext(ext)
+    summary = data.get("summary")
+    if summary is not None:
+        summary = parse_summary(summary)
+
+    return Sample(system_id, hostname[:128], ts, *values, ext, summary)
+
+
+def bound_ts(ts, now):
+    """
+    Checks a client timestamp (epoch ms) against the server clock `now`.
+    One more than SYSWATCH_INGEST_MAX_SKEW ahead is replaced by `now` (a
+    fast agent clock must not push a host's history into the future);
+    one older than the history retention raises ValueError.
+    """
+    if ts > now + settings.SYSWATCH_INGEST_MAX_SKEW * 1000:
+        return now
+    if ts < now - settings.SYSWATCH_HISTORY_RETENTION_DAYS * 86400 * 1000:
+        raise ValueError("ts older than the history retention")
+    return ts
+
+
+def parse_summary(data):
+    """
+    Validates an agent-side summary, {metric: [count, min, max, mean, p95]}
+    over the readings taken since the agent's previous sample. Returns it
+    with floats (count an int), or None if empty. Raises ValueError.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("invalid summary")
+    summary = {}
+    for metric, stats in data.items():
+        if metric not in HISTORY_FIELDS or not isinstance(stats, list) or len(stats) != 5:
+            raise ValueError("invalid summary")
+        try:
+            count, low, high, mean, p95 = int(stats[0]), *(float(v) for v in stats[1:])
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"invalid summary.{metric}")
+        if count < 1 or not all(math.isfinite(v) for v in (low, high, mean, p95)) or not low <= high:
+            raise ValueError(f"invalid summary.{metric}")
+        summary[metric] = [count, low, high, mean, p95]
+    return summary or None
+
+
+def finite_list(values, name, min_length, max_length):
+    if not isinstance(values, list) or not min_length <= len(values) <= max_length:
+        raise ValueError(f"invalid ext.{name}")
+    try:
+        values = [float(v) for v in values]
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid ext.{name}")
+    if not all(math.isfinite(v) for v in values):
+        raise ValueError(f"invalid ext.{name}")
+    return values
+
+
+def parse_ext(data):
+    """
+    Validates the extended host metrics of a sample, all keys optional:
+
+        load     [1 min, 5 min, 15 min] load average
+        disk_io  [read, write] bytes/s      net_io  [sent, received] bytes/s
+        cores    [percent per logical CPU]
+        mounts   {mountpoint: percent used}
+        procs    [[pid, name, cpu percent, rss bytes], ...] busiest first
+
+    Returns a dict with only these keys. Raises ValueError.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("invalid ext")
+    ext = {}
+    for key, length in (("load", 3), ("disk_io", 2), ("net_io", 2)):
+        if data.get(key) is not None:
+            ext[key] = finite_list(data[key], key, length, length)
+    if data.get("cores") is not None:
+        ext["cores"] = finite_list(data["cores"], "cores", 0, MAX_CORES)
+
+    mounts = data.get("mounts")
+    if mounts is not None:
+        if not isinstance(mounts, dict) or not all(isinstance(m, str) and len(m) <= 256 for m in mounts):
+            raise ValueError("invalid ext.mounts")
+        ext["mounts"] = dict(zip(mounts, finite_list(list(mounts.values()), "mounts", 0, MAX_MOUNTS)))
+
+    procs = data.get("procs")
+    if procs is not None:
+        if not isinstance(procs, list) or len(procs) > MAX_PROCESSES:
+            raise ValueError("invalid ext.procs")
+        ext["procs"] = []
+        for proc in procs:
+            if (not isinstance(proc, list) or len(proc) != 4
+                    or not isinstance(proc[0], int) or not isinstance(proc[1], str)):
+                raise ValueError("invalid ext.procs")
+            ext["procs"].append([proc[0], proc[1][:128], *finite_list(proc[2:], "procs", 2, 2)])
+    return ext
+
+
+def extended_columns(ext):
+    """SystemMetric column values for a parsed ext (None for parts not sent)."""
+    load = ext.get("load") or (None, None, None)
+    disk_io = ext.get("disk_io") or (None, None)
+    net_io = ext.get("net_io") or (None, None)
+    return dict(zip(EXTENDED_FIELDS, (*load, *disk_io, *net_io)))
+
+
+def parse_samples(items):
+    """
+    Validates a list of decoded samples in one pass.
+    Returns (samples, rejected) where rejected is a list of
+    {"index": i, "message": ...} entries for the caller to report.
+    """
+    default_ts = now_ms()
+    samples, rejected = [], []
+    for index, item in enumerate(items):
+        try:
+            samples.append(parse_sample(item, default_ts))
+        except ValueError as e:
+            rejected.append({"index": index, "message": str(e)})
+    return samples, rejected
+
+
+def latest_per_system(samples):
+    """Coalesces samples to the newest one per system_id."""
+    latest = {}
+    for sample in samples:
+        current = latest.get(sample.system_id)
+        if current is None or sample.ts >= current.ts:
+            latest[sample.system_id] = sample
+    return latest
+
+
+def latest_extended(samples):
+    """Newest ext payload per system_id, among samples that carry one."""
+    newest = {}
+    for sample in samples:
+        if sample.ext is None:
+            continue
+        current = newest.get(sample.system_id)
+        if current is None or sample.ts >= current.ts:
+            newest[sample.system_id] = sample
+    return {system_id: sample.ext for system_id, sample in newest.items()}
+
+
+def store_details(ext_by_pk):
+    """Upserts the variable-length ext parts, {SystemMetric pk: ext}."""
+    HostDetail.objects.bulk_create(
+        [
+            HostDetail(host_id=pk, cores=ext.get("cores", []), mounts=ext.get("mounts", {}),
+                       processes=ext.get("procs", []))
+            for pk, ext in ext_by_pk.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["host"],
+        update_fields=DETAIL_UPDATE_FIELDS,
+    )
+
+
+def newer_than_stored(latest):
+    """
+    Keeps the samples of {system_id: Sample} that are not older than the
+    version already in SystemMetric (a replayed spool must not roll the
+    latest values back). Call inside the writing transaction.
+    """
+    stored = dict(SystemMetric.objects.filter(system_id__in=list(latest)).values_list("system_id", "version"))
+    return {
+        system_id: sample for system_id, sample in latest.items()
+        if sample.ts >= stored.get(system_id, sample.ts)
+    }
+
+
+def store_latest(sample):
+    """
+    Upserts SystemMetric for one sample unless it holds newer values.
+    Returns (pk, written).
+    """
+    fields = {"hostname": sample.hostname, "cpu": sample.cpu, "ram": sample.ram,
+              "disk": sample.disk, "ping": sample.ping, "version": sample.ts}
+    if sample.ext is not None:
+        fields.update(extended_columns(sample.ext))
+    with transaction.atomic():
+        system, created = SystemMetric.objects.get_or_create(system_id=sample.system_id, defaults=fields)
+        if created:
+            return system.pk, True
+        if sample.ts < system.version:
+            return system.pk, False
+        for field, value in fields.items():
+            setattr(system, field, value)
+        system.save()
+    return system.pk, True
+
+
+def store_samples(samples):
+    """
+    Upserts the latest value per system in one transaction, then appends
+    every sample to history. Safe to retry: both writes are idempotent.
+    Systems whose stored values are newer than the batch keep them.
+    Returns the {system_id: Sample} map of latest values that was written.
+    """
+    latest = latest_per_system(samples)
+    if not latest:
+        return latest
+
+    with transaction.atomic():
+        written = newer_than_stored(latest)
+
+        # Systems that sent extended metrics also update those columns; the
+        # others keep what they had (most samples carry no ext)
+        extended = {
+            system_id: ext for system_id, ext in latest_extended(samples).items() if system_id in written
+        }
+        plain, rich = [], []
+        for s in written.values():
+            row = SystemMetric(system_id=s.system_id, hostname=s.hostname,
+                               cpu=s.cpu, ram=s.ram, disk=s.disk, ping=s.ping, version=s.ts)
+            ext = extended.get(s.system_id)
+            if ext is None:
+                plain.append(row)
+                continue
+            for field, value in extended_columns(ext).items():
+                setattr(row, field, value)
+            rich.append(row)
+
+        for rows, update_fields in ((plain, LATEST_UPDATE_FIELDS), (rich, LATEST_UPDATE_FIELDS + EXTENDED_FIELDS)):
+            if rows:
+                SystemMetric.objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=["system_id"],
+                    update_fields=update_fields,
+                )
+        host_pks = dict(
+            SystemMetric.objects.filter(system_id__in=list(latest)).values_list("system_id", "pk")
+        )
+        if extended:
+            store_details({host_pks[system_id]: ext for system_id, ext in extended.items()})
+    history.write(
+        [(host_pks[s.system_id], s.ts, s.cpu, s.ram, s.disk, s.ping) for s in samples],
+        [row for s in samples if s.summary for row in history.summary_rows(host_pks[s.system_id], s.ts, s.summary)],
+    )
+    return written
@@ -0,0 +1,87 @@
+"""
+In-process fan-out of live metric updates to Server-Sent Events streams.
+
+Each open dashboard stream subscribes to one system_id. When ingest
+accepts a sample, the view publishes the new snapshot here and every
+subscriber's event loop is woken with call_soon_threadsafe. Subscribers
+only keep the latest payload (a slow client skips intermediate samples
+rather than queueing them), so an idle connection costs one small object.
+
+Publishing works from any thread; streams must run under ASGI
+(sysproject.asgi) so thousands of idle connections share one event loop.
+
+The hub only reaches streams in the process that accepted the sample.
+With several workers, streams also poll the version in the shared store
+(myapp/shm.py) and catch up on samples another worker took; the hub is
+the fast path. Each subscription remembers the newest sample version it
+was offered so that poll does not resend it.
+"""
+import asyncio
+import threading
+
+
+class Subscription:
+    __slots__ = ("system_id", "loop", "latest", "version", "_event")
+
+    def __init__(self, system_id, loop):
+        self.system_id = system_id
+        self.loop = loop
+        self.latest = None
+        self.version = 0
+        self._event = asyncio.Event()
+
+    def offer(self, payload, version=None):
+        # Runs on the subscriber's loop
+        self.latest = payload
+        if version is not None:
+            self.version = max(self.version, version)
+        self._event.set()
+
+    async def next(self):
+        """Waits for the next payload published after the last call."""
+        await self._event.wait()
+        self._event.clear()
+        return self.latest
+
+
+class Hub:
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, system_id):
+        """Must be called from the event loop that will consume the subscription."""
+        sub = Subscription(system_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(system_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.system_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.system_id]
+
+    def watching(self, system_id):
+        """True if at least one stream is subscribed to system_id."""
+        return system_id in self._subscribers
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def publish(self, system_id, payload, version=None):
+        """`version` is the sample version (epoch ms) the payload shows, if it carries a new sample."""
+        with self._lock:
+            subs = tuple(self._subscribers.get(system_id, ()))
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.offer, payload, version)
+            except RuntimeError:
+                # Loop already closed; the stream's finally block will unsubscribe
+                pass
+
+
+hub = Hub()
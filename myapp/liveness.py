@@ -0,0 +1,245 @@
+"""
+Agent liveness: marks a host down when its samples stop coming.
+
+Ingest calls seen() with the systems of every accepted batch, which only
+moves each host's deadline (now + grace) in a dict, O(1) per sample. The
+deadlines are also kept in a min-heap with at most one entry per host.
+A sweep thread wakes every SYSWATCH_LIVENESS_INTERVAL seconds and pops
+the entries that are due. If the host reported since its entry was
+pushed, the entry is pushed back at the new deadline. Otherwise the host
+goes down. Each transition costs O(log n), and hosts that keep reporting
+cost one heap operation per grace period rather than one per sample.
+
+The grace is SYSWATCH_LIVENESS_MISSES times the interval the server
+currently asks of that agent (myapp/control.py), and at least
+SYSWATCH_LIVENESS_MIN_GRACE seconds. It is not shorter, so a sample
+delayed by a 429 or a retry does not flap the host.
+
+"Host down" and "host recovered" go through the same path as threshold
+alerts: an Alert row with metric "heartbeat" is opened when the host
+goes down and resolved when its next sample arrives.
+
+Like the alert engine, state lives in the ingesting process. With the
+shared store (myapp/shm.py) a sweep first checks whether another worker
+received a newer sample; without it, run a single ingest worker or hosts
+whose samples land on other workers look silent. The tracker starts with
+the server process (MyappConfig.ready, SYSWATCH_LIVENESS_AUTOSTART) and
+is seeded from SystemMetric.updated_at and the open heartbeat alerts, so
+hosts that died while the server was down are still noticed.
+"""
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from . import alerts, control, shm, telemetry
+from .history import now_ms
+from .models import Alert, SystemMetric
+
+logger = logging.getLogger(__name__)
+
+METRIC = "heartbeat"  # Alert.metric of liveness alerts
+
+
+class LivenessTracker:
+    def __init__(self, interval, misses, min_grace):
+        self.interval = interval
+        self.misses = misses
+        self.min_grace = min_grace
+        self.on_change = None  # called with a system_id after the sweep declares it down
+        self._deadline = {}  # system_id -> epoch ms its next sample is due by
+        self._last_seen = {}  # system_id -> (epoch ms received, sample ts)
+        self._heap = []  # (due, system_id), at most one live entry per host
+        self._queued = {}  # system_id -> due of its live heap entry
+        self._down = {}  # system_id -> epoch ms it was declared down
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def grace_ms(self, system_id):
+        """How long a host may stay silent before it is down."""
+        seconds = max(self.min_grace, self.misses * control.interval_for(system_id))
+        return int(seconds * 1000)
+
+    # ---- ingest ----
+    def seen(self, latest):
+        """
+        Records the newest accepted sample per system ({system_id: Sample})
+        and returns "recovered" transitions for hosts that were down.
+        """
+        now = now_ms()
+        recovered = []
+        with self._lock:
+            for system_id, sample in latest.items():
+                self._touch(system_id, now, sample.ts)
+                if self._down.pop(system_id, None) is not None:
+                    recovered.append((system_id, METRIC, alerts.OK, None, None, now))
+        self.start()
+        return recovered
+
+    def _touch(self, system_id, now, ts):
+        deadline = now + self.grace_ms(system_id)
+        self._deadline[system_id] = deadline
+        self._last_seen[system_id] = (now, ts)
+        # Push only when the host has no entry yet or its new deadline is
+        # earlier (the interval shrank); later deadlines are picked up when
+        # the current entry comes due
+        queued = self._queued.get(system_id)
+        if queued is None or deadline < queued:
+            self._queued[system_id] = deadline
+            heapq.heappush(self._heap, (deadline, system_id))
+
+    # ---- sweep ----
+    def sweep(self, now=None):
+        """Pops due deadlines; returns "down" transitions for hosts that missed them."""
+        now = now or now_ms()
+        down = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, system_id = heapq.heappop(self._heap)
+                if self._queued.get(system_id) != due:
+                    continue  # superseded by an earlier deadline
+                del self._queued[system_id]
+                if self._seen_elsewhere(system_id, now):
+                    continue
+                deadline = self._deadline[system_id]
+                if deadline > now:
+                    self._queued[system_id] = deadline
+                    heapq.heappush(self._heap, (deadline, system_id))
+                    continue
+                if system_id in self._down:
+                    continue
+                self._down[system_id] = now
+                received = self._last_seen[system_id][0]
+                grace = self.grace_ms(system_id)
+                down.append((system_id, METRIC, alerts.CRITICAL,
+                             round((now - received) / 1000, 1), round(grace / 1000, 1), now))
+        return down
+
+    def _seen_elsewhere(self, system_id, now):
+        """True (and the deadline moved) if another worker stored a newer sample."""
+        if not shm.enabled():
+            return False
+        record = shm.store.get(system_id)
+        last = self._last_seen.get(system_id)
+        if record is None or (last is not None and record.version <= last[1]):
+            return False
+        self._touch(system_id, now, record.version)
+        return True
+
+    def seed(self):
+        """
+        Loads deadlines from SystemMetric.updated_at and down hosts from open
+        alerts. Hosts that reported since the process started (seen() ran
+        first) keep their live state.
+        """
+        open_down = Alert.objects.filter(metric=METRIC, resolved_at__isnull=True)
+        rows = SystemMetric.objects.values_list("system_id", "updated_at")
+        with self._lock:
+            for system_id, started_at in open_down.values_list("system_id", "started_at"):
+                if system_id not in self._deadline:
+                    self._down.setdefault(system_id, int(started_at.timestamp() * 1000))
+            for system_id, updated_at in rows.iterator():
+                if system_id in self._deadline:
+                    continue
+                updated = int(updated_at.timestamp() * 1000)
+                self._last_seen[system_id] = (updated, updated)
+                self._deadline[system_id] = updated + self.grace_ms(system_id)
+                if system_id not in self._down:
+                    self._queued[system_id] = self._deadline[system_id]
+                    heapq.heappush(self._heap, (self._deadline[system_id], system_id))
+
+    # ---- reads ----
+    def is_down(self, system_id):
+        return system_id in self._down
+
+    def status(self, system_id):
+        """{"status": "up"|"down"|"unknown", "last_seen": epoch ms or None, "down_since": ...}"""
+        last = self._last_seen.get(system_id)
+        down_since = self._down.get(system_id)
+        if down_since is not None:
+            state = "down"
+        else:
+            state = "up" if last else "unknown"
+        return {"status": state, "last_seen": last[0] if last else None, "down_since": down_since}
+
+    def down_hosts(self, limit=None):
+        """[(system_id, down since ms, last seen ms)], longest down first."""
+        with self._lock:
+            hosts = sorted(self._down.items(), key=lambda item: item[1])[:limit]
+            return [(system_id, since, self._last_seen.get(system_id, (None,))[0]) for system_id, since in hosts]
+
+    def tracked(self):
+        return len(self._deadline)
+
+    def down_count(self):
+        return len(self._down)
+
+    # ---- thread ----
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="syswatch-liveness", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        try:
+            self.seed()
+        except DatabaseError:
+            logger.exception("seeding liveness from the database failed")
+        next_run = time.monotonic() + self.interval
+        while True:
+            time.sleep(max(0, next_run - time.monotonic()))
+            next_run += self.interval
+            # A server shedding load turns samples away; that is not the agents' fault
+            if control.overloaded():
+                continue
+            try:
+                with telemetry.span("liveness.sweep"):
+                    transitions = self.sweep()
+                record(transitions)
+                self.notify(transitions)
+            except Exception:
+                logger.exception("liveness sweep failed")
+
+    def notify(self, transitions):
+        """Tells on_change about hosts that went down (recoveries push a fresh sample anyway)."""
+        if self.on_change:
+            for system_id, *_ in transitions:
+                self.on_change(system_id)
+
+
+def record(transitions):
+    """
+    Persists liveness transitions as Alert rows through alerts.record.
+    A host already down in the database (e.g. declared by another worker)
+    does not get a second open alert.
+    """
+    if not transitions:
+        return
+    down = [t[0] for t in transitions if t[2] != alerts.OK]
+    if down:
+        try:
+            already = set(Alert.objects.filter(
+                system_id__in=down, metric=METRIC, resolved_at__isnull=True,
+            ).values_list("system_id", flat=True))
+        except DatabaseError:
+            logger.exception("checking open heartbeat alerts failed")
+            already = set()
+        transitions = [t for t in transitions if t[2] == alerts.OK or t[0] not in already]
+    alerts.record(transitions)
+
+
+tracker = LivenessTracker(
+    interval=settings.SYSWATCH_LIVENESS_INTERVAL,
+    misses=settings.SYSWATCH_LIVENESS_MISSES,
+    min_grace=settings.SYSWATCH_LIVENESS_MIN_GRACE,
+)
+
+
+def observe(latest):
+    """Ingest hook: latest accepted Sample per system."""
+    record(tracker.seen(latest))
@@ -0,0 +1,291 @@
+"""
+Capacity benchmark: simulated agent fleet + dashboard readers.
+
+    python manage.py bench --agents 5000 --readers 200 --duration 60
+
+Starts uvicorn on a throwaway SQLite database (or targets --url), runs
+the load generator and reader simulation from myapp/bench.py against it,
+then times ingest.store_samples batches directly for DB write cost.
+Results are printed and saved as JSON under benchmarks/ named after the
+git commit, and --compare prints the change against an earlier run.
+"""
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+import psutil
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from myapp import bench, history, ingest
+from myapp.ingest import Sample
+
+# Metrics shown by --compare, with whether higher is better
+COMPARED = [
+    ("ingest.ok_per_s", True),
+    ("ingest.p50_ms", False),
+    ("ingest.p99_ms", False),
+    ("read.ok_per_s", True),
+    ("read.p50_ms", False),
+    ("read.p99_ms", False),
+    ("db_write.us_per_sample", False),
+    ("server.bytes_per_host", False),
+]
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+    return out.stdout.strip() or "unknown"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def lookup(results, dotted):
+    for part in dotted.split("."):
+        results = (results or {}).get(part)
+    return results
+
+
+class Command(BaseCommand):
+    help = "Load-test ingest and dashboard reads; save results for comparison across commits."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", help="Benchmark a running server instead of starting one")
+        parser.add_argument("--agents", type=int, default=1000)
+        parser.add_argument("--readers", type=int, default=100, help="Simulated dashboard tabs")
+        parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+        parser.add_argument("--interval", type=float, default=5, help="Agent send interval (seconds)")
+        parser.add_argument("--read-interval", type=float, default=3, help="Dashboard poll interval (seconds)")
+        parser.add_argument("--jitter", type=float, default=0.1, help="Relative jitter of each agent's interval")
+        parser.add_argument("--binary", action="store_true", help="Agents send application/x-syswatch frames")
+        parser.add_argument("--connections", type=int, default=256, help="Client keep-alive connections")
+        parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when starting the server")
+        parser.add_argument("--db-batch", type=int, default=settings.SYSWATCH_FLUSH_MAX_PENDING,
+                            help="Samples per store_samples call in the DB write benchmark")
+        parser.add_argument("--output", default=str(Path(settings.BASE_DIR) / "benchmarks"))
+        parser.add_argument("--no-save", action="store_true")
+        parser.add_argument("--compare", help='Earlier result file to compare against, or "latest"')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix="syswatch-bench-")
+        try:
+            results = self.run(options, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.report(results)
+        baseline = self.find_baseline(options["compare"], options["output"]) if options["compare"] else None
+        if not options["no_save"]:
+            path = self.save(results, options["output"])
+            self.stdout.write(f"saved {path}")
+        if baseline:
+            self.compare(baseline, results)
+
+    # ---- phases ----
+    def run(self, options, workdir):
+        db_path = os.path.join(workdir, "bench.sqlite3")
+        self.use_database(db_path)
+
+        server = None
+        url = options["url"]
+        if not url:
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            server = self.start_server(port, db_path, workdir, options["workers"])
+
+        try:
+            rss_before = self.server_rss(server)
+            load = asyncio.run(bench.run_load(
+                url,
+                agents=options["agents"],
+                readers=options["readers"],
+                duration=options["duration"],
+                interval=options["interval"],
+                read_interval=options["read_interval"],
+                jitter=options["jitter"],
+                binary=options["binary"],
+                connections=options["connections"],
+            ))
+            rss_after = self.server_rss(server)
+        finally:
+            if server:
+                server.terminate()
+                server.wait(timeout=30)
+
+        results = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "cpus": os.cpu_count(),
+                "url": options["url"] or "local uvicorn",
+                "params": {
+                    k: options[k] for k in ("agents", "readers", "duration", "interval", "read_interval",
+                                            "jitter", "binary", "connections", "workers", "db_batch")
+                },
+            },
+            **load,
+            "server": None,
+            "db_write": self.bench_db_writes(options["agents"], options["db_batch"]),
+        }
+        if rss_before is not None:
+            results["server"] = {
+                "rss_before": rss_before,
+                "rss_after": rss_after,
+                "bytes_per_host": round((rss_after - rss_before) / max(1, options["agents"])),
+            }
+        return results
+
+    def use_database(self, path):
+        """Points this process at a fresh SQLite file and history directory."""
+        if settings.DATABASES["default"]["ENGINE"] != "django.db.backends.sqlite3":
+            raise CommandError("bench runs on a throwaway SQLite database")
+        connections["default"].close()
+        settings.DATABASES["default"]["NAME"] = path
+        connections["default"].settings_dict["NAME"] = path
+        history.store.close()
+        history.store.directory = self.history_dir(path)
+        call_command("migrate", verbosity=0)
+
+    @staticmethod
+    def history_dir(db_path):
+        return os.path.splitext(db_path)[0] + "-history"
+
+    def start_server(self, port, db_path, workdir, workers):
+        env = dict(
+            os.environ,
+            SQLITE_PATH=db_path,
+            SYSWATCH_PARTITION_DIR=self.history_dir(db_path),
+            SYSWATCH_SHM_PATH=os.path.join(workdir, "live.shm"),
+        )
+        command = [
+            sys.executable, "-m", "uvicorn", "sysproject.asgi:application",
+            "--port", str(port), "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+        ]
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"uvicorn exited with status {server.returncode}")
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/api/metrics/bench/hostname/", timeout=1).read()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError("uvicorn did not start within 30s")
+
+    @staticmethod
+    def server_rss(server):
+        """Resident memory of the server and its workers, or None for --url."""
+        if server is None:
+            return None
+        process = psutil.Process(server.pid)
+        return sum(p.memory_info().rss for p in [process, *process.children(recursive=True)])
+
+    def bench_db_writes(self, hosts, batch):
+        """
+        Times ingest.store_samples, the call the write-behind flusher makes,
+        on batches of `batch` samples spread over `hosts` systems.
+        """
+        system_ids = [f"bench-db-{i:06d}" for i in range(max(1, hosts))]
+        durations, written = [], 0
+        rounds = max(3, -(-2 * len(system_ids) // batch))  # insert pass, then updates
+        for r in range(rounds):
+            now = int(time.time() * 1000)
+            samples = [
+                Sample(system_ids[(r * batch + i) % len(system_ids)], "bench", now + i, 10.0, 20.0, 30.0, 4.0)
+                for i in range(batch)
+            ]
+            started = time.perf_counter()
+            ingest.store_samples(samples)
+            durations.append(time.perf_counter() - started)
+            written += batch
+        durations.sort()
+        return {
+            "batches": len(durations),
+            "batch_size": batch,
+            "p50_ms": round(durations[len(durations) // 2] * 1000, 2),
+            "max_ms": round(durations[-1] * 1000, 2),
+            "us_per_sample": round(sum(durations) / written * 1e6, 2),
+        }
+
+    # ---- output ----
+    def report(self, results):
+        params = results["meta"]["params"]
+        self.stdout.write(
+            f"{params['agents']} agents every {params['interval']}s, {params['readers']} readers every "
+            f"{params['read_interval']}s, {params['duration']}s @ {results['meta']['commit']}"
+        )
+        for kind in ("ingest", "read"):
+            r = results[kind]
+            self.stdout.write(
+                f"  {kind:<7} {r['ok_per_s']:>9} ok/s  p50 {r['p50_ms']} ms  p99 {r['p99_ms']} ms  "
+                f"max {r['max_ms']} ms  errors {r['errors']}  late {r['late']}  {r['statuses']}"
+            )
+        db = results["db_write"]
+        self.stdout.write(
+            f"  db      {db['batch_size']}-sample batch p50 {db['p50_ms']} ms, {db['us_per_sample']} us/sample"
+        )
+        if results["server"]:
+            server = results["server"]
+            self.stdout.write(
+                f"  memory  rss {server['rss_before'] // 2**20} -> {server['rss_after'] // 2**20} MiB, "
+                f"~{server['bytes_per_host']} bytes/host"
+            )
+
+    def save(self, results, output):
+        os.makedirs(output, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        path = os.path.join(output, f"{stamp}-{results['meta']['commit']}.json")
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        return path
+
+    def find_baseline(self, compare, output):
+        if compare == "latest":
+            files = sorted(Path(output).glob("*.json"))
+            if not files:
+                raise CommandError(f"no earlier results in {output}")
+            compare = files[-1]
+        try:
+            with open(compare) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"cannot read {compare}: {e}")
+
+    def compare(self, baseline, results):
+        self.stdout.write(f"vs {baseline['meta']['commit']} ({baseline['meta']['timestamp']}):")
+        for metric, higher_is_better in COMPARED:
+            old, new = lookup(baseline, metric), lookup(results, metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            worse = change < 0 if higher_is_better else change > 0
+            flag = "  REGRESSION" if worse and abs(change) >= 10 else ""
+            self.stdout.write(f"  {metric:<24} {old:>10} -> {new:<10} {change:+.1f}%{flag}")
@@ -0,0 +1,83 @@
+"""
+Bulk export of raw history to a file or stdout.
+
+    python manage.py export_history --start 2026-09-01 --format columns -o fleet.ndjson.gz
+    python manage.py export_history --host <system_id> --host <system_id> --days 7 > two-hosts.csv
+
+Same chunked reader and encoders as /api/export/ (myapp/export.py), so
+memory stays flat for any range. Output ending in .gz is gzipped.
+"""
+import sys
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp import export, history
+
+
+def parse_time(value):
+    """Unix seconds or an ISO 8601 date/datetime (UTC unless it has an offset), as epoch ms."""
+    try:
+        return int(float(value) * 1000)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"not a unix time or ISO 8601 date: {value}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+class Command(BaseCommand):
+    help = "Stream raw metric history for some hosts or the whole fleet as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", action="append", dest="hosts",
+                            help="system_id to export (repeatable; default: every host)")
+        parser.add_argument("--start", help="Unix seconds or ISO 8601 (default: --days before --end)")
+        parser.add_argument("--end", help="Unix seconds or ISO 8601 (default: now)")
+        parser.add_argument("--days", type=float, default=1, help="Range length when --start is omitted")
+        parser.add_argument("--metrics", default=",".join(history.HISTORY_FIELDS))
+        parser.add_argument("--format", choices=sorted(export.FORMATS), default="csv")
+        parser.add_argument("--gzip", action="store_true", help="Compress (implied by an -o ending in .gz)")
+        parser.add_argument("-o", "--output", default="-", help="File to write (default: stdout)")
+
+    def handle(self, *args, **options):
+        metrics = tuple(m for m in options["metrics"].split(",") if m)
+        if not metrics or set(metrics) - set(history.HISTORY_FIELDS):
+            raise CommandError(f"--metrics must be among {list(history.HISTORY_FIELDS)}")
+        end = parse_time(options["end"]) if options["end"] else history.now_ms()
+        start = parse_time(options["start"]) if options["start"] else end - int(options["days"] * 86400 * 1000)
+        if start >= end:
+            raise CommandError("--start must be before --end")
+        output = options["output"]
+        compress = options["gzip"] or output.endswith(".gz")
+
+        counted = {"rows": 0}
+
+        def counting(parts):
+            for rows in parts:
+                counted["rows"] += len(rows)
+                yield rows
+
+        started = time.monotonic()
+        parts = export.encode(
+            counting(export.chunks(options["hosts"], start, end, metrics)), options["format"], metrics, compress
+        )
+        out = sys.stdout.buffer if output == "-" else open(output, "wb")
+        try:
+            written = 0
+            for data in parts:
+                out.write(data)
+                written += len(data)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+            else:
+                out.flush()
+        self.stderr.write(
+            f"exported {counted['rows']} samples, {written} bytes in {time.monotonic() - started:.1f}s"
+        )
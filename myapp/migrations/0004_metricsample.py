@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_alter_systemmetric_ping'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ts', models.BigIntegerField()),
+                ('cpu', models.FloatField(default=0)),
+                ('ram', models.FloatField(default=0)),
+                ('disk', models.FloatField(default=0)),
+                ('ping', models.FloatField(default=0)),
+                ('host', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='samples', to='myapp.systemmetric')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['host', 'ts'], name='sample_host_ts_idx'), models.Index(fields=['ts'], name='sample_ts_idx')],
+            },
+        ),
+    ]
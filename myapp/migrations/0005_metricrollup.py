@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_metricsample'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('cpu_min', models.FloatField(default=0)),
+                ('cpu_max', models.FloatField(default=0)),
+                ('cpu_sum', models.FloatField(default=0)),
+                ('ram_min', models.FloatField(default=0)),
+                ('ram_max', models.FloatField(default=0)),
+                ('ram_sum', models.FloatField(default=0)),
+                ('disk_min', models.FloatField(default=0)),
+                ('disk_max', models.FloatField(default=0)),
+                ('disk_sum', models.FloatField(default=0)),
+                ('ping_min', models.FloatField(default=0)),
+                ('ping_max', models.FloatField(default=0)),
+                ('ping_sum', models.FloatField(default=0)),
+                ('sketches', models.BinaryField(default=b'')),
+                ('host', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='myapp.systemmetric')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('host', 'resolution', 'bucket'), name='rollup_host_res_bucket_uniq')],
+            },
+        ),
+    ]
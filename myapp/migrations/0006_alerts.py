@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_metricrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Alert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('system_id', models.CharField(max_length=64)),
+                ('metric', models.CharField(max_length=16)),
+                ('severity', models.CharField(max_length=8)),
+                ('value', models.FloatField()),
+                ('threshold', models.FloatField()),
+                ('started_at', models.DateTimeField()),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['system_id', 'metric', 'resolved_at'], name='alert_system_open_idx'), models.Index(fields=['started_at'], name='alert_started_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('system_id', models.CharField(max_length=64)),
+                ('metric', models.CharField(max_length=16)),
+                ('warning', models.FloatField(blank=True, null=True)),
+                ('critical', models.FloatField(blank=True, null=True)),
+                ('for_seconds', models.FloatField(blank=True, null=True)),
+                ('hysteresis', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('system_id', 'metric'), name='alertrule_system_metric_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,89 @@
+"""
+Moves raw history out of the main database into per-day partition files
+(the layout myapp/partitions.py used when this migration was written),
+then drops the MetricSample table. Rows older than
+SYSWATCH_HISTORY_RETENTION_DAYS are not carried over.
+
+The writer is frozen here on purpose: later changes to myapp.history or
+myapp.partitions must not change what this migration does on a fresh
+install. Only the partition directory, width and retention come from
+settings.
+"""
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations
+
+FILE_PREFIX = "samples-"
+FILE_SUFFIX = "Z.sqlite3"
+NAME_FORMAT = "%Y%m%dT%H%M"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    host INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    cpu REAL NOT NULL,
+    ram REAL NOT NULL,
+    disk REAL NOT NULL,
+    ping REAL NOT NULL,
+    PRIMARY KEY (host, ts)
+) WITHOUT ROWID
+"""
+BATCH = 10000
+
+
+def copy_history(apps, schema_editor):
+    MetricSample = apps.get_model("myapp", "MetricSample")
+    directory = str(settings.SYSWATCH_PARTITION_DIR)
+    span_ms = int(settings.SYSWATCH_PARTITION_SECONDS * 1000)
+    now = int(time.time() * 1000)
+    cutoff = (now - int(settings.SYSWATCH_HISTORY_RETENTION_DAYS * 86400 * 1000)) // span_ms
+    current = now // span_ms
+    connections = {}
+
+    def connection(key):
+        conn = connections.get(key)
+        if conn is None:
+            os.makedirs(directory, exist_ok=True)
+            start = datetime.fromtimestamp(key * span_ms / 1000, tz=timezone.utc)
+            conn = sqlite3.connect(os.path.join(directory, f"{FILE_PREFIX}{start:{NAME_FORMAT}}{FILE_SUFFIX}"))
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            connections[key] = conn
+        return conn
+
+    def write(batch):
+        by_key = {}
+        for row in batch:
+            by_key.setdefault(row[1] // span_ms, []).append(row)
+        for key, rows in by_key.items():
+            if cutoff <= key <= current + 1:
+                with connection(key) as conn:
+                    conn.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    rows = MetricSample.objects.values_list("host_id", "ts", "cpu", "ram", "disk", "ping").order_by("pk")
+    batch = []
+    try:
+        for row in rows.iterator(chunk_size=BATCH):
+            batch.append(row)
+            if len(batch) >= BATCH:
+                write(batch)
+                batch = []
+        write(batch)
+    finally:
+        for conn in connections.values():
+            conn.close()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0006_alerts"),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_history, migrations.RunPython.noop),
+        migrations.DeleteModel(name="MetricSample"),
+    ]
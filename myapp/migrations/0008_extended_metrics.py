@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_move_history_to_partitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostDetail',
+            fields=[
+                ('host', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='detail', serialize=False, to='myapp.systemmetric')),
+                ('cores', models.JSONField(default=list)),
+                ('mounts', models.JSONField(default=dict)),
+                ('processes', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='systemmetric',
+            name='disk_read',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemmetric',
+            name='disk_write',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemmetric',
+            name='load1',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemmetric',
+            name='load15',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemmetric',
+            name='load5',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemmetric',
+            name='net_recv',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='systemmetric',
+            name='net_sent',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
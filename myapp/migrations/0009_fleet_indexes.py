@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_extended_metrics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='systemmetric',
+            index=models.Index(fields=['cpu', 'id'], name='systemmetric_cpu_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemmetric',
+            index=models.Index(fields=['ram', 'id'], name='systemmetric_ram_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemmetric',
+            index=models.Index(fields=['disk', 'id'], name='systemmetric_disk_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemmetric',
+            index=models.Index(fields=['ping', 'id'], name='systemmetric_ping_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemmetric',
+            index=models.Index(fields=['updated_at', 'id'], name='systemmetric_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_fleet_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='systemmetric',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
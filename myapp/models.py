@@ -7,8 +7,125 @@ class SystemMetric(models.Model):
     cpu = models.FloatField(default=0)
     ram = models.FloatField(default=0)
     disk = models.FloatField(default=0)
-    ping = models.FloatField(default=0) 
+    ping = models.FloatField(default=0, null=True)  # null: the agent's probe timed out
+    # Extended metrics (null until the agent reports them); rates in bytes/s
+    load1 = models.FloatField(null=True, blank=True)
+    load5 = models.FloatField(null=True, blank=True)
+    load15 = models.FloatField(null=True, blank=True)
+    disk_read = models.FloatField(null=True, blank=True)
+    disk_write = models.FloatField(null=True, blank=True)
+    net_sent = models.FloatField(null=True, blank=True)
+    net_recv = models.FloatField(null=True, blank=True)
+    # Sample time (epoch ms) of these values; older samples never overwrite them
+    version = models.BigIntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Fleet overview (myapp/fleet.py): sorted, keyset-paginated pages
+            # and top-N per metric; updated_at also finds stale hosts
+            models.Index(fields=["cpu", "id"], name="systemmetric_cpu_idx"),
+            models.Index(fields=["ram", "id"], name="systemmetric_ram_idx"),
+            models.Index(fields=["disk", "id"], name="systemmetric_disk_idx"),
+            models.Index(fields=["ping", "id"], name="systemmetric_ping_idx"),
+            models.Index(fields=["updated_at", "id"], name="systemmetric_updated_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.hostname or 'Unknown'} ({self.system_id})"
+
+
+class HostDetail(models.Model):
+    """
+    Variable-length parts of a host's latest extended sample: per-core CPU,
+    per-mount disk usage and the top processes. Kept out of SystemMetric,
+    which is rewritten by every sample, and only updated when an agent
+    sends extended metrics (see myapp/ingest.py).
+    """
+    host = models.OneToOneField(SystemMetric, on_delete=models.CASCADE, primary_key=True, related_name="detail")
+    cores = models.JSONField(default=list)  # [percent, ...] per logical CPU
+    mounts = models.JSONField(default=dict)  # {mountpoint: percent used}
+    processes = models.JSONField(default=list)  # [[pid, name, cpu percent, rss bytes], ...]
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class MetricRollup(models.Model):
+    """
+    Pre-aggregated samples for one system and time bucket, kept at several
+    resolutions (see myapp/rollups.py). Holds count plus min/max/sum per
+    metric and a mergeable quantile sketch per metric, so long ranges and
+    percentiles can be answered without reading raw history partitions.
+    """
+    RESOLUTIONS = (60, 3600, 86400)  # bucket widths in seconds: 1 min, 1 h, 1 d
+
+    host = models.ForeignKey(SystemMetric, on_delete=models.CASCADE, related_name="rollups", db_index=False)
+    resolution = models.PositiveIntegerField()  # bucket width, seconds
+    bucket = models.BigIntegerField()  # bucket start, unix epoch milliseconds
+    count = models.PositiveIntegerField(default=0)
+    cpu_min = models.FloatField(default=0)
+    cpu_max = models.FloatField(default=0)
+    cpu_sum = models.FloatField(default=0)
+    ram_min = models.FloatField(default=0)
+    ram_max = models.FloatField(default=0)
+    ram_sum = models.FloatField(default=0)
+    disk_min = models.FloatField(default=0)
+    disk_max = models.FloatField(default=0)
+    disk_sum = models.FloatField(default=0)
+    ping_min = models.FloatField(default=0)
+    ping_max = models.FloatField(default=0)
+    ping_sum = models.FloatField(default=0)
+    sketches = models.BinaryField(default=b"")  # serialized DDSketch per metric, cpu/ram/disk/ping
+
+    class Meta:
+        constraints = [
+            # Also the index for per-host range queries at one resolution
+            models.UniqueConstraint(fields=["host", "resolution", "bucket"], name="rollup_host_res_bucket_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.host_id} {self.resolution}s @ {self.bucket}"
+
+
+class AlertRule(models.Model):
+    """
+    Per-host override of the default alert thresholds for one metric
+    (see myapp/alerts.py). Empty fields inherit SYSWATCH_ALERT_THRESHOLDS.
+    """
+    system_id = models.CharField(max_length=64)
+    metric = models.CharField(max_length=16)
+    warning = models.FloatField(null=True, blank=True)
+    critical = models.FloatField(null=True, blank=True)
+    for_seconds = models.FloatField(null=True, blank=True)
+    hysteresis = models.FloatField(null=True, blank=True)  # fraction of the threshold, e.g. 0.05
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["system_id", "metric"], name="alertrule_system_metric_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.system_id} {self.metric}"
+
+
+class Alert(models.Model):
+    """
+    One firing period of an alert. Opened when a (system_id, metric)
+    reaches warning/critical, resolved when it clears or changes level.
+    """
+    system_id = models.CharField(max_length=64)
+    metric = models.CharField(max_length=16)
+    severity = models.CharField(max_length=8)  # "warning" or "critical"
+    value = models.FloatField()  # value that triggered it
+    threshold = models.FloatField()
+    started_at = models.DateTimeField()
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Open alerts for a system (resolved_at IS NULL) and its alert history
+            models.Index(fields=["system_id", "metric", "resolved_at"], name="alert_system_open_idx"),
+            models.Index(fields=["started_at"], name="alert_started_idx"),
+        ]
+
     def __str__(self):
-        return f"{self.hostname or 'Unknown'} ({self.system_id})"
\ No newline at end of file
+        return f"{self.severity} {self.system_id} {self.metric}"
@@ -0,0 +1,295 @@
+"""
+Time-partitioned sample storage in separate SQLite files.
+
+Raw history is kept out of the main database: every partition (one day
+by default, SYSWATCH_PARTITION_SECONDS) is its own WAL-mode SQLite file
+in SYSWATCH_PARTITION_DIR, named after the UTC start of its window:
+
+    samples-20261016T0000Z.sqlite3
+        samples(host, ts, cpu, ram, disk, ping), PRIMARY KEY (host, ts), WITHOUT ROWID
+            ping is NULL for samples whose probe timed out
+        summaries(host, metric, ts, n, min, max, mean, p95), PRIMARY KEY (host, metric, ts)
+
+`summaries` holds agent-side aggregates of fast sampling (count, min,
+max, mean, p95 of one metric since the previous sample), for agents
+that send them; `metric` is the column's index in cpu, ram, disk, ping.
+
+Rows are clustered by (host, ts), so a host's range is one contiguous
+read, and a resent sample (agent spool replay) replaces itself instead
+of duplicating. Heavy ingest only locks the current partition file, never
+the main database the dashboards read from.
+
+Retention drops whole files older than SYSWATCH_HISTORY_RETENTION_DAYS
+(checked whenever the wall clock enters a new partition), so it costs an
+unlink, not a DELETE scan. Range reads open, read-only, only the
+partitions that overlap the window; bulk scans (exports) page through
+them in keyset chunks.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+FILE_PREFIX = "samples-"
+FILE_SUFFIX = "Z.sqlite3"
+NAME_FORMAT = "%Y%m%dT%H%M"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    host INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    cpu REAL NOT NULL,
+    ram REAL NOT NULL,
+    disk REAL NOT NULL,
+    ping REAL,
+    PRIMARY KEY (host, ts)
+) WITHOUT ROWID
+"""
+# Files written before ping became nullable; rebuilt the first time they are written to
+LEGACY_REBUILD = (
+    "BEGIN IMMEDIATE",
+    "ALTER TABLE samples RENAME TO samples_legacy",
+    SCHEMA,
+    "INSERT INTO samples SELECT * FROM samples_legacy",
+    "DROP TABLE samples_legacy",
+)
+SUMMARY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    host INTEGER NOT NULL,
+    metric INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    mean REAL NOT NULL,
+    p95 REAL NOT NULL,
+    PRIMARY KEY (host, metric, ts)
+) WITHOUT ROWID
+"""
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",  # durable at checkpoints; a crash may lose the last commits only
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",  # KiB
+)
+COLUMNS = ("ts", "cpu", "ram", "disk", "ping")
+
+
+class PartitionStore:
+    def __init__(self, directory, span_seconds, retention_days):
+        self.directory = str(directory)
+        self.span_ms = int(span_seconds * 1000)
+        self.retention_ms = int(retention_days * 86400 * 1000)
+        self._writers = {}  # partition key -> sqlite3 connection
+        self._current = None  # partition key of "now" at the last write
+        self._lock = threading.Lock()
+
+    # ---- naming ----
+    def key(self, ts):
+        return ts // self.span_ms
+
+    def path(self, key):
+        start = datetime.fromtimestamp(key * self.span_ms / 1000, tz=timezone.utc)
+        return os.path.join(self.directory, f"{FILE_PREFIX}{start:{NAME_FORMAT}}{FILE_SUFFIX}")
+
+    def partitions(self):
+        """[(key, path)] of partition files on disk, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        found = []
+        for name in names:
+            if not (name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX)):
+                continue
+            try:
+                start = datetime.strptime(name[len(FILE_PREFIX):-len(FILE_SUFFIX)], NAME_FORMAT)
+            except ValueError:
+                continue
+            ms = int(start.replace(tzinfo=timezone.utc).timestamp() * 1000)
+            found.append((self.key(ms), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    # ---- writes ----
+    def write(self, rows, now_ms, summaries=()):
+        """
+        Stores (host_pk, ts, cpu, ram, disk, ping) rows and (host_pk, metric,
+        ts, n, min, max, mean, p95) summaries, one transaction per partition
+        touched. Rows outside [retention cutoff, next partition] relative to
+        `now_ms` are dropped rather than creating stray files.
+        """
+        current = self.key(now_ms)
+        by_key = {}
+        for row in rows:
+            by_key.setdefault(self.key(row[1]), ([], []))[0].append(row)
+        for row in summaries:
+            by_key.setdefault(self.key(row[2]), ([], []))[1].append(row)
+        with self._lock:
+            if current != self._current:
+                self._current = current
+                self._expire(now_ms)
+            cutoff = self.key(now_ms - self.retention_ms)
+            for key, (part, summary_part) in by_key.items():
+                if not cutoff <= key <= current + 1:
+                    continue
+                conn = self._writer(key)
+                with conn:
+                    if part:
+                        conn.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?)", part)
+                    if summary_part:
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", summary_part)
+
+    def _writer(self, key):
+        conn = self._writers.get(key)
+        if conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(self.path(key), timeout=30, check_same_thread=False)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            conn.execute(SCHEMA)
+            conn.execute(SUMMARY_SCHEMA)
+            if any(name == "ping" and notnull for _, name, _, notnull, _, _ in
+                   conn.execute("PRAGMA table_info(samples)")):
+                with conn:
+                    for statement in LEGACY_REBUILD:
+                        conn.execute(statement)
+            self._writers[key] = conn
+        return conn
+
+    # ---- retention ----
+    def _expire(self, now_ms):
+        """Closes writers for past partitions and unlinks expired files."""
+        current = self.key(now_ms)
+        for key in [k for k in self._writers if k < current - 1]:
+            self._writers.pop(key).close()
+        cutoff = self.key(now_ms - self.retention_ms)
+        dropped = 0
+        for key, path in self.partitions():
+            if key >= cutoff:
+                break
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+            dropped += 1
+        if dropped:
+            logger.info("dropped %d expired history partitions", dropped)
+        return dropped
+
+    def expire(self, now_ms):
+        """Drops partitions past retention as of `now_ms`; returns how many."""
+        with self._lock:
+            return self._expire(now_ms)
+
+    # ---- reads ----
+    def read(self, host, start_ms, end_ms, fields=COLUMNS[1:]):
+        """
+        Yields (ts, *fields) for one host in [start_ms, end_ms), oldest
+        first, opening only the partitions that overlap the window.
+        """
+        columns = self._columns(fields)
+        for path in self._overlapping(start_ms, end_ms):
+            conn = self._reader(path)
+            if conn is None:
+                continue
+            try:
+                with telemetry.span("history.read"):
+                    rows = conn.execute(
+                        f"SELECT {columns} FROM samples WHERE host = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                        (host, start_ms, end_ms),
+                    ).fetchall()
+            finally:
+                conn.close()
+            yield from rows
+
+    def read_summaries(self, host, metric, start_ms, end_ms):
+        """
+        Yields (ts, n, min, max, mean, p95) summaries of one metric index for
+        one host in [start_ms, end_ms), oldest first.
+        """
+        for path in self._overlapping(start_ms, end_ms):
+            conn = self._reader(path)
+            if conn is None:
+                continue
+            try:
+                with telemetry.span("history.read"):
+                    rows = conn.execute(
+                        "SELECT ts, n, min, max, mean, p95 FROM summaries"
+                        " WHERE host = ? AND metric = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                        (host, metric, start_ms, end_ms),
+                    ).fetchall()
+            except sqlite3.OperationalError:
+                rows = []  # partition written before summaries existed
+            finally:
+                conn.close()
+            yield from rows
+
+    def scan(self, start_ms, end_ms, hosts=None, fields=COLUMNS[1:], size=5000):
+        """
+        Yields lists of at most `size` (host, ts, *fields) rows in
+        [start_ms, end_ms) for the `hosts` pks (None: every host), ordered
+        by partition, then host, then ts. Every chunk is its own keyset
+        query resuming after the previous chunk's last (host, ts), so no
+        read transaction stays open while the caller handles a chunk.
+        """
+        columns = self._columns(fields)
+        if hosts is None:
+            query = (f"SELECT host, {columns} FROM samples WHERE (host, ts) > (?, ?) AND ts >= ? AND ts < ? "
+                     "ORDER BY host, ts LIMIT ?")
+        else:
+            query = (f"SELECT host, {columns} FROM samples WHERE host = ? AND ts > ? AND ts < ? "
+                     "ORDER BY ts LIMIT ?")
+        for path in self._overlapping(start_ms, end_ms):
+            conn = self._reader(path)
+            if conn is None:
+                continue
+            try:
+                if hosts is None:
+                    after = (0, start_ms)
+                    while after is not None:
+                        with telemetry.span("history.scan"):
+                            rows = conn.execute(query, (*after, start_ms, end_ms, size)).fetchall()
+                        after = rows[-1][:2] if len(rows) == size else None
+                        if rows:
+                            yield rows
+                    continue
+                for host in hosts:
+                    after = start_ms - 1
+                    while after is not None:
+                        with telemetry.span("history.scan"):
+                            rows = conn.execute(query, (host, after, end_ms, size)).fetchall()
+                        after = rows[-1][1] if len(rows) == size else None
+                        if rows:
+                            yield rows
+            finally:
+                conn.close()
+
+    def _overlapping(self, start_ms, end_ms):
+        first, last = self.key(start_ms), self.key(max(start_ms, end_ms - 1))
+        return [path for key, path in self.partitions() if first <= key <= last]
+
+    @staticmethod
+    def _columns(fields):
+        return ", ".join(("ts",) + tuple(f for f in fields if f in COLUMNS[1:]))
+
+    @staticmethod
+    def _reader(path):
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+        except sqlite3.OperationalError:
+            return None  # dropped between the check and the open
+        conn.execute("PRAGMA query_only=1")
+        return conn
+
+    def close(self):
+        with self._lock:
+            for conn in self._writers.values():
+                conn.close()
+            self._writers.clear()
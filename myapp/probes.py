@@ -0,0 +1,200 @@
+"""
+In-process network latency probes.
+
+Measures round-trip time without forking /bin/ping:
+
+- "host:port" targets are timed with a TCP connect. A refused connection
+  still counts, since the RST proves the host answered.
+- bare "host" targets use an ICMP echo when the process may open an ICMP
+  socket (unprivileged datagram ICMP on Linux/macOS, or raw as root), and
+  otherwise fall back to a TCP connect on port 443.
+
+Every probe has a hard timeout and reports it as status "timeout" instead
+of a silent 0. The server never probes inside a request: a single
+background Prober refreshes all targets concurrently on a fixed interval
+and views read its cached results.
+"""
+import itertools
+import logging
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ProbeResult = namedtuple("ProbeResult", ["target", "method", "rtt_ms", "status", "checked_at"])
+
+FALLBACK_TCP_PORT = 443
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+_icmp_sequence = itertools.count(1)
+
+
+def parse_target(target):
+    """Splits "host:port", "[v6]:port" or "host" into (host, port or None)."""
+    if target.startswith("["):
+        host, _, rest = target[1:].partition("]")
+        return host, int(rest[1:]) if rest.startswith(":") else None
+    if target.count(":") == 1:
+        host, port = target.split(":")
+        return host, int(port)
+    return target, None
+
+
+# ---------------- TCP ----------------
+def tcp_rtt(host, port, timeout):
+    """Milliseconds to complete (or be refused) a TCP handshake."""
+    started = time.perf_counter()
+    try:
+        sock = socket.create_connection((host, port), timeout=timeout)
+    except ConnectionRefusedError:
+        pass
+    else:
+        sock.close()
+    return (time.perf_counter() - started) * 1000
+
+
+# ---------------- ICMP ----------------
+def _checksum(data):
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def open_icmp_socket():
+    """Returns (socket, is_raw), or None if the process may not send ICMP."""
+    for kind in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        try:
+            return socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP), kind == socket.SOCK_RAW
+        except (PermissionError, OSError):
+            continue
+    return None
+
+
+def icmp_permitted():
+    opened = open_icmp_socket()
+    if opened is None:
+        return False
+    opened[0].close()
+    return True
+
+
+def icmp_rtt(host, timeout):
+    """Milliseconds for one ICMP echo round trip. Raises TimeoutError."""
+    opened = open_icmp_socket()
+    if opened is None:
+        raise PermissionError("ICMP sockets not permitted")
+    sock, is_raw = opened
+    with sock:
+        address = socket.gethostbyname(host)
+        ident = os.getpid() & 0xFFFF
+        sequence = next(_icmp_sequence) & 0xFFFF
+        payload = b"syswatch"
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, sequence)
+        checksum = _checksum(header + payload)
+        packet = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, ident, sequence) + payload
+
+        started = time.perf_counter()
+        deadline = started + timeout
+        sock.sendto(packet, (address, 0))
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not select.select([sock], [], [], remaining)[0]:
+                raise TimeoutError
+            data, (source, _) = sock.recvfrom(1024)
+            view = memoryview(data)
+            if is_raw:
+                view = view[(view[0] & 0x0F) * 4:]  # skip the IP header
+            if len(view) < 8 or source != address:
+                continue
+            kind, _, _, _, reply_sequence = struct.unpack_from("!BBHHH", view)
+            if kind == ICMP_ECHO_REPLY and reply_sequence == sequence:
+                return (time.perf_counter() - started) * 1000
+
+
+# ---------------- Probing ----------------
+def probe(target, timeout, use_icmp):
+    """Probes one target and always returns a ProbeResult."""
+    host, port = parse_target(target)
+    method = "tcp" if port is not None or not use_icmp else "icmp"
+    try:
+        if method == "icmp":
+            rtt = icmp_rtt(host, timeout)
+        else:
+            rtt = tcp_rtt(host, port or FALLBACK_TCP_PORT, timeout)
+    except (TimeoutError, socket.timeout):
+        return ProbeResult(target, method, None, "timeout", time.time())
+    except OSError as e:
+        return ProbeResult(target, method, None, f"error: {e.strerror or e}", time.time())
+    return ProbeResult(target, method, round(rtt, 2), "ok", time.time())
+
+
+class Prober:
+    """
+    Background thread that probes every target concurrently each
+    `interval` seconds and keeps the latest result per target.
+    """
+
+    def __init__(self, targets, interval, timeout):
+        self.targets = list(targets)
+        self.interval = interval
+        self.timeout = timeout
+        self._results = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pool = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._pool = ThreadPoolExecutor(max_workers=max(1, len(self.targets)), thread_name_prefix="syswatch-probe")
+            self._thread = threading.Thread(target=self._run, name="syswatch-prober", daemon=True)
+            self._thread.start()
+
+    def probe_all(self):
+        use_icmp = icmp_permitted()
+        futures = [self._pool.submit(probe, t, self.timeout, use_icmp) for t in self.targets]
+        results = {f.result().target: f.result() for f in futures}
+        with self._lock:
+            self._results = results
+        return results
+
+    def results(self):
+        """Latest ProbeResult per target, in configured order (empty until the first round)."""
+        with self._lock:
+            results = self._results
+        return [results[t] for t in self.targets if t in results]
+
+    def best_rtt(self):
+        """Lowest successful RTT in ms, or None if every target failed or none ran yet."""
+        rtts = [r.rtt_ms for r in self.results() if r.rtt_ms is not None]
+        return min(rtts) if rtts else None
+
+    def _run(self):
+        next_run = time.monotonic()
+        while True:
+            try:
+                self.probe_all()
+            except Exception:
+                logger.exception("latency probe round failed")
+            next_run += self.interval
+            time.sleep(max(0, next_run - time.monotonic()))
+
+
+prober = Prober(
+    targets=settings.SYSWATCH_PROBE_TARGETS,
+    interval=settings.SYSWATCH_PROBE_INTERVAL,
+    timeout=settings.SYSWATCH_PROBE_TIMEOUT,
+)
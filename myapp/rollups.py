@@ -0,0 +1,311 @@
+"""
+Multi-resolution rollups of accepted samples.
+
+Every sample accepted by receive_metrics is folded into in-memory
+Aggregates for its 1 min, 1 h and 1 d buckets (O(1) per sample). A
+background thread merges the pending aggregates into MetricRollup rows
+every SYSWATCH_ROLLUP_FLUSH_INTERVAL seconds. Aggregates (count, min,
+max, sum, DDSketch) are mergeable, so partial results from several
+worker processes and several flushes combine into the same row exactly.
+
+Raw history overwrites a resent sample (same host and ts), but an
+aggregate cannot take one out again, so the engine skips samples that
+are not newer than the last one folded for their host: an agent replaying
+its spool after a lost reply is counted once.
+
+query() answers a time range from the coarsest resolution that still
+gives the requested number of points, so a 30 day chart reads ~720
+hourly rows instead of ~500k raw samples.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+
+from . import telemetry
+from .history import HISTORY_FIELDS
+from .models import MetricRollup, SystemMetric
+from .sketch import DDSketch
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = MetricRollup.RESOLUTIONS
+AGGREGATE_FIELDS = ["count", "sketches"] + [
+    f"{metric}_{kind}" for metric in HISTORY_FIELDS for kind in ("min", "max", "sum")
+]
+
+
+class Aggregate:
+    """count/min/max/sum and a sketch for each of the four metrics."""
+    __slots__ = ("count", "mins", "maxs", "sums", "sketches")
+
+    def __init__(self):
+        self.count = 0
+        self.mins = [float("inf")] * len(HISTORY_FIELDS)
+        self.maxs = [float("-inf")] * len(HISTORY_FIELDS)
+        self.sums = [0.0] * len(HISTORY_FIELDS)
+        self.sketches = [DDSketch() for _ in HISTORY_FIELDS]
+
+    def add(self, values, lows=None, highs=None):
+        """
+        One sample; `lows`/`highs` are the extremes an agent-side summary
+        saw around it. A None value (timed-out ping) is left out of that
+        metric's stats; its sketch count is the metric's own count.
+        """
+        self.count += 1
+        lows = lows or values
+        highs = highs or values
+        for i, value in enumerate(values):
+            if value is None:
+                continue
+            if lows[i] < self.mins[i]:
+                self.mins[i] = lows[i]
+            if highs[i] > self.maxs[i]:
+                self.maxs[i] = highs[i]
+            self.sums[i] += value
+            self.sketches[i].add(value)
+
+    def merge(self, other):
+        self.count += other.count
+        for i in range(len(HISTORY_FIELDS)):
+            self.mins[i] = min(self.mins[i], other.mins[i])
+            self.maxs[i] = max(self.maxs[i], other.maxs[i])
+            self.sums[i] += other.sums[i]
+            self.sketches[i].merge(other.sketches[i])
+        return self
+
+    @classmethod
+    def from_row(cls, row):
+        agg = cls()
+        agg.count = row.count
+        data = bytes(row.sketches)
+        offset = 0
+        for i, metric in enumerate(HISTORY_FIELDS):
+            agg.mins[i] = getattr(row, f"{metric}_min")
+            agg.maxs[i] = getattr(row, f"{metric}_max")
+            agg.sums[i] = getattr(row, f"{metric}_sum")
+            if offset < len(data):
+                agg.sketches[i], offset = DDSketch.from_bytes(data, offset)
+        return agg
+
+    def apply_to(self, row):
+        row.count = self.count
+        for i, metric in enumerate(HISTORY_FIELDS):
+            setattr(row, f"{metric}_min", self.mins[i])
+            setattr(row, f"{metric}_max", self.maxs[i])
+            setattr(row, f"{metric}_sum", self.sums[i])
+        row.sketches = b"".join(sketch.to_bytes() for sketch in self.sketches)
+        return row
+
+
+def sample_values(sample):
+    """
+    (values, lows, highs) to fold into an Aggregate. Metrics with an
+    agent-side summary count with their mean and its min/max, so spikes
+    between two samples still reach the rollup max.
+    """
+    values = (sample.cpu, sample.ram, sample.disk, sample.ping)
+    if not sample.summary:
+        return values, None, None
+    values, lows, highs = list(values), list(values), list(values)
+    for i, metric in enumerate(HISTORY_FIELDS):
+        stats = sample.summary.get(metric)
+        if stats:
+            _, lows[i], highs[i], values[i], _ = stats
+    return values, lows, highs
+
+
+def bucket_start(ts, resolution):
+    width = resolution * 1000
+    return ts - ts % width
+
+
+class RollupEngine:
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = {}  # (system_id, resolution, bucket) -> Aggregate
+        self._last = {}  # system_id -> ts of the newest sample folded in
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, samples, floors=None):
+        """
+        Folds accepted ingest.Samples into their pending buckets, skipping
+        any not newer than the last sample folded for that host by this
+        process or, per `floors` ({system_id: ts}), by another worker.
+        """
+        floors = floors or {}
+        with self._lock:
+            last = self._last
+            for sample in samples:
+                floor = max(last.get(sample.system_id, -1), floors.get(sample.system_id, -1))
+                if sample.ts <= floor:
+                    continue
+                last[sample.system_id] = sample.ts
+                values, lows, highs = sample_values(sample)
+                for resolution in RESOLUTIONS:
+                    key = (sample.system_id, resolution, bucket_start(sample.ts, resolution))
+                    agg = self._pending.get(key)
+                    if agg is None:
+                        agg = self._pending[key] = Aggregate()
+                    agg.add(values, lows, highs)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="syswatch-rollups", daemon=True)
+                self._thread.start()
+
+    def depth(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Merges pending aggregates into MetricRollup rows."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            for attempt in range(2):
+                try:
+                    with telemetry.span("rollups.flush"):
+                        return self._write(pending)
+                except IntegrityError:
+                    # Another process created one of our rows first; re-read and merge
+                    if attempt:
+                        raise
+        except DatabaseError:
+            logger.exception("rollup flush of %d buckets failed", len(pending))
+            self._requeue(pending)
+            return 0
+
+    def _write(self, pending):
+        host_pks = dict(
+            SystemMetric.objects
+            .filter(system_id__in={key[0] for key in pending})
+            .values_list("system_id", "pk")
+        )
+        # Hosts not in SystemMetric yet (write-behind still pending) wait for the next flush
+        waiting = {key: agg for key, agg in pending.items() if key[0] not in host_pks}
+        ready = {(host_pks[s], r, b): agg for (s, r, b), agg in pending.items() if s in host_pks}
+
+        with transaction.atomic():
+            existing = {}
+            for resolution in RESOLUTIONS:
+                buckets = {b for (_, r, b) in ready if r == resolution}
+                if not buckets:
+                    continue
+                rows = MetricRollup.objects.filter(
+                    host_id__in={h for (h, r, _) in ready if r == resolution},
+                    resolution=resolution,
+                    bucket__in=buckets,
+                )
+                existing.update({(row.host_id, row.resolution, row.bucket): row for row in rows})
+
+            to_update, to_create = [], []
+            for key, agg in ready.items():
+                row = existing.get(key)
+                if row is not None:
+                    to_update.append(Aggregate.from_row(row).merge(agg).apply_to(row))
+                else:
+                    host_id, resolution, bucket = key
+                    to_create.append(agg.apply_to(MetricRollup(host_id=host_id, resolution=resolution, bucket=bucket)))
+            if to_update:
+                MetricRollup.objects.bulk_update(to_update, AGGREGATE_FIELDS, batch_size=500)
+            if to_create:
+                MetricRollup.objects.bulk_create(to_create, batch_size=500)
+
+        self._requeue(waiting)
+        return len(ready)
+
+    def _requeue(self, pending):
+        with self._lock:
+            for key, agg in pending.items():
+                current = self._pending.get(key)
+                self._pending[key] = agg if current is None else agg.merge(current)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            close_old_connections()
+            self.flush()
+
+
+engine = RollupEngine(interval=settings.SYSWATCH_ROLLUP_FLUSH_INTERVAL)
+atexit.register(engine.flush)
+
+
+# ---------------- Queries ----------------
+def pick_resolution(start_ms, end_ms, points):
+    """
+    Coarsest resolution that still yields at least `points` buckets over
+    [start_ms, end_ms), or the finest one if none does.
+    """
+    span = max(0, end_ms - start_ms)
+    for resolution in reversed(RESOLUTIONS):
+        if span // (resolution * 1000) >= points:
+            return resolution
+    return RESOLUTIONS[0]
+
+
+def fetch(system_id, start_ms, end_ms, resolution):
+    """(bucket start, Aggregate) pairs for one system at one resolution, oldest first."""
+    rows = (
+        MetricRollup.objects
+        .filter(host__system_id=system_id, resolution=resolution,
+                bucket__gte=bucket_start(start_ms, resolution), bucket__lt=end_ms)
+        .order_by("bucket")
+    )
+    return [(row.bucket, Aggregate.from_row(row)) for row in rows]
+
+
+def summarize(agg, i, quantiles):
+    """min/max/mean and the requested quantiles of one metric in an Aggregate."""
+    if not agg.count or agg.mins[i] > agg.maxs[i]:
+        return None  # no readings of this metric (every ping timed out)
+    # Rows written before sketches existed have no per-metric count
+    count = agg.sketches[i].count or agg.count
+    stats = {
+        "min": agg.mins[i],
+        "max": agg.maxs[i],
+        "mean": agg.sums[i] / count,
+    }
+    for q in quantiles:
+        stats[f"p{q * 100:g}"] = agg.sketches[i].quantile(q)
+    return stats
+
+
+def means(system_id, start_ms, end_ms, resolution, metrics):
+    """
+    (bucket start, mean of each of `metrics` or None) rows, oldest first:
+    the same shape as history.samples_between, for charting wide ranges.
+    """
+    columns = [HISTORY_FIELDS.index(metric) for metric in metrics]
+    rows = []
+    for ts, agg in fetch(system_id, start_ms, end_ms, resolution):
+        stats = [summarize(agg, i, ()) for i in columns]
+        rows.append((ts, *(None if stat is None else stat["mean"] for stat in stats)))
+    return rows
+
+
+def query(system_id, start_ms, end_ms, points=500, resolution=None, quantiles=(0.5, 0.95, 0.99)):
+    """
+    Returns (resolution, buckets, summary) for one system in [start_ms, end_ms).
+    Each bucket is {"ts", "count", <metric>: {"min", "max", "mean", "p50", ...}};
+    summary has the same per-metric stats over the whole range, merged
+    from the bucket sketches.
+    """
+    resolution = resolution or pick_resolution(start_ms, end_ms, points)
+    total = Aggregate()
+    buckets = []
+    for ts, agg in fetch(system_id, start_ms, end_ms, resolution):
+        bucket = {"ts": ts, "count": agg.count}
+        for i, metric in enumerate(HISTORY_FIELDS):
+            bucket[metric] = summarize(agg, i, quantiles)
+        buckets.append(bucket)
+        total.merge(agg)
+
+    summary = {"count": total.count}
+    for i, metric in enumerate(HISTORY_FIELDS):
+        summary[metric] = summarize(total, i, quantiles)
+    return resolution, buckets, summary
@@ -0,0 +1,86 @@
+"""
+Background sampler for the server's own host metrics.
+
+The /api/metrics/cpu|ram|disk|ping/ endpoints used to call psutil inside
+the request (cpu_percent(interval=0.5) held a worker for half a second).
+Instead, one daemon thread per process samples the host every
+SYSWATCH_HOST_SAMPLE_INTERVAL seconds into a fixed-size ring buffer and
+the views only read the newest entry, or the whole ring for ?history=1.
+Ping comes from the latency prober's cached result.
+"""
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+import psutil
+from django.conf import settings
+
+from . import probes
+
+logger = logging.getLogger(__name__)
+
+HostSample = namedtuple("HostSample", ["ts", "cpu", "ram", "disk", "ping"])
+
+
+class HostSampler:
+    def __init__(self, interval, history):
+        self.interval = interval
+        self._ring = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ready = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            probes.prober.start()
+            # Baseline for the non-blocking cpu_percent(interval=None) deltas
+            psutil.cpu_percent(interval=None)
+            self._thread = threading.Thread(target=self._run, name="syswatch-host-sampler", daemon=True)
+            self._thread.start()
+
+    def sample(self):
+        """Takes one sample now and appends it to the ring."""
+        entry = HostSample(
+            ts=time.time(),
+            cpu=psutil.cpu_percent(interval=None),
+            ram=psutil.virtual_memory().percent,
+            disk=psutil.disk_usage("/").percent,
+            ping=probes.prober.best_rtt(),  # None: every probe timed out
+        )
+        self._ring.append(entry)
+        self._ready.set()
+        return entry
+
+    def latest(self, wait=None):
+        """
+        Newest HostSample, starting the sampler on first use. `wait` bounds
+        how long the very first call may block for the first sample.
+        """
+        self.start()
+        if wait:
+            self._ready.wait(wait)
+        return self._ring[-1] if self._ring else None
+
+    def history(self):
+        """Every HostSample in the ring, oldest first."""
+        return list(self._ring)
+
+    def _run(self):
+        # Give cpu_percent a short window before the first sample
+        next_run = time.monotonic() + min(self.interval, 0.5)
+        while True:
+            time.sleep(max(0, next_run - time.monotonic()))
+            try:
+                self.sample()
+            except Exception:
+                logger.exception("host sample failed")
+            next_run += self.interval
+
+
+sampler = HostSampler(
+    interval=settings.SYSWATCH_HOST_SAMPLE_INTERVAL,
+    history=settings.SYSWATCH_HOST_HISTORY,
+)
@@ -0,0 +1,240 @@
+"""
+Shared-memory live metrics store.
+
+A fixed-size, mmap-backed hash table that every worker process on the
+host maps from the same file, so a dashboard read served by one worker
+sees the sample another worker just accepted, without a database query
+or a network service.
+
+Layout: a 64-byte header followed by SYSWATCH_SHM_SLOTS slots of 256
+bytes. Each slot is
+
+    seq (u64) | system_id (64s) | hostname (128s) | cpu ram disk ping (4 x f64) | version (i64)
+    | watched until (i64)
+
+Slots are found by open addressing (crc32 of system_id, linear probing)
+and are never freed, so a system_id keeps its slot for the life of the
+file. `seq` makes each slot a seqlock: writers bump it to odd, write, and
+bump it back to even; readers retry until they see the same even value
+before and after copying the slot. Writers serialize per slot with a
+byte-range fcntl lock (plus a thread lock, since fcntl locks are
+per process). `watched until` sits outside the seqlocked body: it is
+the epoch ms until which some worker has a dashboard stream open for the
+system, refreshed by that stream and written as a single 8-byte store.
+"""
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+from django.conf import settings
+
+from .cache import LiveRecord
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SWSHM1\0\0"
+HEADER = struct.Struct("<8sQQ")  # magic, slot count, slot size
+HEADER_SIZE = 64
+SEQ = struct.Struct("<Q")
+BODY = struct.Struct("<64s128s4dq")
+WATCH = struct.Struct("<q")
+WATCH_OFFSET = SEQ.size + BODY.size
+SLOT_SIZE = 256
+KEY_SIZE = 64
+MAX_PROBE = 64
+MAX_READ_RETRIES = 1000
+NAN = float("nan")  # stored for a missing (timed-out) ping
+
+assert WATCH_OFFSET + WATCH.size <= SLOT_SIZE
+
+
+def default_path():
+    """One store per database, in /dev/shm when the host has it."""
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    tag = zlib.crc32(str(settings.DATABASES["default"]["NAME"]).encode())
+    return os.path.join(base, f"syswatch-{tag:08x}.live")
+
+
+class SharedStore:
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self._mm = None
+        self._fd = None
+        self._failed = False
+        self._open_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Setup
+    # ------------------------------------------------------------------
+    def _map(self):
+        """Maps the store file on first use (after any worker fork)."""
+        if self._mm is not None or self._failed:
+            return self._mm
+        with self._open_lock:
+            if self._mm is not None or self._failed:
+                return self._mm
+            try:
+                self._mm, self._fd = self._open()
+            except (OSError, ValueError) as e:
+                logger.warning("shared live store disabled (%s): %s", self.path, e)
+                self._failed = True
+        return self._mm
+
+    def _open(self):
+        size = HEADER_SIZE + self.slots * SLOT_SIZE
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl:
+                fcntl.lockf(fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            mm = mmap.mmap(fd, size)
+            magic, slots, slot_size = HEADER.unpack_from(mm, 0)
+            if magic == b"\0" * 8:
+                HEADER.pack_into(mm, 0, MAGIC, self.slots, SLOT_SIZE)
+            elif (magic, slots, slot_size) != (MAGIC, self.slots, SLOT_SIZE):
+                mm.close()
+                raise ValueError("existing file has a different layout; remove it to resize")
+            if fcntl:
+                fcntl.lockf(fd, fcntl.LOCK_UN, HEADER_SIZE, 0)
+        except BaseException:
+            os.close(fd)
+            raise
+        return mm, fd
+
+    # ------------------------------------------------------------------
+    # Slot access
+    # ------------------------------------------------------------------
+    def _offsets(self, key):
+        start = zlib.crc32(key) % self.slots
+        for i in range(min(MAX_PROBE, self.slots)):
+            yield HEADER_SIZE + ((start + i) % self.slots) * SLOT_SIZE
+
+    def _read(self, mm, offset):
+        """Consistent copy of one slot body (seqlock read)."""
+        for attempt in range(MAX_READ_RETRIES):
+            if attempt >= 64:
+                time.sleep(0)  # let a preempted writer finish
+            before = SEQ.unpack_from(mm, offset)[0]
+            if before & 1:
+                continue
+            body = BODY.unpack_from(mm, offset + SEQ.size)
+            if SEQ.unpack_from(mm, offset)[0] == before:
+                return before, body
+        # A writer died mid-update; serve what is there rather than spin forever
+        return SEQ.unpack_from(mm, offset)[0] & ~1, BODY.unpack_from(mm, offset + SEQ.size)
+
+    def _lock_slot(self, offset):
+        self._write_lock.acquire()
+        if fcntl:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT_SIZE, offset)
+
+    def _unlock_slot(self, offset):
+        if fcntl:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, SLOT_SIZE, offset)
+        self._write_lock.release()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def get(self, system_id):
+        """Returns the live values for system_id as a cache.LiveRecord, or None."""
+        mm = self._map()
+        key = system_id.encode()
+        if mm is None or len(key) > KEY_SIZE:
+            return None
+        for offset in self._offsets(key):
+            seq, (slot_key, hostname, cpu, ram, disk, ping, version) = self._read(mm, offset)
+            if seq == 0:
+                return None  # never-written slot ends the probe chain
+            if slot_key.rstrip(b"\0") == key:
+                return LiveRecord(
+                    hostname.rstrip(b"\0").decode(errors="ignore"),
+                    cpu, ram, disk, None if ping != ping else ping, version,
+                )
+        return None
+
+    def _find(self, mm, key):
+        """Offset of the slot holding key, or None."""
+        for offset in self._offsets(key):
+            seq, body = self._read(mm, offset)
+            if seq == 0:
+                return None
+            if body[0].rstrip(b"\0") == key:
+                return offset
+        return None
+
+    def mark_watched(self, system_id, until_ms):
+        """Records that a dashboard streams system_id until until_ms. Needs a stored sample."""
+        mm = self._map()
+        key = system_id.encode()
+        if mm is None or len(key) > KEY_SIZE:
+            return False
+        offset = self._find(mm, key)
+        if offset is None:
+            return False
+        WATCH.pack_into(mm, offset + WATCH_OFFSET, until_ms)
+        return True
+
+    def watched_until(self, system_id):
+        """Epoch ms until which some worker streams system_id (0 if none)."""
+        mm = self._map()
+        key = system_id.encode()
+        if mm is None or len(key) > KEY_SIZE:
+            return 0
+        offset = self._find(mm, key)
+        return 0 if offset is None else WATCH.unpack_from(mm, offset + WATCH_OFFSET)[0]
+
+    def put(self, system_id, hostname, cpu, ram, disk, ping, version):
+        """
+        Stores the latest values for system_id, unless the slot holds a
+        newer version (that counts as stored). Returns False if the store
+        is unavailable, the id does not fit, or no slot is free.
+        """
+        mm = self._map()
+        key = system_id.encode()
+        if mm is None or len(key) > KEY_SIZE:
+            return False
+        host = (hostname or "").encode()[:128]
+        for offset in self._offsets(key):
+            seq, body = self._read(mm, offset)
+            if seq and body[0].rstrip(b"\0") != key:
+                continue
+            self._lock_slot(offset)
+            try:
+                seq = SEQ.unpack_from(mm, offset)[0] & ~1
+                slot = BODY.unpack_from(mm, offset + SEQ.size)
+                if seq and slot[0].rstrip(b"\0") != key:
+                    continue  # another writer claimed it first
+                if seq and slot[-1] > version:
+                    return True  # an older sample (replay) must not roll it back
+                SEQ.pack_into(mm, offset, seq + 1)
+                BODY.pack_into(mm, offset + SEQ.size, key, host, cpu, ram, disk,
+                               NAN if ping is None else ping, version)
+                SEQ.pack_into(mm, offset, seq + 2)
+                return True
+            finally:
+                self._unlock_slot(offset)
+        return False
+
+
+store = SharedStore(
+    path=settings.SYSWATCH_SHM_PATH or default_path(),
+    slots=settings.SYSWATCH_SHM_SLOTS,
+)
+
+
+def enabled():
+    return settings.SYSWATCH_SHARED_STORE
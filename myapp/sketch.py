@@ -0,0 +1,81 @@
+"""
+Mergeable quantile sketch (DDSketch-style).
+
+Values are counted in logarithmic bins: bin i covers
+(gamma^(i-1), gamma^i] with gamma = (1 + a) / (1 - a), so any quantile
+read back is within relative error `a` (RELATIVE_ACCURACY) of the true
+sample value. Values <= 0 go to a separate zero bin. Two sketches merge
+by adding bin counts, which is what lets 1 min rollups combine into
+1 h/1 d ones, and partial aggregates from several worker processes
+combine into one row, without keeping raw samples.
+
+Serialized form (little-endian): zero count (u32) | bin count (u16) |
+bins as (index i16, count u32) pairs.
+"""
+import math
+import struct
+
+RELATIVE_ACCURACY = 0.02
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+MIN_VALUE = 1e-3  # anything smaller is counted in the zero bin
+
+HEADER = struct.Struct("<IH")
+BIN = struct.Struct("<hI")
+
+
+class DDSketch:
+    __slots__ = ("bins", "zero_count", "count")
+
+    def __init__(self):
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value, weight=1):
+        if value <= MIN_VALUE:
+            self.zero_count += weight
+        else:
+            index = math.ceil(math.log(value) / LOG_GAMMA)
+            self.bins[index] = self.bins.get(index, 0) + weight
+        self.count += weight
+
+    def merge(self, other):
+        for index, weight in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + weight
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        """Estimated q-quantile (0 <= q <= 1), or None if empty."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                # Midpoint of the bin in relative terms
+                return 2 * GAMMA ** index / (GAMMA + 1)
+        return 2 * GAMMA ** max(self.bins) / (GAMMA + 1)
+
+    def to_bytes(self):
+        parts = [HEADER.pack(self.zero_count, len(self.bins))]
+        parts.extend(BIN.pack(index, weight) for index, weight in self.bins.items())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data, offset=0):
+        """Returns (sketch, offset just past it)."""
+        sketch = cls()
+        sketch.zero_count, length = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        for _ in range(length):
+            index, weight = BIN.unpack_from(data, offset)
+            offset += BIN.size
+            sketch.bins[index] = weight
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch, offset
@@ -1,16 +1,10 @@
 // SysWatch Dashboard - Main JavaScript File 
 
 // Configuration
-const MAX_DATA_POINTS = 20;
-const UPDATE_INTERVAL = 3000; // 3 seconds
-
-// Thresholds for alerts
-const THRESHOLDS = {
-    cpu: { warning: 70, critical: 80 },
-    ram: { warning: 75, critical: 85 },
-    disk: { warning: 80, critical: 90 },
-    ping: { warning: 100, critical: 150 }
-};
+const MAX_DATA_POINTS = 500; // per chart; history is downsampled server-side to this many
+const HISTORY_WINDOW = 3600; // seconds of history loaded into the charts on page load
+const UPDATE_INTERVAL = 3000; // 3 seconds (polling fallback when the live stream is unavailable)
+const STREAM_TIMEOUT = 5000; // poll if the live stream has not opened by then
 
 // Extract client ID from URL: /view/<client_id>
 const CLIENT_ID = (window.location.pathname.split("/view/")[1] || "demo-client").replace("/", "");
@@ -20,8 +14,10 @@ console.log("Detected CLIENT_ID:", CLIENT_ID);
 const BASE_URL = `${window.location.origin}/api/metrics/${CLIENT_ID}`;
 console.log("BASE_URL for fetching metrics:", BASE_URL);
 
-// Data storage
-let metricsData = { cpu: [], ram: [], disk: [], ping: [] };
+// Data storage (each chart keeps its own labels: downsampled history keeps different points per metric).
+// `peaks` holds the max of agent-side summaries (pre-aggregation mode), null where there is none.
+const METRICS = ['cpu', 'ram', 'disk', 'ping'];
+let metricsData = Object.fromEntries(METRICS.map(metric => [metric, { labels: [], values: [], peaks: [] }]));
 
 // Chart instances
 let charts = {};
@@ -37,53 +33,33 @@ const COLORS = {
 // Initialize charts when page loads
 document.addEventListener("DOMContentLoaded", async function () {
     initializeCharts();
-    await fetchHostname();
     startMonitoring();
 });
 
-// Fetch hostname
-async function fetchHostname() {
-    const hostElem = document.getElementById("hostname");
-    if (!hostElem) return;
-
-    // Step 1: Use Django-rendered hostname if available
-    if (hostElem.textContent && hostElem.textContent.trim() !== "") {
-        console.log("Initial hostname from template:", hostElem.textContent);
-    }
-
-    // Step 2: Fetch latest hostname from API
-    const url = `${BASE_URL}/hostname/`;
-    console.log("Fetching hostname from:", url);
+// ETag of the last snapshot we rendered (sent back as If-None-Match)
+let lastEtag = null;
 
-    try {
-        const response = await fetch(url, { cache: "no-cache" });
-        if (!response.ok) throw new Error(`HTTP ${response.status}`);
-        const data = await response.json();
-
-        if (data.hostname && data.hostname !== "Unknown") {
-            hostElem.textContent = data.hostname;
-            console.log("Updated hostname from API:", data.hostname);
-        }
-    } catch (err) {
-        console.error("Error fetching hostname:", err);
-        if (!hostElem.textContent || hostElem.textContent === "Unknown Host") {
-            hostElem.textContent = "Waiting for agent connection...";
-        }
-    }
+// Fetch all metrics + hostname in one request.
+// Returns null when the server answers 304 (nothing new since lastEtag).
+async function fetchSnapshot() {
+    const url = `${BASE_URL}/snapshot/`;
+    const headers = lastEtag ? { "If-None-Match": lastEtag } : {};
+    const response = await fetch(url, { cache: "no-store", headers });
+    if (response.status === 304) return null;
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    lastEtag = response.headers.get("ETag");
+    return response.json();
 }
 
-// Fetch a single metric
-async function fetchMetricData(metric) {
-    const url = `${BASE_URL}/${metric}/`;
-    try {
-        const response = await fetch(url, { cache: "no-cache" });
-        if (!response.ok) throw new Error(`HTTP ${response.status}`);
-        const data = await response.json();
-        console.log(`Metric fetched - ${metric}:`, data.value);
-        return data.value ?? 0;
-    } catch (error) {
-        console.error(`Error fetching ${metric}:`, error);
-        return 0;
+// Update hostname heading from a snapshot
+function updateHostname(hostname) {
+    const hostElem = document.getElementById("hostname");
+    if (!hostElem) return;
+
+    if (hostname && hostname !== "Unknown") {
+        hostElem.textContent = hostname;
+    } else if (!hostElem.textContent || hostElem.textContent === "Unknown Host") {
+        hostElem.textContent = "Waiting for agent connection...";
     }
 }
 
@@ -114,6 +90,16 @@ function initializeCharts() {
                     tension: 0.4,
                     pointRadius: 0,
                     pointHoverRadius: 4
+                }, {
+                    label: 'PEAK',
+                    data: [],
+                    borderColor: config.color.border,
+                    borderWidth: 1,
+                    borderDash: [4, 3],
+                    fill: false,
+                    tension: 0.4,
+                    pointRadius: 0,
+                    pointHoverRadius: 3
                 }]
             },
             options: {
@@ -132,7 +118,7 @@ function initializeCharts() {
                         padding: 12,
                         displayColors: false,
                         callbacks: {
-                            label: ctx => ctx.parsed.y.toFixed(1) + config.unit
+                            label: ctx => (ctx.datasetIndex ? 'peak ' : '') + ctx.parsed.y.toFixed(1) + config.unit
                         }
                     }
                 },
@@ -157,82 +143,173 @@ function initializeCharts() {
     });
 }
 
-// Update chart with new data
-function updateChart(metric, value) {
+// Redraw one chart from metricsData
+function drawChart(metric) {
     const chart = charts[metric];
     const data = metricsData[metric];
-    data.push(value);
-    if (data.length > MAX_DATA_POINTS) data.shift();
-
-    const labels = data.map((_, i) => {
-        const time = new Date(Date.now() - (data.length - 1 - i) * UPDATE_INTERVAL);
-        return time.toLocaleTimeString();
-    });
-
-    chart.data.labels = labels;
-    chart.data.datasets[0].data = data;
+    chart.data.labels = data.labels;
+    chart.data.datasets[0].data = data.values;
+    chart.data.datasets[1].data = data.peaks;
     chart.update('none');
-
-    const unit = metric === 'ping' ? 'ms' : '%';
-    document.getElementById(`${metric}-value`).textContent = value.toFixed(1) + unit;
 }
 
-// Check alerts
-function checkAlerts(metrics) {
-    const alerts = [];
-    for (const metric in THRESHOLDS) {
-        const { warning, critical } = THRESHOLDS[metric];
-        const value = metrics[metric] ?? 0;
-        const labelMap = { cpu: 'CPU', ram: 'RAM', disk: 'Disk', ping: 'Ping' };
-        if (value >= critical) alerts.push({ type: 'critical', metric: labelMap[metric], value, threshold: critical });
-        else if (value >= warning) alerts.push({ type: 'warning', metric: labelMap[metric], value, threshold: warning });
+// Update chart with new data; `current` is the latest reading shown as text
+function updateChart(metric, value, peak, label, current) {
+    const data = metricsData[metric];
+    data.labels.push(label);
+    data.values.push(value);
+    data.peaks.push(peak);
+    if (data.values.length > MAX_DATA_POINTS) {
+        data.labels.shift();
+        data.values.shift();
+        data.peaks.shift();
     }
-    displayAlerts(alerts);
+    drawChart(metric);
+
+    const unit = metric === 'ping' ? 'ms' : '%';
+    // null: the agent's ping timed out (drawn as a gap in the chart)
+    document.getElementById(`${metric}-value`).textContent = current === null ? 'timeout' : current.toFixed(1) + unit;
 }
 
-// Show alerts
+// Show alerts (evaluated server-side, delivered with each snapshot)
+const METRIC_LABELS = { cpu: 'CPU', ram: 'RAM', disk: 'Disk', ping: 'Ping' };
 function displayAlerts(alerts) {
     const container = document.getElementById('alert-container');
     if (!container) return;
     if (alerts.length === 0) return container.innerHTML = '';
 
     container.innerHTML = alerts.map(alert => `
-        <div class="alert alert-${alert.type}">
+        <div class="alert alert-${alert.severity}">
             <div class="alert-content">
-                <strong>${alert.type.toUpperCase()}</strong> ${alert.metric} high: ${alert.value.toFixed(1)} (threshold ${alert.threshold})
+                <strong>${alert.severity.toUpperCase()}</strong> ${alertText(alert)}
             </div>
         </div>
     `).join('');
 }
 
+function alertText(alert) {
+    if (alert.metric === 'heartbeat') {
+        return `Agent offline: no data for ${Math.round(alert.value)}s (expected within ${alert.threshold}s)`;
+    }
+    return `${METRIC_LABELS[alert.metric] || alert.metric} high: ${alert.value.toFixed(1)} (threshold ${alert.threshold})`;
+}
+
+// Navbar status: live, or the agent stopped reporting
+function updateStatus(status) {
+    const offline = status === 'down';
+    document.getElementById('status-indicator').classList.toggle('offline', offline);
+    document.getElementById('status-text').textContent = offline ? 'Agent Offline' : 'Live Monitoring';
+}
+
+// Version (updated_at) of the last snapshot drawn, to skip duplicates
+let lastVersion = null;
+
+// Draw one snapshot (from polling or from the live stream)
+function renderSnapshot(snapshot) {
+    updateHostname(snapshot.hostname);
+    // A host going down brings no new sample, only a new status and alert
+    updateStatus(snapshot.status);
+    displayAlerts(snapshot.alerts || []);
+    if (snapshot.updated_at && snapshot.updated_at === lastVersion) return;
+    lastVersion = snapshot.updated_at;
+
+    const time = snapshot.updated_at ? new Date(snapshot.updated_at) : new Date();
+    const label = time.toLocaleTimeString();
+    const summary = snapshot.summary || {};
+    METRICS.forEach(metric => {
+        // Summarized metrics chart the interval mean and peak; the text shows the last reading
+        const stats = summary[metric]; // [count, min, max, mean, p95]
+        updateChart(metric, stats ? stats[3] : snapshot[metric], stats ? stats[2] : null, label, snapshot[metric]);
+    });
+}
+
+// Pre-fill the charts with the last HISTORY_WINDOW seconds, downsampled by the server.
+// Metrics with agent-side summaries are drawn from those (mean and peak per bucket).
+async function loadHistory() {
+    const start = Math.floor(Date.now() / 1000) - HISTORY_WINDOW;
+    try {
+        const response = await fetch(`${BASE_URL}/range/?start=${start}&points=${MAX_DATA_POINTS}&summary=1`, { cache: "no-store" });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const { series, summaries = {} } = await response.json();
+        METRICS.forEach(metric => {
+            const data = metricsData[metric];
+            const buckets = summaries[metric] || []; // [ts, count, min, max, mean, p95]
+            if (buckets.length) {
+                data.labels = buckets.map(([ts]) => new Date(ts).toLocaleTimeString());
+                data.values = buckets.map(bucket => bucket[4]);
+                data.peaks = buckets.map(bucket => bucket[3]);
+            } else {
+                const points = series[metric] || [];
+                data.labels = points.map(([ts]) => new Date(ts).toLocaleTimeString());
+                data.values = points.map(([, value]) => value);
+                data.peaks = points.map(() => null);
+            }
+            drawChart(metric);
+        });
+    } catch (error) {
+        console.error('Error loading history:', error);
+    }
+}
+
 // Fetch and update all metrics
 async function updateMetrics() {
     try {
-        const [cpu, ram, disk, ping] = await Promise.all([
-            fetchMetricData('cpu'),
-            fetchMetricData('ram'),
-            fetchMetricData('disk'),
-            fetchMetricData('ping')
-        ]);
-
-        updateChart('cpu', cpu);
-        updateChart('ram', ram);
-        updateChart('disk', disk);
-        updateChart('ping', ping);
-
-        checkAlerts({ cpu, ram, disk, ping });
+        const snapshot = await fetchSnapshot();
+        if (!snapshot) return; // 304: unchanged since last poll
+        renderSnapshot(snapshot);
     } catch (error) {
         console.error('Error updating metrics:', error);
     }
 }
 
+// Fall back to polling every UPDATE_INTERVAL
+let pollTimer = null;
+function startPolling() {
+    if (!pollTimer) pollTimer = setInterval(updateMetrics, UPDATE_INTERVAL);
+}
+
+// Subscribe to server-pushed snapshots; poll if the stream is unavailable
+function startStream() {
+    if (!window.EventSource) return startPolling();
+
+    const source = new EventSource(`${BASE_URL}/stream/`);
+    // A server that never answers (e.g. a WSGI worker buffering the stream)
+    // neither opens nor closes the EventSource, so give up after a while
+    let opened = false;
+    const giveUp = setTimeout(() => {
+        if (opened) return;
+        console.warn("Live stream did not open, falling back to polling");
+        source.close();
+        startPolling();
+    }, STREAM_TIMEOUT);
+    const markOpen = () => {
+        opened = true;
+        clearTimeout(giveUp);
+    };
+
+    source.onopen = markOpen;
+    source.onmessage = event => {
+        markOpen();
+        renderSnapshot(JSON.parse(event.data));
+    };
+    source.onerror = () => {
+        // EventSource retries on its own; CLOSED means it gave up (e.g. a 503 under WSGI)
+        if (source.readyState === EventSource.CLOSED) {
+            console.warn("Live stream unavailable, falling back to polling");
+            clearTimeout(giveUp);
+            startPolling();
+        }
+    };
+}
+
 // Start monitoring
 async function startMonitoring() {
+    await loadHistory();
     await updateMetrics();
     document.getElementById('loading-spinner').style.display = 'none';
     document.getElementById('charts-grid').style.display = 'grid';
-    setInterval(updateMetrics, UPDATE_INTERVAL);
+    startStream();
 }
 
 // Export for debugging
-window.SysWatch = { updateMetrics, THRESHOLDS, metricsData };
\ No newline at end of file
+window.SysWatch = { updateMetrics, metricsData };
@@ -0,0 +1,99 @@
+// SysWatch Fleet Overview - pages through /api/fleet/
+
+// Configuration
+const REFRESH_INTERVAL = 5000; // 5 seconds, first page only (later pages stay put while you read them)
+
+const FLEET_URL = `${window.location.origin}/api/fleet/`;
+
+// Keyset cursors of the pages shown so far; null is the first page
+let cursors = [null];
+let nextCursor = null;
+let staleAfter = 120;
+
+document.addEventListener("DOMContentLoaded", function () {
+    ["fleet-sort", "fleet-limit", "fleet-hide-stale"].forEach(id =>
+        document.getElementById(id).addEventListener("change", firstPage));
+    document.getElementById("fleet-first").addEventListener("click", firstPage);
+    document.getElementById("fleet-next").addEventListener("click", () => {
+        cursors.push(nextCursor);
+        loadPage();
+    });
+    loadPage();
+    setInterval(() => { if (cursors.length === 1) loadPage(); }, REFRESH_INTERVAL);
+});
+
+function firstPage() {
+    cursors = [null];
+    loadPage();
+}
+
+async function loadPage() {
+    const params = new URLSearchParams({
+        sort: document.getElementById("fleet-sort").value,
+        limit: document.getElementById("fleet-limit").value,
+    });
+    const after = cursors[cursors.length - 1];
+    if (after) params.set("after", after);
+    if (document.getElementById("fleet-hide-stale").checked) params.set("max_age", staleAfter);
+
+    try {
+        const response = await fetch(`${FLEET_URL}?${params}`, { cache: "no-store" });
+        if (response.status === 403) {
+            document.getElementById("fleet-summary").textContent = "Staff login required";
+            return;
+        }
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const data = await response.json();
+        staleAfter = data.stale_after;
+        nextCursor = data.next;
+        renderRows(data.systems);
+        document.getElementById("fleet-summary").textContent =
+            `${data.hosts} hosts, ${data.down} down, ${data.stale} stale`;
+        document.getElementById("fleet-next").disabled = !nextCursor;
+        document.getElementById("fleet-first").disabled = cursors.length === 1;
+    } catch (error) {
+        console.error("Error fetching fleet:", error);
+        document.getElementById("fleet-summary").textContent = "Server unreachable";
+    }
+}
+
+function renderRows(systems) {
+    const body = document.getElementById("fleet-rows");
+    body.replaceChildren();
+    if (!systems.length) {
+        const row = body.insertRow();
+        const cell = row.insertCell();
+        cell.colSpan = 6;
+        cell.textContent = "No hosts yet.";
+        return;
+    }
+    for (const system of systems) {
+        const row = body.insertRow();
+        if (system.stale) row.classList.add("fleet-stale");
+        if (system.down) row.classList.add("fleet-down");
+
+        const link = document.createElement("a");
+        link.href = `/view/${encodeURIComponent(system.system_id)}/`;
+        link.textContent = system.hostname || system.system_id;
+        row.insertCell().appendChild(link);
+
+        for (const metric of ["cpu", "ram", "disk", "ping"]) {
+            const cell = row.insertCell();
+            const value = system[metric];
+            if (value === null) {
+                cell.textContent = "timeout";  // ping probe timed out
+                continue;
+            }
+            cell.textContent = metric === "ping" ? `${value.toFixed(0)}ms` : `${value.toFixed(1)}%`;
+            // At or above the host's critical alert threshold (per-host overrides included)
+            if (system.hot.includes(metric)) cell.classList.add("fleet-hot");
+        }
+        row.insertCell().textContent = (system.down ? "DOWN, " : "") + formatAge(system.age);
+    }
+}
+
+function formatAge(seconds) {
+    if (seconds < 60) return `${Math.round(seconds)}s ago`;
+    if (seconds < 3600) return `${Math.round(seconds / 60)}m ago`;
+    return `${Math.round(seconds / 3600)}h ago`;
+}
@@ -0,0 +1,238 @@
+"""
+In-process self-metrics, exposed in Prometheus text format.
+
+Hot paths record into fixed-bucket histograms and counters held in
+plain Python lists: an observation is one bisect plus two increments
+under a per-metric lock (low microseconds at most), so the
+instrumentation stays on in production. Queue depths, cache sizes and
+other state are read through callbacks only when /internal/metrics is
+scraped, so they cost nothing per request.
+
+    with telemetry.span("ingest.decode"):
+        ...
+    telemetry.INGEST_SAMPLES.inc("bulk", amount=len(samples))
+
+TimingMiddleware times every request by route, and every database
+query on every connection (request threads and background flushers
+alike) is timed by statement type via a connection execute wrapper.
+"""
+import bisect
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+
+# Seconds: 50 us .. 10 s
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+REGISTRY = []
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def label_text(names, values, extra=()):
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{v}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{label_text(self.labelnames, labels)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                extra = (("le", format_value(bound)),)
+                lines.append(f"{self.name}_bucket{label_text(self.labelnames, labels, extra)} {cumulative}")
+            base = label_text(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{base} {series[-1]!r}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+class Callback:
+    """Gauge or counter read from `func()` at scrape time. `func` returns a
+    number, or a {label value: number} dict for a single label."""
+
+    def __init__(self, name, help, func, kind="gauge", labelname=None):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.kind = kind
+        self.labelname = labelname
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        value = self.func()
+        if isinstance(value, dict):
+            for label, v in sorted(value.items()):
+                lines.append(f'{self.name}{{{self.labelname}="{escape(label)}"}} {format_value(v)}')
+        else:
+            lines.append(f"{self.name} {format_value(value)}")
+        return lines
+
+
+def render():
+    """Every registered metric in Prometheus text exposition format 0.0.4."""
+    lines = []
+    for metric in REGISTRY:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:  # a broken callback must not hide the rest
+            lines.append(f"# {metric.name} unavailable: {escape(e)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- Hot-path metrics ----------------
+REQUEST_SECONDS = Histogram(
+    "syswatch_http_request_duration_seconds",
+    "Time to produce a response (headers, for streams), by route.",
+    ("route", "method", "status"),
+)
+SPAN_SECONDS = Histogram(
+    "syswatch_span_duration_seconds",
+    "Time spent in instrumented code sections.",
+    ("span",),
+)
+DB_QUERY_SECONDS = Histogram(
+    "syswatch_db_query_duration_seconds",
+    "Database query time by statement type, all connections.",
+    ("statement",),
+)
+INGEST_SAMPLES = Counter(
+    "syswatch_ingest_samples_total",
+    "Samples accepted by /api/agent/metrics/, by request format.",
+    ("format",),
+)
+INGEST_REJECTED = Counter(
+    "syswatch_ingest_rejected_total",
+    "Samples or requests rejected by /api/agent/metrics/, by reason.",
+    ("reason",),
+)
+LIVE_LOOKUPS = Counter(
+    "syswatch_live_lookups_total",
+    "Live value lookups by where they were answered (shm, cache, db, unknown).",
+    ("source",),
+)
+
+
+class span:
+    """Times a with-block into SPAN_SECONDS (a class, not @contextmanager,
+    to skip the generator overhead)."""
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        SPAN_SECONDS.observe(time.perf_counter() - self.started, self.name)
+
+
+def time_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        statement = sql.lstrip().split(None, 1)[0].upper() if sql else ""
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started, statement)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+connection_created.connect(install_query_timer, dispatch_uid="syswatch-query-timer")
+
+
+# ---------------- Middleware ----------------
+class TimingMiddleware:
+    """Records every request in REQUEST_SECONDS, labelled by URL route."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    @staticmethod
+    def record(request, response, started):
+        match = request.resolver_match
+        route = match.route if match else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method, response.status_code)
@@ -1,3 +1,627 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import random
+import shutil
+import tempfile
+import uuid
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import control, downsample, export, fleet, history, shm, views, wire, writebehind
+from .alerts import CRITICAL, OK, WARNING, AlertEngine, AlertState, Rule
+from .anomaly import AnomalyDetector
+from .cache import MISS, LiveCache, LiveRecord
+from .history import now_ms
+from .ingest import Sample
+from .models import SystemMetric
+from .partitions import PartitionStore
+from .rollups import RollupEngine
+from .shm import SharedStore
+from .sketch import RELATIVE_ACCURACY, DDSketch
+from .writebehind import WriteBehindBuffer
+
+HOST = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+
+# ---------------- Binary wire format ----------------
+class WireTests(SimpleTestCase):
+    def setUp(self):
+        ts = now_ms()
+        self.first = Sample(HOST, "web-1", ts - 1000, 12.34, 56.78, 90.12, 5.67)
+        self.second = Sample(HOST, "web-1", ts, 13.0, 56.5, 90.12, 7.0)
+
+    def resolve(self, body, live=None):
+        return wire.resolve(wire.decode_frame(body), lambda system_id: live)
+
+    def assertSameValues(self, sample, expected):
+        self.assertEqual((sample.system_id, sample.hostname, sample.ts),
+                         (expected.system_id, expected.hostname, expected.ts))
+        for metric in ("cpu", "ram", "disk", "ping"):
+            self.assertAlmostEqual(getattr(sample, metric), getattr(expected, metric), places=2)
+
+    def test_full_round_trip(self):
+        samples, resync, rejected = self.resolve(wire.encode_frame([self.first, self.second]))
+        self.assertEqual((resync, rejected), ([], []))
+        self.assertSameValues(samples[0], self.first)
+        self.assertSameValues(samples[1], self.second)
+
+    def test_delta_round_trip(self):
+        body = wire.encode_frame([self.second], {HOST: self.first}, send_hostname=False)
+        self.assertIsNotNone(wire.decode_frame(body)[0].base_ts)
+        live = LiveRecord("web-1", 12.34, 56.78, 90.12, 5.67, self.first.ts)
+        samples, resync, _ = self.resolve(body, live)
+        self.assertEqual(resync, [])
+        self.assertSameValues(samples[0], self.second)
+
+    def test_delta_against_another_base_asks_for_resync(self):
+        body = wire.encode_frame([self.second], {HOST: self.first})
+        live = LiveRecord("web-1", 12.34, 56.78, 90.12, 5.67, self.first.ts - 1)
+        samples, resync, _ = self.resolve(body, live)
+        self.assertEqual((samples, resync), ([], [0]))
+
+    def test_null_ping_round_trip(self):
+        timed_out = self.second._replace(ping=None)
+        body = wire.encode_frame([timed_out], {HOST: self.first})
+        self.assertIsNone(wire.decode_frame(body)[0].base_ts)  # never a delta
+        samples, _, _ = self.resolve(body)
+        self.assertIsNone(samples[0].ping)
+
+    def test_overlong_system_id_is_rejected_not_resynced(self):
+        body = wire.encode_frame([self.first._replace(system_id="x" * 65), self.first])
+        samples, resync, rejected = self.resolve(body)
+        self.assertEqual(resync, [])
+        self.assertEqual(rejected, [{"index": 0, "message": "invalid system_id"}])
+        self.assertEqual(len(samples), 1)
+
+    def test_malformed_frames(self):
+        body = wire.encode_frame([self.first])
+        for bad in (b"", b"XX" + body[2:], body[:-1], body + b"\0",
+                    body[:2] + bytes([wire.VERSION + 1]) + body[3:]):
+            with self.assertRaises(ValueError):
+                wire.decode_frame(bad)
+        # NULL is only valid for ping
+        null_cpu = body[:-16] + wire.FULL.pack(self.first.ts, wire.NULL, 0, 0, 0)[8:]
+        with self.assertRaises(ValueError):
+            wire.decode_frame(null_cpu)
+
+
+# ---------------- Ingest ----------------
+class BulkIngestTests(SimpleTestCase):
+    def post(self, items):
+        return self.client.post("/api/agent/metrics/", json.dumps(items), content_type="application/json")
+
+    def test_invalid_entries_are_reported_by_index(self):
+        items = [
+            {"system_id": HOST, "hostname": "web-1", "cpu": 10, "ping": None},
+            {"system_id": "", "cpu": 10},
+            "not an object",
+            {"system_id": HOST, "cpu": "nan"},
+            {"system_id": "other", "ram": 20},
+        ]
+        with mock.patch("myapp.views.accept_samples") as accept:
+            reply = self.post(items).json()
+        self.assertEqual(reply["accepted"], 2)
+        self.assertEqual(reply["rejected"], [
+            {"index": 1, "message": "invalid system_id"},
+            {"index": 2, "message": "sample must be a JSON object"},
+            {"index": 3, "message": "invalid cpu"},
+        ])
+        self.assertNotIn("interval", reply)  # several systems: no single agent to pace
+        samples = accept.call_args.args[0]
+        self.assertEqual([s.system_id for s in samples], [HOST, "other"])
+        self.assertIsNone(samples[0].ping)
+
+    @override_settings(SYSWATCH_INGEST_MAX_BATCH=2)
+    def test_oversized_batch_is_refused_whole(self):
+        with mock.patch("myapp.views.accept_samples") as accept:
+            response = self.post([{"system_id": HOST}] * 3)
+        self.assertEqual(response.status_code, 413)
+        accept.assert_not_called()
+
+
+@override_settings(SYSWATCH_WRITE_BEHIND=True, SYSWATCH_INGEST_SHED_DEPTH=100, SYSWATCH_FLUSH_MAX_PENDING=50,
+                   SYSWATCH_RETRY_AFTER=10, SYSWATCH_INTERVAL_IDLE=30, SYSWATCH_INTERVAL_MAX=300)
+class LoadSheddingTests(SimpleTestCase):
+    def post(self):
+        sample = {"system_id": HOST, "cpu": 10}
+        with mock.patch("myapp.views.accept_samples") as accept:
+            response = self.client.post("/api/agent/metrics/", json.dumps(sample), content_type="application/json")
+        return response, accept
+
+    def test_backlog_at_shed_depth_gets_429(self):
+        with mock.patch.object(writebehind.buffer, "depth", return_value=100):
+            response, accept = self.post()
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(5 <= int(response["Retry-After"]) <= 15)
+        accept.assert_not_called()
+
+    def test_backlog_below_shed_depth_slows_agents_down(self):
+        with mock.patch.object(writebehind.buffer, "depth", return_value=99), \
+                mock.patch.object(control.meter, "rate", 0):
+            response, accept = self.post()
+        self.assertEqual(response.status_code, 200)
+        accept.assert_called_once()
+        self.assertEqual(response.json()["interval"], 30 * 99 / 50)  # about two flush batches behind
+
+
+# ---------------- Alert state machine ----------------
+class AlertStepTests(SimpleTestCase):
+    def setUp(self):
+        self.rule = Rule(warning=70, critical=80, for_seconds=10, hysteresis=0.1)
+        self.state = AlertState()
+
+    def step(self, value, ts, horizon=None):
+        return AlertEngine._step(self.state, self.rule, value, ts, horizon)
+
+    def test_opens_after_for_seconds(self):
+        self.assertIsNone(self.step(75, 0))
+        self.assertIsNone(self.step(75, 9000))
+        self.assertEqual(self.step(75, 10000), WARNING)
+        self.assertIsNone(self.step(85, 11000))
+        self.assertEqual(self.step(85, 21000), CRITICAL)
+
+    def test_holds_within_hysteresis_then_resolves(self):
+        self.step(75, 0)
+        self.assertEqual(self.step(75, 10000), WARNING)
+        self.assertIsNone(self.step(64, 11000))  # above 70 * 0.9
+        self.assertEqual(self.state.level, WARNING)
+        self.assertEqual(self.step(62, 12000), OK)
+
+    def test_dip_restarts_the_timer(self):
+        self.step(75, 0)
+        self.step(50, 5000)
+        self.step(75, 6000)
+        self.assertIsNone(self.step(75, 15000))
+        self.assertEqual(self.step(75, 16000), WARNING)
+
+    def test_out_of_order_samples_are_ignored(self):
+        self.step(75, 0)
+        self.step(75, 10000)
+        self.assertIsNone(self.step(10, 5000))
+        self.assertEqual((self.state.level, self.state.value, self.state.last_ts), (WARNING, 75, 10000))
+
+    def test_horizon_caps_future_timestamps(self):
+        self.step(75, 10 ** 15, horizon=1000)
+        self.assertEqual(self.state.last_ts, 1000)
+        self.assertIsNone(self.step(75, 2000, horizon=2000))  # still accepted afterwards
+        self.assertEqual(self.state.last_ts, 2000)
+
+
+# ---------------- Partition retention ----------------
+class PartitionRetentionTests(SimpleTestCase):
+    DAY = 86400 * 1000
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.now = now_ms()
+        self.store = PartitionStore(self.directory, span_seconds=86400, retention_days=3)
+        self.addCleanup(self.store.close)
+
+    def test_expire_drops_whole_files_past_retention(self):
+        for days in range(6):
+            self.store.write([(1, self.now - days * self.DAY, 1, 2, 3, 4)], self.now - days * self.DAY)
+        self.assertEqual(len(self.store.partitions()), 6)
+
+        self.assertEqual(self.store.expire(self.now), 2)
+        cutoff = self.store.key(self.now - 3 * self.DAY)
+        self.assertTrue(all(key >= cutoff for key, _ in self.store.partitions()))
+        rows = list(self.store.read(1, self.now - 10 * self.DAY, self.now + 1))
+        self.assertEqual([row[0] for row in rows], [self.now - days * self.DAY for days in (3, 2, 1, 0)])
+
+    def test_write_skips_rows_outside_the_window(self):
+        rows = [(1, self.now - 10 * self.DAY, 1, 2, 3, 4), (1, self.now, 1, 2, 3, None),
+                (1, self.now + 10 * self.DAY, 1, 2, 3, 4)]
+        self.store.write(rows, self.now)
+        self.assertEqual(len(self.store.partitions()), 1)
+        self.assertEqual(list(self.store.read(1, 0, self.now + 20 * self.DAY)), [(self.now, 1, 2, 3, None)])
+
+
+# ---------------- Anomalies ----------------
+class AnomalyTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(AnomalyDetector, "_run")  # tick by hand, no thread
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.detector = AnomalyDetector(interval=10, alpha=0.1, threshold=4, warmup=3, min_std=1.0)
+
+    def report(self, system_id, cpu=10, ping=20):
+        self.detector.add([Sample(system_id, "", now_ms(), cpu, 50, 50, ping)])
+
+    def test_metric_baseline_starts_at_its_first_value(self):
+        for _ in range(5):
+            self.report(HOST, ping=None)  # probe timing out since the host appeared
+            self.detector.tick()
+        for _ in range(5):
+            self.report(HOST, ping=200)
+            self.detector.tick()
+        self.assertEqual(self.detector.anomalies(), [])
+        self.assertAlmostEqual(self.detector._mean[0, 3], 200)
+
+    def test_hosts_that_stop_reporting_drop_out(self):
+        for _ in range(5):
+            self.report(HOST)
+            self.report("other")
+            self.detector.tick()
+        self.report(HOST, cpu=90)
+        self.report("other")
+        self.detector.tick()
+        self.assertEqual([a["system_id"] for a in self.detector.anomalies()], [HOST])
+
+        self.report("other")
+        self.detector.tick()
+        self.assertEqual(self.detector.anomalies(), [])
+        self.detector.tick()  # nobody reported at all
+        self.assertEqual(self.detector.anomalies(system_id=HOST), [])
+
+
+# ---------------- Quantile sketch ----------------
+class SketchTests(SimpleTestCase):
+    def test_quantiles_within_relative_accuracy(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(2, 1.5) for _ in range(20000)]
+        sketch = DDSketch()
+        for value in values:
+            sketch.add(value)
+        ordered = sorted(values)
+        for q in (0, 0.5, 0.9, 0.95, 0.99, 1):
+            expected = ordered[int(q * (len(ordered) - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - expected), RELATIVE_ACCURACY * expected * 1.0001, q)
+
+    def test_merge_and_serialization_match_one_sketch(self):
+        rng = random.Random(3)
+        values = [rng.uniform(0, 100) for _ in range(5000)] + [0.0] * 50
+        whole, left, right = DDSketch(), DDSketch(), DDSketch()
+        for i, value in enumerate(values):
+            whole.add(value)
+            (left if i % 2 else right).add(value)
+        merged, _ = DDSketch.from_bytes(left.merge(right).to_bytes())
+        self.assertEqual(merged.count, len(values))
+        for q in (0.01, 0.5, 0.99):
+            self.assertEqual(merged.quantile(q), whole.quantile(q))
+
+    def test_empty(self):
+        self.assertIsNone(DDSketch().quantile(0.5))
+
+
+class RollupReplayTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(RollupEngine, "_run")  # no flush thread
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.engine = RollupEngine(interval=60)
+        ts = now_ms() // 60000 * 60000
+        self.samples = [Sample(HOST, "", ts + i * 1000, 10 + i, 1, 1, 1) for i in range(3)]
+
+    def count(self):
+        return sum(agg.count for (_, resolution, _), agg in self.engine._pending.items() if resolution == 60)
+
+    def test_replayed_samples_are_counted_once(self):
+        self.engine.add(self.samples[:2])
+        self.engine.add(self.samples)  # spool replay after a lost reply, plus one new sample
+        self.assertEqual(self.count(), 3)
+
+    def test_floors_from_other_workers(self):
+        self.engine.add(self.samples, floors={HOST: self.samples[1].ts})
+        self.assertEqual(self.count(), 1)
+
+
+# ---------------- Fleet paging ----------------
+class FleetPagingTests(TestCase):
+    def setUp(self):
+        # Plenty of ties, and hosts without a ping
+        for i in range(23):
+            SystemMetric.objects.create(system_id=f"host-{i:02d}", cpu=i % 4, ping=None if i % 5 == 0 else i % 3)
+
+    def walk(self, sort, limit):
+        rows, cursor = fleet.page(sort, limit)
+        seen = list(rows)
+        while cursor:
+            rows, cursor = fleet.page(sort, limit, after=cursor)
+            seen.extend(rows)
+        return seen
+
+    def test_pages_cover_every_host_once_in_order(self):
+        for sort, limit in (("cpu", 2), ("-cpu", 3), ("system_id", 5), ("-updated_at", 4)):
+            field = sort.lstrip("-")
+            rows = self.walk(sort, limit)
+            self.assertEqual(len(rows), 23, sort)
+            self.assertEqual(len({row["id"] for row in rows}), 23, sort)
+            keys = [(row[field], row["id"]) for row in rows]
+            self.assertEqual(keys, sorted(keys, reverse=sort.startswith("-")), sort)
+
+    def test_null_pings_sort_below_every_value(self):
+        ascending = [row["ping"] for row in self.walk("ping", 2)]
+        descending = [row["ping"] for row in self.walk("-ping", 2)]
+        self.assertEqual(ascending[:5], [None] * 5)
+        self.assertEqual(descending[-5:], [None] * 5)
+        self.assertEqual(len(ascending), 23)
+        self.assertEqual(len(descending), 23)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            fleet.page("cpu", 2, after="not-a-cursor")
+
+    def test_later_pages_search_the_sort_index(self):
+        for sort in ("cpu", "-cpu", "ping", "-ping", "-updated_at"):
+            field = sort.lstrip("-")
+            for limit in (2, 7, 20):  # cursors on a value, and among the null pings
+                _, cursor = fleet.page(sort, limit)
+                with CaptureQueriesContext(connection) as queries:
+                    fleet.page(sort, limit, after=cursor)
+                for query in queries.captured_queries:
+                    with connection.cursor() as db:
+                        db.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                        plan = [row[-1] for row in db.fetchall()]
+                    self.assertEqual(len(plan), 1, (sort, limit, plan))
+                    index = "systemmetric_updated_idx" if field == "updated_at" else f"systemmetric_{field}_idx"
+                    self.assertTrue(plan[0].startswith(f"SEARCH myapp_systemmetric USING INDEX {index} "),
+                                    (sort, limit, plan))
+
+
+class FleetAccessTests(TestCase):
+    def setUp(self):
+        SystemMetric.objects.create(system_id="host-1", cpu=95, ram=10, disk=10, ping=None)
+
+    def test_fleet_and_export_need_an_operator(self):
+        for url in ("/api/fleet/", "/api/export/"):
+            self.assertEqual(self.client.get(url).status_code, 403, url)
+        self.client.force_login(User.objects.create(username="ops", is_staff=True))
+        self.assertEqual(self.client.get("/api/export/").status_code, 200)
+        systems = self.client.get("/api/fleet/").json()["systems"]
+        self.assertEqual(systems[0]["hot"], ["cpu"])  # from the default critical thresholds
+
+    @override_settings(SYSWATCH_OPERATOR_TOKEN="s3cret")
+    def test_token(self):
+        self.assertEqual(self.client.get("/api/fleet/", HTTP_AUTHORIZATION="Bearer nope").status_code, 403)
+        self.assertEqual(self.client.get("/api/fleet/", HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+
+
+# ---------------- Live cache ----------------
+class LiveCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = LiveCache(capacity=2, ttl=10)
+        self.record = LiveRecord("web-1", 1, 2, 3, 4, 1000)
+
+    def test_entries_expire_after_ttl(self):
+        with mock.patch("myapp.cache.time.monotonic", return_value=100):
+            self.cache.put(HOST, LiveRecord("web-1", 1, 2, 3, 4, 1000))  # loaded now
+            self.cache.put("gone", None)  # negative entry
+        with mock.patch("myapp.cache.time.monotonic", return_value=105):
+            self.assertEqual(self.cache.get(HOST).cpu, 1)
+            self.assertIsNone(self.cache.get("gone"))
+        with mock.patch("myapp.cache.time.monotonic", return_value=111):
+            self.assertIs(self.cache.get(HOST), MISS)
+            self.assertIs(self.cache.get("gone"), MISS)
+        self.assertEqual(self.cache.stats()["expirations"], 2)
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.put("a", self.record)
+        self.cache.put("b", self.record)
+        self.cache.get("a")
+        self.cache.put("c", self.record)
+        self.assertIs(self.cache.get("b"), MISS)
+        self.assertIsNot(self.cache.get("a"), MISS)
+
+    def test_older_record_does_not_replace_newer(self):
+        self.cache.put(HOST, self.record)
+        self.cache.put(HOST, LiveRecord("web-1", 9, 9, 9, 9, 500))
+        self.assertEqual(self.cache.get(HOST).cpu, 1)
+
+
+@override_settings(SYSWATCH_SHARED_STORE=False)
+class LiveLookupTests(TestCase):
+    def setUp(self):
+        views.LIVE_CACHE.clear()
+        self.addCleanup(views.LIVE_CACHE.clear)
+
+    def test_unknown_ids_hit_the_database_once(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(views.load_system_data("no-such-host"))
+            self.assertIsNone(views.load_system_data("no-such-host"))
+
+
+# ---------------- Shared live store ----------------
+class SharedStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = f"{directory}/live"
+        self.store = SharedStore(self.path, slots=4)
+
+    def test_other_workers_see_the_latest_sample(self):
+        self.assertTrue(self.store.put(HOST, "web-1", 1, 2, 3, None, 2000))
+        self.assertTrue(self.store.put(HOST, "web-1", 9, 9, 9, 9, 1000))  # replayed, older: kept out
+        other = SharedStore(self.path, slots=4)  # same file, as mapped by another process
+        record = other.get(HOST)
+        self.assertEqual((record.hostname, record.cpu, record.ping, record.version), ("web-1", 1, None, 2000))
+        self.assertIsNone(other.get("unknown"))
+
+    def test_full_store_and_long_ids_fall_back(self):
+        for i in range(4):
+            self.assertTrue(self.store.put(f"host-{i}", "", 1, 2, 3, 4, 1000))
+        self.assertFalse(self.store.put("host-4", "", 1, 2, 3, 4, 1000))
+        self.assertFalse(self.store.put("x" * 65, "", 1, 2, 3, 4, 1000))
+
+
+# ---------------- Snapshot ----------------
+@override_settings(SYSWATCH_SHARED_STORE=True)
+class SnapshotETagTests(SimpleTestCase):
+    def test_unchanged_snapshot_gets_304(self):
+        system_id = str(uuid.uuid4())
+        url = f"/api/metrics/{system_id}/snapshot/"
+        ts = now_ms()
+        shm.store.put(system_id, "web-1", 1, 2, 3, 4, ts)
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first["ETag"]
+
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((again.status_code, again.content), (304, b""))
+
+        shm.store.put(system_id, "web-1", 5, 2, 3, 4, ts + 1000)
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+        self.assertEqual(changed.json()["cpu"], 5)
+
+
+# ---------------- Live stream ----------------
+@override_settings(SYSWATCH_SHARED_STORE=True, SYSWATCH_STREAM_POLL=0.05)
+class LiveStreamTests(SimpleTestCase):
+    async def test_samples_from_another_worker_reach_the_stream(self):
+        system_id = str(uuid.uuid4())
+        ts = now_ms()
+        shm.store.put(system_id, "web-1", 1, 2, 3, 4, ts)
+        response = await self.async_client.get(f"/api/metrics/{system_id}/stream/")
+        events = aiter(response.streaming_content)
+        first = json.loads((await anext(events)).decode()[len("data: "):])
+        self.assertEqual(first["cpu"], 1)
+
+        # Stored by another process: no publish on this worker's hub
+        shm.store.put(system_id, "web-1", 50, 2, 3, 4, ts + 1000)
+        second = await asyncio.wait_for(anext(events), 5)
+        self.assertEqual(json.loads(second.decode()[len("data: "):])["cpu"], 50)
+        await events.aclose()
+
+
+# ---------------- LTTB ----------------
+class DownsampleTests(SimpleTestCase):
+    def test_keeps_endpoints_and_point_count(self):
+        n, threshold = 10000, 500
+        x = np.arange(n, dtype=np.float64)
+        y = np.column_stack((np.sin(x / 50), np.random.default_rng(1).random(n)))
+        kept = downsample.lttb_indices(x, y, threshold)
+        self.assertEqual(kept.shape, (threshold, 2))
+        for column in kept.T:
+            self.assertEqual((column[0], column[-1]), (0, n - 1))
+            self.assertTrue(np.all(np.diff(column) > 0))
+
+    def test_keeps_a_spike(self):
+        rows = [(ts, 10.0) for ts in range(1000)]
+        rows[437] = (437, 99.0)
+        series = downsample.downsample(rows, ("cpu",), 50)["cpu"]
+        self.assertEqual(len(series), 50)
+        self.assertIn([437, 99.0], series)
+
+    def test_short_series_is_returned_whole(self):
+        rows = [(1, 1.0, None), (2, 2.0, 3.0), (3, 1.5, 4.0)]
+        series = downsample.downsample(rows, ("cpu", "ping"), 500)
+        self.assertEqual(series["cpu"], [[1, 1.0], [2, 2.0], [3, 1.5]])
+        self.assertEqual(series["ping"], [[1, None], [2, 3.0], [3, 4.0]])
+
+
+class RangeTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(RollupEngine, "_run")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        SystemMetric.objects.create(system_id=HOST)
+        self.now = now_ms() // 60000 * 60000
+        engine = RollupEngine(interval=60)
+        engine.add([Sample(HOST, "", self.now - 120000 + i * 1000, i, 1, 1, None) for i in range(120)])
+        engine.flush()
+
+    def get(self, **params):
+        return self.client.get(f"/api/metrics/{HOST}/range/", params)
+
+    def test_wide_ranges_are_read_from_rollups(self):
+        start = self.now // 1000 - 3 * 86400
+        with mock.patch("myapp.history.samples_between") as raw:
+            data = self.get(start=start, end=self.now // 1000, metrics="cpu,ping").json()
+        raw.assert_not_called()
+        self.assertEqual(data["resolution"], 60)
+        self.assertEqual(data["series"]["cpu"], [[self.now - 120000, 29.5], [self.now - 60000, 89.5]])
+        self.assertEqual(data["series"]["ping"], [[self.now - 120000, None], [self.now - 60000, None]])
+        self.assertIsNone(self.get(start=self.now // 1000 - 3600).json()["resolution"])
+
+    def test_bad_numbers_get_fixed_messages(self):
+        for params, message in (({"start": "nan"}, "start must be a number"),
+                                ({"end": "1e400"}, "end must be a number"),
+                                ({"start": "-5"}, "start must be a unix timestamp in seconds"),
+                                ({"points": "x"}, "points must be an integer")):
+            response = self.get(**params)
+            self.assertEqual((response.status_code, response.json()["message"]), (400, message), params)
+
+        self.client.force_login(User.objects.create(username="ops", is_staff=True))
+        response = self.client.get("/api/fleet/", {"max_age": "nan"})
+        self.assertEqual((response.status_code, response.json()["message"]), (400, "max_age must be a number"))
+
+
+# ---------------- Export ----------------
+class ExportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        store = PartitionStore(directory, span_seconds=86400, retention_days=3)
+        self.addCleanup(store.close)
+        patcher = mock.patch.object(history, "store", store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.now = now_ms()
+        a = SystemMetric.objects.create(system_id="host-a")
+        b = SystemMetric.objects.create(system_id="host-b")
+        store.write([(a.pk, self.now - i, i, 2, 3, None) for i in range(3)]
+                    + [(b.pk, self.now - i, i, 2, 3, 4) for i in range(2)], self.now)
+
+    def test_chunks_are_bounded_and_encoded_one_at_a_time(self):
+        parts = list(export.chunks(None, self.now - 10, self.now + 1, ("cpu", "ping"), size=2))
+        self.assertEqual([len(rows) for rows in parts], [2, 2, 1])
+        self.assertEqual(parts[0], [("host-a", self.now - 2, 2, None), ("host-a", self.now - 1, 1, None)])
+
+        columns = b"".join(export.encode(iter(parts), "columns", ("cpu", "ping"))).decode().splitlines()
+        self.assertEqual(json.loads(columns[0]),
+                         {"system_id": "host-a", "ts": [self.now - 2, self.now - 1], "cpu": [2, 1], "ping": [None, None]})
+        self.assertEqual(len(columns), 4)  # host-a twice, host-b twice: one line per host per chunk
+
+    def test_endpoint_streams_gzipped_csv(self):
+        self.client.force_login(User.objects.create(username="ops", is_staff=True))
+        start = (self.now - 10) / 1000
+        response = self.client.get("/api/export/", {"hosts": "host-b,unknown", "start": start, "gzip": "1"})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(lines, ["system_id,ts,cpu,ram,disk,ping",
+                                 f"host-b,{self.now - 1},1.0,2.0,3.0,4.0", f"host-b,{self.now},0.0,2.0,3.0,4.0"])
+
+
+# ---------------- Write-behind ----------------
+class WriteBehindTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(WriteBehindBuffer, "_start")  # flush by hand, no thread
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buffer = WriteBehindBuffer(interval=60, max_pending=10, max_queue=15)
+        self.samples = [Sample(f"host-{i}", "", i, 1, 2, 3, 4) for i in range(12)]
+
+    def test_flush_writes_everything_pending(self):
+        self.buffer.submit(self.samples[:5])
+        self.buffer.submit(self.samples[5:])
+        with mock.patch("myapp.ingest.store_samples") as store:
+            self.assertEqual(self.buffer.flush(), 12)
+        store.assert_called_once_with(self.samples)
+        self.assertEqual(self.buffer.depth(), 0)
+
+    def test_failed_flush_requeues_up_to_max_queue(self):
+        self.buffer.submit(self.samples)
+        with mock.patch("myapp.ingest.store_samples", side_effect=DatabaseError("locked")), \
+                self.assertLogs("myapp.writebehind", "ERROR"):
+            self.assertEqual(self.buffer.flush(), 0)
+            self.assertEqual(self.buffer.depth(), 12)
+            self.buffer.submit(self.samples[:6])
+            self.assertEqual(self.buffer.flush(), 0)
+        # Oldest dropped first
+        self.assertEqual((self.buffer.depth(), self.buffer.dropped), (15, 3))
+        self.assertEqual(self.buffer._pending[0], self.samples[3])
+
+    def test_shedding_starts_before_samples_are_dropped(self):
+        self.assertLessEqual(settings.SYSWATCH_INGEST_SHED_DEPTH, settings.SYSWATCH_WRITE_BEHIND_MAX_QUEUE)
@@ -7,10 +7,38 @@ urlpatterns = [
 
     # Dashboard view for each system
     path("view/<str:system_id>/", views.dashboard_view, name="dashboard_view"),
+    # Every host on one page, sortable (hottest first)
+    path("fleet/", views.fleet_view, name="fleet_view"),
 
     # API endpoints for dashboard.js frontend
-    path("api/metrics/<str:system_id>/<str:metric>/", views.get_metric_value),
+    # (specific routes must come before the catch-all <metric> route)
+    path("api/metrics/<str:system_id>/snapshot/", views.get_snapshot, name="metrics_snapshot"),
+    path("api/metrics/<str:system_id>/stream/", views.stream_metrics, name="metrics_stream"),
+    path("api/metrics/<str:system_id>/range/", views.get_range, name="metrics_range"),
+    path("api/metrics/<str:system_id>/details/", views.get_details, name="metrics_details"),
     path("api/metrics/<str:system_id>/hostname/", views.get_hostname),
+    path("api/metrics/<str:system_id>/<str:metric>/", views.get_metric_value),
+
+    # Fleet overview: keyset-paginated, sortable listing of all systems
+    path("api/fleet/", views.get_fleet, name="fleet"),
+
+    # Aggregated history (1 min / 1 h / 1 d rollups with percentiles)
+    path("api/rollups/<str:system_id>/", views.get_rollups, name="rollups"),
+    # Raw history download (CSV / NDJSON, optionally gzipped), streamed
+    path("api/export/", views.export_history, name="export_history"),
+
+    # Alerts evaluated at ingest (open alerts, per-host rules)
+    path("api/alerts/", views.get_alerts, name="alerts"),
+    path("api/alerts/<str:system_id>/", views.system_alerts, name="system_alerts"),
+
+    # Hosts whose agent stopped reporting
+    path("api/liveness/", views.get_liveness, name="liveness"),
+
+    # Hosts deviating from their own baseline
+    path("api/anomalies/", views.get_anomalies, name="anomalies"),
+
+    # Prometheus self-metrics (restricted, see views.internal_metrics)
+    path("internal/metrics", views.internal_metrics, name="internal_metrics"),
 
     # Optional: local testing endpoints
     path("api/metrics/cpu/", views.get_cpu_usage),
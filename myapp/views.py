@@ -1,135 +1,866 @@
-from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
-import psutil
-import subprocess
+from django.shortcuts import render
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import transaction
+from django.middleware.csrf import CsrfViewMiddleware
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.core.handlers.asgi import ASGIRequest
+import hmac
 import json
-from datetime import datetime
-from .models import SystemMetric
+import math
+import asyncio
+from asgiref.sync import sync_to_async
+from datetime import datetime, timezone
+from .models import Alert, AlertRule, SystemMetric
+from . import alerts, anomaly, cache, control, downsample, export, fleet, history, ingest, live, liveness, probes, rollups, sampler, shm, telemetry, wire, writebehind
 
 # Create your views here.
 
 
 # Store latest metrics for each connected system
 
-# In-memory store for live metrics (optional cache)
-METRICS_DATA = {}
+# Per-process live cache (bounded LRU with TTL). Fallback when the shared
+# store in myapp/shm.py is disabled or full, and for values loaded from DB.
+LIVE_CACHE = cache.LiveCache(
+    capacity=settings.SYSWATCH_CACHE_CAPACITY,
+    ttl=settings.SYSWATCH_CACHE_TTL,
+)
+
+
+def cache_sample(sample):
+    """Stores an accepted ingest.Sample as the live value for its system."""
+    stored = shm.enabled() and shm.store.put(
+        sample.system_id, sample.hostname,
+        sample.cpu, sample.ram, sample.disk, sample.ping, sample.ts,
+    )
+    if not stored:
+        LIVE_CACHE.put(sample.system_id, cache.LiveRecord(
+            sample.hostname, sample.cpu, sample.ram, sample.disk, sample.ping, sample.ts,
+        ))
+
+    publish_snapshot(sample.system_id, sample.summary, sample.ts)
+
+
+def publish_snapshot(system_id, summary=None, version=None):
+    """
+    Pushes a fresh snapshot to open dashboard streams for a system, with
+    the agent-side summary if it sent one (polled snapshots carry only
+    the values). `version` is the new sample's, None for a status change.
+    """
+    if live.hub.watching(system_id):
+        snapshot = snapshot_data(system_id)
+        if summary:
+            snapshot["summary"] = summary
+        live.hub.publish(system_id, json.dumps(snapshot), version)
+
+
+def stored_version(system_id):
+    """Version of the newest sample any worker put in the shared store, or 0."""
+    record = shm.store.get(system_id) if shm.enabled() else None
+    return record.version if record else 0
+
+
+# Streams also hear about hosts going silent, which brings no sample
+liveness.tracker.on_change = publish_snapshot
+
+
+def load_system_data(system_id):
+    """
+    Returns the live cache.LiveRecord for a system, or None if unknown.
+    Reads from the shared-memory store (visible to every worker on this
+    host), then LIVE_CACHE, otherwise falls back to DB.
+    "version" is the epoch-ms time of the sample and changes whenever
+    the values do, so it doubles as the snapshot ETag.
+    """
+    if shm.enabled():
+        record = shm.store.get(system_id)
+        if record:
+            telemetry.LIVE_LOOKUPS.inc("shm")
+            return record
+
+    record = LIVE_CACHE.get(system_id)
+    if record is not cache.MISS:
+        telemetry.LIVE_LOOKUPS.inc("cache" if record else "unknown")
+        return record
+
+    with telemetry.span("live.db_fallback"):
+        system = SystemMetric.objects.filter(system_id=system_id).first()
+    if not system:
+        telemetry.LIVE_LOOKUPS.inc("unknown")
+        LIVE_CACHE.put(system_id, None)  # negative entry, expires with the TTL
+        return None
+
+    telemetry.LIVE_LOOKUPS.inc("db")
+
+    record = cache.LiveRecord(
+        system.hostname, system.cpu, system.ram, system.disk, system.ping,
+        system.version or int(system.updated_at.timestamp() * 1000),
+    )
+    LIVE_CACHE.put(system_id, record)
+    return record
+
 
 # ---------------- Agent POST endpoint ----------------
 @csrf_exempt
 def receive_metrics(request):
     if request.method == "POST":
+        # Shed load before doing any work once write-behind is too far behind
+        if control.overloaded():
+            telemetry.INGEST_REJECTED.inc("overloaded")
+            retry_after = control.retry_after()
+            response = JsonResponse(
+                {"status": "error", "message": "Server busy, retry later", "retry_after": retry_after}, status=429
+            )
+            response["Retry-After"] = str(retry_after)
+            return response
+
         try:
-            data = json.loads(request.body.decode("utf-8"))
-        except json.JSONDecodeError:
+            with telemetry.span("ingest.decode"):
+                body = ingest.decode_body(request.body, request.headers.get("Content-Encoding"))
+        except ValueError as e:
+            telemetry.INGEST_REJECTED.inc("bad_body")
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+        # Compact binary samples (see myapp/wire.py)
+        if request.content_type == wire.CONTENT_TYPE:
+            return receive_metrics_binary(body)
+
+        try:
+            with telemetry.span("ingest.decode"):
+                data = json.loads(body.decode("utf-8"))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            telemetry.INGEST_REJECTED.inc("bad_body")
             return JsonResponse({"status": "error", "message": "Invalid JSON"}, status=400)
 
-        system_id = data.get("system_id")
-        hostname = data.get("hostname")
-        cpu = data.get("cpu", 0)
-        ram = data.get("ram", 0)
-        disk = data.get("disk", 0)
-        ping = data.get("ping", 0)
-
-        # Save/update DB
-        SystemMetric.objects.update_or_create(
-            system_id=system_id,
-            defaults={
-                "hostname": hostname,
-                "cpu": cpu,
-                "ram": ram,
-                "disk": disk,
-                "ping": ping
-            }
-        )
+        # Bulk mode: a JSON array of samples (relays, spooled agents)
+        if isinstance(data, list):
+            return receive_metrics_bulk(data)
 
-        # Update in-memory cache
-        METRICS_DATA[system_id] = {
-            "hostname": hostname,
-            "cpu": cpu,
-            "ram": ram,
-            "disk": disk,
-            "ping": ping,
-        }
+        try:
+            sample = ingest.parse_sample(data, history.now_ms())
+        except ValueError as e:
+            telemetry.INGEST_REJECTED.inc("invalid")
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+        system_id = sample.system_id
+        telemetry.INGEST_SAMPLES.inc("json")
 
-        # Return dashboard URL
+        if writebehind.enabled():
+            # Flushed to SystemMetric and history by the background writer
+            accept_samples([sample])
+        else:
+            with telemetry.span("ingest.store"):
+                # Save/update DB (latest projection), unless it holds a newer sample
+                pk, written = ingest.store_latest(sample)
+                if written and sample.ext is not None:
+                    ingest.store_details({pk: sample.ext})
+
+                # Append to history (batched insert)
+                history.append(pk, sample.cpu, sample.ram, sample.disk, sample.ping,
+                               ts=sample.ts, summary=sample.summary)
+
+            # Update in-memory cache and rollups
+            observe([sample], {system_id: sample} if written else {})
+
+        # Return dashboard URL, and when to send the next sample
         dashboard_url = f"https://syswatch-6c1r.onrender.com/view/{system_id}/"
-        return JsonResponse({"status": "ok", "dashboard_url": dashboard_url})
+        return JsonResponse({"status": "ok", "dashboard_url": dashboard_url, "interval": control.interval_for(system_id)})
 
     return JsonResponse({"status": "error", "message": "POST required"}, status=405)
 
 
+def receive_metrics_bulk(items):
+    """
+    Validates and stores an array of samples, possibly for many systems.
+    Invalid entries are skipped and reported back by index.
+    """
+    if len(items) > settings.SYSWATCH_INGEST_MAX_BATCH:
+        telemetry.INGEST_REJECTED.inc("too_large")
+        return JsonResponse(
+            {"status": "error", "message": f"At most {settings.SYSWATCH_INGEST_MAX_BATCH} samples per request"},
+            status=413,
+        )
+
+    with telemetry.span("ingest.parse"):
+        samples, rejected = ingest.parse_samples(items)
+    telemetry.INGEST_SAMPLES.inc("bulk", amount=len(samples))
+    if rejected:
+        telemetry.INGEST_REJECTED.inc("invalid", amount=len(rejected))
+    accept_samples(samples)
+    reply = {"status": "ok", "accepted": len(samples), "rejected": rejected}
+    system_ids = {s.system_id for s in samples}
+    if len(system_ids) == 1:
+        # One agent replaying its spool: it gets its interval too
+        reply["interval"] = control.interval_for(system_ids.pop())
+    return JsonResponse(reply)
+
+
+def receive_metrics_binary(body):
+    """
+    Decodes an application/x-syswatch frame and stores its samples.
+    Delta records whose base is not the sample we hold are listed under
+    "resync" so the agent resends them in full.
+    """
+    try:
+        with telemetry.span("ingest.parse"):
+            records = wire.decode_frame(body)
+    except ValueError as e:
+        telemetry.INGEST_REJECTED.inc("bad_body")
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    if len(records) > settings.SYSWATCH_INGEST_MAX_BATCH:
+        telemetry.INGEST_REJECTED.inc("too_large")
+        return JsonResponse(
+            {"status": "error", "message": f"At most {settings.SYSWATCH_INGEST_MAX_BATCH} samples per request"},
+            status=413,
+        )
+
+    samples, resync, rejected = wire.resolve(records, load_system_data)
+    telemetry.INGEST_SAMPLES.inc("binary", amount=len(samples))
+    if resync:
+        telemetry.INGEST_REJECTED.inc("resync", amount=len(resync))
+    if rejected:
+        telemetry.INGEST_REJECTED.inc("invalid", amount=len(rejected))
+    accept_samples(samples)
+
+    reply = {"status": "ok", "accepted": len(samples), "resync": resync, "rejected": rejected}
+    if len(records) == 1 and samples:
+        reply["dashboard_url"] = f"https://syswatch-6c1r.onrender.com/view/{samples[0].system_id}/"
+        reply["interval"] = control.interval_for(samples[0].system_id)
+    return JsonResponse(reply)
+
+
+def accept_samples(samples):
+    """Persists a batch of validated samples and updates the live cache."""
+    with telemetry.span("ingest.store"):
+        if writebehind.enabled():
+            writebehind.buffer.submit(samples)
+            latest = ingest.latest_per_system(samples)
+        else:
+            latest = ingest.store_samples(samples)
+
+    observe(samples, latest)
+
+
+def observe(samples, latest):
+    """
+    Feeds accepted samples to the in-process consumers: the alert engine,
+    anomaly detector and rollup engine (every sample), the liveness
+    tracker and the live cache (newest sample per system only). Alerts go first so pushed snapshots
+    include them.
+    """
+    with telemetry.span("ingest.observe"):
+        # Newest sample any worker already folded into rollups: the shared
+        # store's version before this batch is cached
+        floors = {}
+        if shm.enabled():
+            for system_id in {sample.system_id for sample in samples}:
+                record = shm.store.get(system_id)
+                if record is not None:
+                    floors[system_id] = record.version
+        control.meter.add(len(samples))
+        alerts.observe(samples)
+        liveness.observe(latest)
+        for sample in latest.values():
+            cache_sample(sample)
+        anomaly.detector.add(samples)
+        rollups.engine.add(samples, floors)
+
+
 # ---------------- API endpoints for dashboard.js ----------------
 def get_metric_value(request, system_id, metric):
     """
     Returns the requested metric value for a system.
-    Reads from METRICS_DATA if available, otherwise falls back to DB.
+    Reads from the live cache if available, otherwise falls back to DB.
     Always returns 0 if metric not found instead of 404.
     """
-    system_data = METRICS_DATA.get(system_id)
+    system_data = load_system_data(system_id)
 
     if not system_data:
-        system = SystemMetric.objects.filter(system_id=system_id).first()
-        if system:
-            system_data = {
-                "cpu": system.cpu,
-                "ram": system.ram,
-                "disk": system.disk,
-                "ping": system.ping,
-                "hostname": system.hostname,
-            }
-            METRICS_DATA[system_id] = system_data  # cache in memory
-        else:
-            # system not found → return default 0
-            return JsonResponse({"value": 0}, status=200)
+        # system not found → return default 0
+        return JsonResponse({"value": 0}, status=200)
 
     # Always return 0 if metric missing
-    value = system_data.get(metric, 0)
+    value = system_data.field(metric)
     return JsonResponse({"value": value}, status=200)
 
 
 def get_hostname(request, system_id):
     """
     Returns the hostname of the monitored system.
-    Reads from METRICS_DATA if available, otherwise falls back to DB.
+    Reads from the live cache if available, otherwise falls back to DB.
     Defaults to 'Unknown' if not found.
     """
-    system_data = METRICS_DATA.get(system_id)
+    system_data = load_system_data(system_id)
 
     if not system_data:
-        system = SystemMetric.objects.filter(system_id=system_id).first()
-        if system:
-            system_data = {"hostname": system.hostname}
-            METRICS_DATA[system_id] = system_data
-        else:
-            return JsonResponse({"hostname": "Unknown"}, status=200)
+        return JsonResponse({"hostname": "Unknown"}, status=200)
+
+    return JsonResponse({"hostname": system_data.hostname or "Unknown"}, status=200)
+
+
+def snapshot_etag(request, system_id):
+    """
+    Everything snapshot_data reports that can change without a new sample:
+    the host going down or coming back (and since when), alerts opening,
+    changing level or getting a new threshold from an edited rule.
+    """
+    system_data = load_system_data(system_id)
+    if not system_data:
+        return "none"
+    state = liveness_data(system_id, system_data)
+    parts = [str(system_data.version), state["status"], str(state["down_since"] or "")]
+    parts.extend(f"{a['metric']}:{a['severity']}:{a['threshold']}:{a['since']}"
+                 for a in alerts.engine.open_for(system_id))
+    return "-".join(parts)
+
+
+def liveness_data(system_id, system_data):
+    """
+    Liveness part of a snapshot, from the tracker of this process. A worker
+    that has not seen the system judges by the age of its last sample.
+    """
+    state = liveness.tracker.status(system_id)
+    if state["status"] == "unknown" and system_data:
+        age = history.now_ms() - system_data.version
+        state = {
+            "status": "down" if age > liveness.tracker.grace_ms(system_id) else "up",
+            "last_seen": system_data.version,
+            "down_since": None,
+        }
+    return state
+
+
+def heartbeat_alert(system_id, state):
+    """The liveness entry of a snapshot's "alerts" for a host that is down."""
+    return {
+        "metric": liveness.METRIC,
+        "severity": "critical",
+        "value": round((history.now_ms() - state["last_seen"]) / 1000, 1) if state["last_seen"] else None,
+        "threshold": round(liveness.tracker.grace_ms(system_id) / 1000, 1),
+        "since": alerts.ms_to_datetime(state["down_since"] or history.now_ms()).isoformat(),
+    }
+
+
+def snapshot_data(system_id):
+    """Builds the snapshot payload shared by get_snapshot and the live stream."""
+    system_data = load_system_data(system_id)
+
+    if not system_data:
+        return {
+            "system_id": system_id,
+            "hostname": "Unknown",
+            "cpu": 0, "ram": 0, "disk": 0, "ping": 0,
+            "updated_at": None,
+            "status": "unknown",
+            "alerts": [],
+        }
+
+    updated_at = datetime.fromtimestamp(system_data.version / 1000, tz=timezone.utc)
+    state = liveness_data(system_id, system_data)
+    open_alerts = alerts.engine.open_for(system_id)
+    if state["status"] == "down":
+        open_alerts.insert(0, heartbeat_alert(system_id, state))
+    return {
+        "system_id": system_id,
+        "hostname": system_data.hostname or "Unknown",
+        "cpu": system_data.cpu,
+        "ram": system_data.ram,
+        "disk": system_data.disk,
+        "ping": system_data.ping,
+        "updated_at": updated_at.isoformat(),
+        "status": state["status"],
+        "alerts": open_alerts,
+    }
+
+
+def get_details(request, system_id):
+    """
+    Latest extended metrics of one system (load average, disk and network
+    I/O rates, per-core CPU, per-mount disk usage, top processes), or
+    nulls and empty lists if its agent does not send them.
+    """
+    system = SystemMetric.objects.filter(system_id=system_id).select_related("detail").first()
+    if not system:
+        return JsonResponse({"status": "error", "message": "unknown system"}, status=404)
+    detail = getattr(system, "detail", None)
+    return JsonResponse({
+        "system_id": system_id,
+        "load": [system.load1, system.load5, system.load15],
+        "disk_io": {"read": system.disk_read, "write": system.disk_write},
+        "net_io": {"sent": system.net_sent, "recv": system.net_recv},
+        "cores": detail.cores if detail else [],
+        "mounts": detail.mounts if detail else {},
+        "processes": [
+            {"pid": pid, "name": name, "cpu": cpu, "rss": rss}
+            for pid, name, cpu, rss in (detail.processes if detail else [])
+        ],
+        "updated_at": detail.updated_at.isoformat() if detail else None,
+    }, status=200)
+
+
+@condition(etag_func=snapshot_etag)
+def get_snapshot(request, system_id):
+    """
+    Returns every live metric plus hostname and updated_at in one response.
+    Carries an ETag derived from the sample version, so a poll with a
+    matching If-None-Match gets an empty 304 instead.
+    """
+    return JsonResponse(snapshot_data(system_id), status=200)
+
+
+async def stream_metrics(request, system_id):
+    """
+    Server-Sent Events stream of snapshots for one system.
+    Sends the current snapshot immediately, then one event per accepted
+    sample, with a comment line as keepalive while the host is quiet.
+    Samples accepted by this worker arrive through live.hub; those taken
+    by other workers are found by polling the shared store's version
+    every SYSWATCH_STREAM_POLL seconds.
+    Needs ASGI: under WSGI (runserver, gunicorn) the endless stream would
+    be consumed synchronously and hold a worker forever, so it answers
+    503 and the dashboard polls /snapshot/ instead.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"status": "error", "message": "live streams need the ASGI server (sysproject.asgi)"}, status=503,
+        )
+
+    async def events():
+        sub = live.hub.subscribe(system_id)
+        keepalive = settings.SYSWATCH_STREAM_KEEPALIVE
+        poll = min(settings.SYSWATCH_STREAM_POLL, keepalive) if shm.enabled() else keepalive
+        try:
+            # Read before building the snapshot, so a sample landing in between is resent
+            sent = stored_version(system_id)
+            initial = await sync_to_async(snapshot_data)(system_id)
+            yield f"data: {json.dumps(initial)}\n\n"
+            idle = 0.0
+            while True:
+                # Lets every worker tell this system's agent to report fast
+                control.mark_watched(system_id)
+                try:
+                    payload = await asyncio.wait_for(sub.next(), poll)
+                except asyncio.TimeoutError:
+                    version = stored_version(system_id)
+                    if version > max(sent, sub.version):
+                        # Accepted by another worker: its hub cannot reach us
+                        sent = version
+                        snapshot = await sync_to_async(snapshot_data)(system_id)
+                        idle = 0.0
+                        yield f"data: {json.dumps(snapshot)}\n\n"
+                        continue
+                    idle += poll
+                    if idle >= keepalive:
+                        idle = 0.0
+                        yield ": keepalive\n\n"
+                    continue
+                idle = 0.0
+                yield f"data: {payload}\n\n"
+        finally:
+            live.hub.unsubscribe(sub)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # don't let a proxy buffer the stream
+    return response
 
-    return JsonResponse({"hostname": system_data.get("hostname", "Unknown")}, status=200)
+
+# ---------------- Alerts ----------------
+def alert_data(alert):
+    return {
+        "system_id": alert.system_id,
+        "metric": alert.metric,
+        "severity": alert.severity,
+        "value": alert.value,
+        "threshold": alert.threshold,
+        "started_at": alert.started_at.isoformat(),
+        "resolved_at": alert.resolved_at.isoformat() if alert.resolved_at else None,
+    }
+
+
+def get_alerts(request):
+    """
+    Open alerts across all systems, newest first.
+    Optional ?severity=warning|critical and ?limit= (default 500).
+    """
+    try:
+        limit = min(max(1, int(request.GET.get("limit", 500))), 5000)
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "invalid limit"}, status=400)
+
+    open_alerts = Alert.objects.filter(resolved_at__isnull=True).order_by("-started_at")
+    if request.GET.get("severity"):
+        open_alerts = open_alerts.filter(severity=request.GET["severity"])
+    return JsonResponse({"alerts": [alert_data(a) for a in open_alerts[:limit]]}, status=200)
+
+
+def is_operator(request):
+    """
+    Staff users (session login, CSRF-checked like any form) or requests
+    with "Authorization: Bearer <SYSWATCH_OPERATOR_TOKEN>" when a token is set.
+    """
+    token = settings.SYSWATCH_OPERATOR_TOKEN
+    if token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return True
+    if not request.user.is_staff:
+        return False
+    return CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {}) is None
+
+
+def operator_required():
+    return JsonResponse({"status": "error", "message": "staff login or operator token required"}, status=403)
+
+
+@csrf_exempt
+def system_alerts(request, system_id):
+    """
+    GET: open alerts, the 50 most recent ones and the effective rules for
+    one system.
+    POST (see is_operator): per-host threshold overrides as JSON, e.g.
+    {"cpu": {"warning": 90, "critical": 95, "for_seconds": 60}, "ram": null};
+    null removes the override for that metric. Nothing is saved unless
+    every override is valid (alerts.parse_override).
+    """
+    if request.method == "POST":
+        if not is_operator(request):
+            return operator_required()
+        try:
+            data = json.loads(request.body.decode("utf-8"))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return JsonResponse({"status": "error", "message": "Invalid JSON"}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({"status": "error", "message": "expected an object keyed by metric"}, status=400)
+
+        changes = {}
+        for metric, override in data.items():
+            if metric not in settings.SYSWATCH_ALERT_THRESHOLDS:
+                return JsonResponse({"status": "error", "message": f"unknown metric {metric}"}, status=400)
+            try:
+                changes[metric] = None if override is None else alerts.parse_override(metric, override)
+            except ValueError as e:
+                return JsonResponse({"status": "error", "message": str(e)}, status=400)
+        with transaction.atomic():
+            for metric, fields in changes.items():
+                if fields is None:
+                    AlertRule.objects.filter(system_id=system_id, metric=metric).delete()
+                else:
+                    AlertRule.objects.update_or_create(system_id=system_id, metric=metric, defaults=fields)
+        alerts.engine.reload_rules()
+
+    rules = alerts.engine.rules_for(system_id)
+    recent = Alert.objects.filter(system_id=system_id).order_by("-started_at")[:50]
+    return JsonResponse({
+        "system_id": system_id,
+        "open": [alert_data(a) for a in recent if a.resolved_at is None],
+        "recent": [alert_data(a) for a in recent],
+        "rules": {metric: rule.as_dict() for metric, rule in rules.items()},
+    }, status=200)
+
+
+def get_liveness(request):
+    """
+    Hosts whose agent stopped reporting (see myapp/liveness.py), longest
+    down first. Optional ?limit= (default 500).
+    """
+    try:
+        limit = min(max(1, int(request.GET.get("limit", 500))), 5000)
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "invalid limit"}, status=400)
+
+    tracker = liveness.tracker
+    return JsonResponse({
+        "tracked": tracker.tracked(),
+        "down_count": tracker.down_count(),
+        "down": [
+            {
+                "system_id": system_id,
+                "since": alerts.ms_to_datetime(since).isoformat(),
+                "last_seen": alerts.ms_to_datetime(last_seen).isoformat() if last_seen else None,
+            }
+            for system_id, since, last_seen in tracker.down_hosts(limit)
+        ],
+    }, status=200)
+
+
+def get_anomalies(request):
+    """
+    Hosts currently deviating from their own baseline (see myapp/anomaly.py),
+    highest z-score first. Optional ?system_id= and ?limit= (default 100).
+    """
+    try:
+        limit = min(max(1, int(request.GET.get("limit", 100))), 5000)
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "invalid limit"}, status=400)
+
+    detector = anomaly.detector
+    scored_at = detector.scored_at
+    return JsonResponse({
+        "threshold": detector.threshold,
+        "hosts": detector.host_count(),
+        "scored_at": datetime.fromtimestamp(scored_at, tz=timezone.utc).isoformat() if scored_at else None,
+        "anomalies": detector.anomalies(limit, request.GET.get("system_id")),
+    }, status=200)
+
+
+# ---------------- Fleet ----------------
+def get_fleet(request):
+    """
+    Latest values of every host, one keyset page at a time (see myapp/fleet.py).
+    ?sort=system_id|updated_at|cpu|ram|disk|ping, "-" prefix for descending
+    (default system_id); ?limit= (default SYSWATCH_FLEET_PAGE); ?after= the
+    "next" cursor of the previous page; ?max_age= seconds to leave out hosts
+    that stopped reporting. Top 20 CPU: ?sort=-cpu&limit=20.
+    Lists every system_id, so it needs is_operator. Each host's "hot" lists
+    the metrics at or above its critical alert threshold.
+    """
+    if not is_operator(request):
+        return operator_required()
+    stale_after = settings.SYSWATCH_FLEET_STALE_AFTER
+    try:
+        limit = min(max(1, query_number(request, "limit", settings.SYSWATCH_FLEET_PAGE, int)),
+                    settings.SYSWATCH_FLEET_MAX_PAGE)
+        max_age = query_number(request, "max_age")
+        if max_age is not None and not 0 <= max_age <= MAX_SECONDS:
+            raise ValueError("max_age must be a number of seconds")
+        with telemetry.span("fleet.page"):
+            rows, cursor = fleet.page(request.GET.get("sort", "system_id"), limit,
+                                      request.GET.get("after"), max_age)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    now = datetime.now(timezone.utc)
+    hosts = []
+    for row in rows:
+        age = (now - row.pop("updated_at")).total_seconds()
+        row.pop("id")
+        rules = alerts.engine.rules_for(row["system_id"])
+        hot = [metric for metric, rule in rules.items() if row.get(metric) is not None and row[metric] >= rule.critical]
+        hosts.append({**row, "age": round(age, 1), "stale": age > stale_after, "hot": hot,
+                      "down": liveness.tracker.is_down(row["system_id"])})
+    return JsonResponse({
+        **fleet.counts(stale_after),
+        "down": liveness.tracker.down_count(),
+        "stale_after": stale_after,
+        "systems": hosts,
+        "next": cursor,
+    }, status=200)
+
+
+# ---------------- History ----------------
+# Largest timestamp or duration accepted in query parameters (seconds, about year 5000)
+MAX_SECONDS = 1e11
+
+
+def query_number(request, name, default=None, kind=float):
+    """
+    ?name= as a finite number of type `kind`, or `default` if absent.
+    Raises ValueError with a fixed message rather than the parser's own.
+    """
+    raw = request.GET.get(name)
+    if not raw:
+        return default
+    try:
+        value = kind(raw)
+        if math.isfinite(value):
+            return value
+    except (ValueError, OverflowError):
+        pass
+    raise ValueError(f"{name} must be {'an integer' if kind is int else 'a number'}")
+
+
+def parse_range(request, default_span):
+    """
+    Reads ?start=&end= (unix seconds) into epoch ms. Defaults to the last
+    `default_span` seconds. Raises ValueError on bad input.
+    """
+    bounds = {}
+    for name in ("start", "end"):
+        seconds = query_number(request, name)
+        if seconds is not None and not 0 <= seconds <= MAX_SECONDS:
+            raise ValueError(f"{name} must be a unix timestamp in seconds")
+        bounds[name] = None if seconds is None else int(seconds * 1000)
+    end = history.now_ms() if bounds["end"] is None else bounds["end"]
+    start = end - default_span * 1000 if bounds["start"] is None else bounds["start"]
+    if start >= end:
+        raise ValueError("start must be before end")
+    return start, end
+
+
+def parse_metrics(request):
+    """Reads ?metrics=cpu,ram (default: all). Raises ValueError on unknown names."""
+    metrics = tuple(m for m in request.GET.get("metrics", ",".join(history.HISTORY_FIELDS)).split(",") if m)
+    if not metrics or set(metrics) - set(history.HISTORY_FIELDS):
+        raise ValueError(f"metrics must be among {list(history.HISTORY_FIELDS)}")
+    return metrics
+
+
+def get_range(request, system_id):
+    """
+    Raw history for charts, downsampled server-side with LTTB to at most
+    ?points= (default 500) per metric. ?metrics=cpu,ram (default all four),
+    ?start=&end= in unix seconds (default: the last hour).
+    Returns {"series": {metric: [[ts_ms, value], ...]}}. Ranges wider than
+    SYSWATCH_RANGE_MAX_RAW_SECONDS are read from the rollups instead (the
+    mean of each bucket; "resolution" says which). With ?summary=1,
+    also "summaries": {metric: [[ts_ms, n, min, max, mean, p95], ...]} of
+    agent-side pre-aggregation, merged into at most ?points= buckets.
+    """
+    try:
+        metrics = parse_metrics(request)
+        start, end = parse_range(request, 3600)
+        points = min(max(3, query_number(request, "points", 500, int)), 10000)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    if end - start > settings.SYSWATCH_RANGE_MAX_RAW_SECONDS * 1000:
+        # Too many raw rows to read per request: chart bucket means
+        resolution = rollups.pick_resolution(start, end, points)
+        rows = rollups.means(system_id, start, end, resolution, metrics)
+    else:
+        resolution = None
+        rows = list(history.samples_between(system_id, start, end, metrics))
+    with telemetry.span("range.downsample"):
+        series = downsample.downsample(rows, metrics, points)
+    data = {
+        "system_id": system_id,
+        "start": start,
+        "end": end,
+        "resolution": resolution,
+        "raw_points": len(rows),
+        "series": series,
+    }
+    if request.GET.get("summary", "") in ("1", "true", "yes"):
+        data["summaries"] = {}
+        for metric in metrics:
+            summary_rows = list(history.summaries_between(system_id, metric, start, end))
+            with telemetry.span("range.downsample"):
+                data["summaries"][metric] = downsample.merge_summaries(summary_rows, points)
+    return JsonResponse(data, status=200)
+
+
+async def export_history(request):
+    """
+    Streams raw history as a download, chunk by chunk (see myapp/export.py).
+    ?hosts=a,b (default: the whole fleet), ?start=&end= in unix seconds
+    (default: the last 24 h), ?metrics=, ?format=csv|ndjson|columns,
+    ?gzip=1 for a .gz file.
+    Under ASGI chunks are pulled through the sync thread pool; under WSGI
+    (runserver, gunicorn) the sync generator itself is the response body,
+    since WSGI would otherwise collect an async one in memory first.
+    Needs is_operator.
+    """
+    if not await sync_to_async(is_operator)(request):
+        return operator_required()
+    fmt = request.GET.get("format", "csv")
+    if fmt not in export.FORMATS:
+        return JsonResponse({"status": "error", "message": f"format must be one of {list(export.FORMATS)}"}, status=400)
+    try:
+        metrics = parse_metrics(request)
+        start, end = parse_range(request, 86400)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    hosts = [h for h in request.GET.get("hosts", "").split(",") if h] or None
+    compress = request.GET.get("gzip", "") in ("1", "true", "yes")
+
+    parts = export.encode(export.chunks(hosts, start, end, metrics), fmt, metrics, compress)
+    if not isinstance(request, ASGIRequest):
+        return export_response(parts, fmt, start, end, compress)
+
+    async def stream():
+        # Each chunk is read and encoded in the sync thread (DB + SQLite
+        # files), one at a time, so the response never holds more than one.
+        next_part = sync_to_async(next)
+        try:
+            while (part := await next_part(parts, None)) is not None:
+                yield part
+        finally:
+            await sync_to_async(parts.close)()
+
+    return export_response(stream(), fmt, start, end, compress)
+
+
+def export_response(body, fmt, start, end, compress):
+    """Download response for export_history around a sync or async iterator of bytes."""
+    content_type, extension = export.FORMATS[fmt]
+    filename = f"syswatch-history-{start // 1000}-{end // 1000}.{extension}"
+    if compress:
+        content_type, filename = "application/gzip", filename + ".gz"
+    response = StreamingHttpResponse(body, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def get_rollups(request, system_id):
+    """
+    Aggregated history (min/max/mean/p50/p95/p99 per metric) for a system.
+    ?start=&end= in unix seconds (default: last 24 h), ?points= target
+    number of buckets (picks the resolution), or ?resolution=60|3600|86400.
+    """
+    try:
+        start, end = parse_range(request, 86400)
+        points = max(1, query_number(request, "points", 500, int))
+        resolution = query_number(request, "resolution", kind=int)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    if resolution is not None and resolution not in rollups.RESOLUTIONS:
+        return JsonResponse({"status": "error", "message": f"resolution must be one of {list(rollups.RESOLUTIONS)}"}, status=400)
+
+    resolution, buckets, summary = rollups.query(system_id, start, end, points, resolution)
+    return JsonResponse({
+        "system_id": system_id,
+        "resolution": resolution,
+        "buckets": buckets,
+        "summary": summary,
+    }, status=200)
 
 
 # ---------------- Local system monitoring (optional) ----------------
+# Served from the background sampler (myapp/sampler.py); add ?history=1
+# for the recent ring buffer as [timestamp, value] pairs.
+def local_metric_response(request, metric):
+    latest = sampler.sampler.latest(wait=1)
+    data = {"value": getattr(latest, metric) if latest else 0}
+    if request.GET.get("history"):
+        data["history"] = [[s.ts, getattr(s, metric)] for s in sampler.sampler.history()]
+    return JsonResponse(data, status=200)
+
 def get_cpu_usage(request):
-    return JsonResponse({"value": psutil.cpu_percent(interval=0.5)}, status=200)
+    return local_metric_response(request, "cpu")
 
 def get_ram_usage(request):
-    memory = psutil.virtual_memory()
-    return JsonResponse({"value": memory.percent}, status=200)
+    return local_metric_response(request, "ram")
 
 def get_disk_usage(request):
-    disk = psutil.disk_usage('/')
-    return JsonResponse({"value": disk.percent}, status=200)
+    return local_metric_response(request, "disk")
 
 def get_ping_latency(request):
-    try:
-        result = subprocess.run(
-            ["ping", "-c", "1", "8.8.8.8"],
-            capture_output=True, text=True
-        )
-        latency_line = [line for line in result.stdout.split('\n') if "time=" in line]
-        latency = float(latency_line[0].split("time=")[1].split(" ")[0]) if latency_line else 0
-    except Exception:
-        latency = 0
-    return JsonResponse({"value": latency}, status=200)
+    """
+    Best RTT (ms) across SYSWATCH_PROBE_TARGETS from the background prober.
+    Never probes in the request; "value" is null until a probe answers
+(pending) or when every target timed out, and "status" says which.
+    """
+    sampler.sampler.start()  # also starts the prober
+    results = probes.prober.results()
+    latency = probes.prober.best_rtt()
+
+    if not results:
+        status = "pending"
+    elif latency is None:
+        status = "timeout"
+    else:
+        status = "ok"
+
+    data = {
+        "value": latency,
+        "status": status,
+        "targets": [r._asdict() for r in results],
+    }
+    if request.GET.get("history"):
+        data["history"] = [[s.ts, s.ping] for s in sampler.sampler.history()]
+    return JsonResponse(data, status=200)
 
 
 # ---------------- Dashboard rendering ----------------
@@ -141,7 +872,61 @@ def dashboard_view(request, system_id):
     system = SystemMetric.objects.filter(system_id=system_id).first()
     hostname = system.hostname if system else "Waiting for Agent..."
 
-    return render(request, "index.html", {
-        "system_id": system_id,
-        "hostname": hostname,
-    })
\ No newline at end of file
+    with telemetry.span("dashboard.render"):
+        return render(request, "index.html", {
+            "system_id": system_id,
+            "hostname": hostname,
+        })
+
+
+@staff_member_required
+def fleet_view(request):
+    """Renders the fleet overview (staff only); fleet.js pages through /api/fleet/."""
+    with telemetry.span("dashboard.render"):
+        return render(request, "fleet.html")
+
+
+# ---------------- Self-metrics ----------------
+# State read only at scrape time (see myapp/telemetry.py)
+telemetry.Callback("syswatch_writebehind_pending", "Samples waiting for the write-behind flush.",
+                   lambda: writebehind.buffer.depth())
+telemetry.Callback("syswatch_writebehind_dropped_total", "Samples dropped while the database was unavailable.",
+                   lambda: writebehind.buffer.dropped, kind="counter")
+telemetry.Callback("syswatch_history_pending", "History rows waiting for a batched insert.",
+                   lambda: len(history.buffer))
+telemetry.Callback("syswatch_rollup_pending", "Rollup buckets waiting to be merged into MetricRollup.",
+                   lambda: rollups.engine.depth())
+telemetry.Callback("syswatch_live_cache_entries", "Systems held in the per-process live cache.",
+                   lambda: LIVE_CACHE.stats()["size"])
+telemetry.Callback("syswatch_live_cache_events_total", "Live cache hits, misses, evictions and expirations.",
+                   lambda: {k: v for k, v in LIVE_CACHE.stats().items() if k not in ("size", "capacity")},
+                   kind="counter", labelname="event")
+telemetry.Callback("syswatch_stream_subscribers", "Open dashboard live streams in this process.",
+                   lambda: live.hub.subscriber_count())
+telemetry.Callback("syswatch_history_partitions", "History partition files on disk.",
+                   lambda: len(history.store.partitions()))
+telemetry.Callback("syswatch_ingest_rate", "Samples/s accepted by this process (10 s moving average).",
+                   lambda: round(control.meter.rate, 1))
+telemetry.Callback("syswatch_ingest_load_factor", "How far over its ingest budget this process is (1 = within).",
+                   control.load_factor)
+telemetry.Callback("syswatch_liveness_hosts", "Hosts tracked by the liveness tracker.",
+                   lambda: liveness.tracker.tracked())
+telemetry.Callback("syswatch_hosts_down", "Hosts whose agent stopped reporting.",
+                   lambda: liveness.tracker.down_count())
+telemetry.Callback("syswatch_anomaly_hosts", "Hosts tracked by the anomaly detector.",
+                   lambda: anomaly.detector.host_count())
+
+
+def internal_metrics(request):
+    """
+    Prometheus scrape endpoint for this process. Allowed from
+    SYSWATCH_METRICS_ALLOW addresses, or with
+    "Authorization: Bearer <SYSWATCH_METRICS_TOKEN>" when a token is set.
+    """
+    token = settings.SYSWATCH_METRICS_TOKEN
+    authorized = request.META.get("REMOTE_ADDR") in settings.SYSWATCH_METRICS_ALLOW or (
+        token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+    )
+    if not authorized:
+        return HttpResponse("forbidden\n", status=403, content_type="text/plain")
+    return HttpResponse(telemetry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
\ No newline at end of file
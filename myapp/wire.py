@@ -0,0 +1,242 @@
+"""
+Compact binary encoding for agent samples.
+
+Agents may POST Content-Type: application/x-syswatch instead of JSON.
+All integers are little-endian; metric values are fixed point in
+hundredths (cpu 12.34 % -> 1234, ping 5.67 ms -> 567).
+
+    frame   = magic "SW" (2s) | version (u8) | record count (u16) | record*
+    record  = flags (u8) | id length (u8) | system_id | [hostname] | body | [summary] | [ext]
+    system_id: id length 0 -> 16 raw UUID bytes, else that many UTF-8 bytes
+    hostname:  only if FLAG_HOSTNAME -> length (u8) | UTF-8 bytes
+    body:      full  -> ts ms (i64) | cpu ram disk ping (4 x u32)
+               delta -> base ts ms (i64) | ts - base (i32) | 4 x i16 deltas
+    ping:      NULL (0xFFFFFFFF) in a full body when the probe timed out;
+               a sample with no ping, or one relative to such a sample,
+               is always sent as a full record
+    summary:   only if FLAG_SUMMARY -> metric mask (u8, bit i = cpu ram disk ping)
+               | per metric in the mask: count (u16) | min max mean p95 (4 x u32)
+    ext:       only if FLAG_EXTENDED -> length (u16) | compact JSON object,
+               the sample's extended metrics (see ingest.parse_ext)
+
+A sample without a hostname keeps the one the server already has, so the
+agent only sends it when it changes. A delta record is relative to the
+sample whose ts is `base ts`; the server resolves it against the live
+store and asks the agent to resend a full record ("resync") if the base
+is not the sample it holds. A minimal full record for a UUID host is 34
+bytes versus ~150 for the JSON object. Extended metrics are variable
+length and sent only every few samples, so they ride along as JSON.
+
+Decoding works on a memoryview of the request body with struct.unpack_from,
+so no intermediate copies of the payload are made.
+"""
+import json
+import struct
+import uuid
+from collections import namedtuple
+
+from .history import HISTORY_FIELDS, now_ms
+from .ingest import Sample, bound_ts, parse_ext
+
+CONTENT_TYPE = "application/x-syswatch"
+
+MAGIC = b"SW"
+VERSION = 1
+FRAME = struct.Struct("<2sBH")
+RECORD = struct.Struct("<BB")
+FULL = struct.Struct("<q4I")
+DELTA = struct.Struct("<qi4h")
+LENGTH = struct.Struct("<B")
+EXT_LENGTH = struct.Struct("<H")
+SUMMARY = struct.Struct("<H4I")
+
+FLAG_HOSTNAME = 0x01
+FLAG_DELTA = 0x02
+FLAG_EXTENDED = 0x04
+FLAG_SUMMARY = 0x08
+
+SCALE = 100
+NULL = 0xFFFFFFFF
+PING = HISTORY_FIELDS.index("ping")
+
+Record = namedtuple("Record", ["system_id", "hostname", "ts", "values", "base_ts", "ext", "summary"])
+
+
+def decode_frame(body):
+    """
+    Parses a binary frame into Records. For delta records `values` holds
+    the deltas and `base_ts` the base sample's ts; otherwise base_ts is None.
+    Raises ValueError on malformed input.
+    """
+    view = memoryview(body)
+    try:
+        magic, version, count = FRAME.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("unsupported binary frame")
+        offset = FRAME.size
+        records = []
+        for _ in range(count):
+            flags, id_length = RECORD.unpack_from(view, offset)
+            offset += RECORD.size
+
+            if id_length == 0:
+                system_id = str(uuid.UUID(bytes=bytes(view[offset:offset + 16])))
+                offset += 16
+            else:
+                system_id = str(view[offset:offset + id_length], "utf-8")
+                offset += id_length
+
+            hostname = None
+            if flags & FLAG_HOSTNAME:
+                (length,) = LENGTH.unpack_from(view, offset)
+                offset += LENGTH.size
+                hostname = str(view[offset:offset + length], "utf-8")
+                offset += length
+
+            if flags & FLAG_DELTA:
+                base_ts, dt, *values = DELTA.unpack_from(view, offset)
+                offset += DELTA.size
+                ts = base_ts + dt
+            else:
+                ts, *values = FULL.unpack_from(view, offset)
+                offset += FULL.size
+                base_ts = None
+                if NULL in values[:PING]:
+                    raise ValueError("only ping may be null")
+                if values[PING] == NULL:
+                    values[PING] = None
+
+            summary = None
+            if flags & FLAG_SUMMARY:
+                (mask,) = LENGTH.unpack_from(view, offset)
+                offset += LENGTH.size
+                summary = {}
+                for i, metric in enumerate(HISTORY_FIELDS):
+                    if mask & (1 << i):
+                        count, *stats = SUMMARY.unpack_from(view, offset)
+                        offset += SUMMARY.size
+                        if count < 1 or stats[0] > stats[1]:
+                            raise ValueError(f"invalid summary.{metric}")
+                        summary[metric] = [count, *(v / SCALE for v in stats)]
+                summary = summary or None
+
+            ext = None
+            if flags & FLAG_EXTENDED:
+                (length,) = EXT_LENGTH.unpack_from(view, offset)
+                offset += EXT_LENGTH.size
+                if offset + length > len(view):
+                    raise struct.error("ext past end of frame")
+                ext = parse_ext(json.loads(bytes(view[offset:offset + length])))
+                offset += length
+            records.append(Record(system_id, hostname, ts, values, base_ts, ext, summary))
+    except (struct.error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"truncated or malformed binary frame: {e}")
+    if offset != len(view):
+        raise ValueError("trailing bytes after last record")
+    return records
+
+
+def resolve(records, lookup):
+    """
+    Turns Records into ingest.Samples. `lookup(system_id)` returns the
+    current cache.LiveRecord (or None) and supplies delta bases and
+    omitted hostnames. Returns (samples, resync, rejected): resync lists
+    the indexes of delta records whose base did not match, rejected the
+    {"index": i, "message": ...} of records that can never be stored.
+    Timestamps are bounded like JSON ones (ingest.bound_ts).
+    """
+    samples, resync, rejected = [], [], []
+    latest = {}  # samples earlier in this frame are newer than the store
+    now = now_ms()
+    for index, record in enumerate(records):
+        if len(record.system_id) > 64:
+            rejected.append({"index": index, "message": "invalid system_id"})
+            continue
+        try:
+            ts = bound_ts(record.ts, now)
+        except ValueError as e:
+            rejected.append({"index": index, "message": str(e)})
+            continue
+        base = latest.get(record.system_id)
+        if base is None:
+            live = lookup(record.system_id)
+            if live is not None:
+                base = Sample(record.system_id, live.hostname, live.version,
+                              live.cpu, live.ram, live.disk, live.ping)
+
+        if record.base_ts is not None:
+            if base is None or base.ts != record.base_ts or base.ping is None:
+                resync.append(index)
+                continue
+            values = [
+                (round(previous * SCALE) + delta) / SCALE
+                for previous, delta in zip((base.cpu, base.ram, base.disk, base.ping), record.values)
+            ]
+        else:
+            values = [None if value is None else value / SCALE for value in record.values]
+
+        hostname = record.hostname
+        if hostname is None:
+            hostname = base.hostname if base is not None else ""
+
+        sample = Sample(record.system_id, hostname[:128], ts, *values, record.ext, record.summary)
+        latest[record.system_id] = sample
+        samples.append(sample)
+    return samples, resync, rejected
+
+
+def uuid_bytes(system_id):
+    """16 raw bytes if system_id is a canonical UUID string, else None."""
+    try:
+        value = uuid.UUID(system_id)
+    except ValueError:
+        return None
+    return value.bytes if str(value) == system_id else None
+
+
+def encode_frame(samples, previous=None, send_hostname=True):
+    """
+    Encodes ingest.Samples as one frame. `previous` maps system_id to the
+    Sample to delta-encode against (if the deltas fit). Used by tooling;
+    the agent carries its own encoder.
+    """
+    previous = previous or {}
+    parts = [FRAME.pack(MAGIC, VERSION, len(samples))]
+    for sample in samples:
+        flags = FLAG_HOSTNAME if send_hostname else 0
+        raw_id = uuid_bytes(sample.system_id)
+        id_field = b"" if raw_id else sample.system_id.encode()
+
+        values = [NULL if v is None else max(0, round(v * SCALE))
+                  for v in (sample.cpu, sample.ram, sample.disk, sample.ping)]
+        base = previous.get(sample.system_id)
+        body = None
+        if base is not None and sample.ping is not None and base.ping is not None:
+            deltas = [v - round(b * SCALE) for v, b in zip(values, (base.cpu, base.ram, base.disk, base.ping))]
+            dt = sample.ts - base.ts
+            if all(-32768 <= d <= 32767 for d in deltas) and -2**31 <= dt < 2**31:
+                flags |= FLAG_DELTA
+                body = DELTA.pack(base.ts, dt, *deltas)
+        if body is None:
+            body = FULL.pack(sample.ts, *values)
+
+        if sample.summary:
+            flags |= FLAG_SUMMARY
+        if sample.ext is not None:
+            flags |= FLAG_EXTENDED
+        parts.append(RECORD.pack(flags, len(id_field)))
+        parts.append(raw_id or id_field)
+        if flags & FLAG_HOSTNAME:
+            host = sample.hostname.encode()[:255].decode(errors="ignore").encode()
+            parts.append(LENGTH.pack(len(host)) + host)
+        parts.append(body)
+        if sample.summary:
+            metrics = [m for m in HISTORY_FIELDS if m in sample.summary]
+            parts.append(LENGTH.pack(sum(1 << HISTORY_FIELDS.index(m) for m in metrics)))
+            for metric in metrics:
+                count, *stats = sample.summary[metric]
+                parts.append(SUMMARY.pack(min(count, 0xFFFF), *(max(0, round(v * SCALE)) for v in stats)))
+        if sample.ext is not None:
+            ext = json.dumps(sample.ext, separators=(",", ":")).encode()
+            parts.append(EXT_LENGTH.pack(len(ext)) + ext)
+    return b"".join(parts)
@@ -0,0 +1,104 @@
+"""
+Write-behind buffer for agent samples.
+
+With SYSWATCH_WRITE_BEHIND enabled, receive_metrics only validates the
+sample, hands it to this buffer and updates the in-memory cache; it never
+waits on the database write lock. A background thread flushes pending
+samples through ingest.store_samples (latest row per system_id coalesced,
+full history appended) every SYSWATCH_FLUSH_INTERVAL seconds, or as soon
+as SYSWATCH_FLUSH_MAX_PENDING samples are waiting. While writes fail the
+queue is capped at SYSWATCH_WRITE_BEHIND_MAX_QUEUE (oldest dropped first);
+ingest sheds load before that (control.overloaded).
+Pending samples are drained on interpreter shutdown.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from . import ingest, telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    def __init__(self, interval, max_pending, max_queue):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def submit(self, samples):
+        """Queues samples for the next flush. Never touches the database."""
+        with self._lock:
+            self._pending.extend(samples)
+            full = len(self._pending) >= self.max_pending
+            if self._thread is None and not self._stopping:
+                self._start()
+        if full:
+            self._wake.set()
+
+    def depth(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Writes everything pending. Failed batches are re-queued."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        try:
+            with telemetry.span("writebehind.flush"):
+                ingest.store_samples(batch)
+        except Exception:
+            logger.exception("write-behind flush of %d samples failed", len(batch))
+            with self._lock:
+                self._pending[:0] = batch
+                overflow = len(self._pending) - self.max_queue
+                if overflow > 0:
+                    # Keep memory bounded while the database is unavailable
+                    del self._pending[:overflow]
+                    self.dropped += overflow
+            return 0
+        return len(batch)
+
+    def stop(self):
+        """Stops the flusher thread and drains whatever is still pending."""
+        with self._lock:
+            self._stopping = True
+            thread = self._thread
+        self._wake.set()
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="syswatch-write-behind", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+        connection.close()
+
+
+buffer = WriteBehindBuffer(
+    interval=settings.SYSWATCH_FLUSH_INTERVAL,
+    max_pending=settings.SYSWATCH_FLUSH_MAX_PENDING,
+    max_queue=settings.SYSWATCH_WRITE_BEHIND_MAX_QUEUE,
+)
+atexit.register(buffer.stop)
+
+
+def enabled():
+    return settings.SYSWATCH_WRITE_BEHIND
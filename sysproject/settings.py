@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myapp.telemetry.TimingMiddleware',  # first, so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,13 +85,189 @@ SQLITE_PATH = Path(os.environ.get("SQLITE_PATH", BASE_DIR / "db.sqlite3"))
 # Ensure parent folder exists
 SQLITE_PATH.parent.mkdir(parents=True, exist_ok=True)
 
+# WAL lets dashboard reads proceed while ingest writes. IMMEDIATE takes the
+# write lock at BEGIN, so concurrent writers (request threads, background
+# flushers) queue on the busy timeout instead of failing with "database
+# is locked" on a lock upgrade. Connections are kept open across requests.
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": SQLITE_PATH,
+        "OPTIONS": {
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA temp_store=MEMORY;"
+                "PRAGMA cache_size=-16000;"
+                "PRAGMA mmap_size=134217728"
+            ),
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
+        "CONN_MAX_AGE": int(os.environ.get("SYSWATCH_CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# ---------- Metric history ----------
+# Raw samples live in one SQLite file per SYSWATCH_PARTITION_SECONDS window
+# under SYSWATCH_PARTITION_DIR (see myapp/partitions.py); files older than
+# SYSWATCH_HISTORY_RETENTION_DAYS are deleted whole.
+SYSWATCH_PARTITION_DIR = Path(os.environ.get("SYSWATCH_PARTITION_DIR", SQLITE_PATH.parent / f"{SQLITE_PATH.stem}-history"))
+SYSWATCH_PARTITION_SECONDS = int(os.environ.get("SYSWATCH_PARTITION_SECONDS", 86400))
+SYSWATCH_HISTORY_RETENTION_DAYS = float(os.environ.get("SYSWATCH_HISTORY_RETENTION_DAYS", 30))
+
+# Samples are appended to history in batches of this many rows, or
+# after this many seconds, whichever comes first.
+SYSWATCH_HISTORY_BATCH_SIZE = int(os.environ.get("SYSWATCH_HISTORY_BATCH_SIZE", 500))
+SYSWATCH_HISTORY_MAX_DELAY = float(os.environ.get("SYSWATCH_HISTORY_MAX_DELAY", 2.0))
+
+# Rollups (myapp/rollups.py): pending 1 min / 1 h / 1 d aggregates are
+# merged into MetricRollup every this many seconds.
+SYSWATCH_ROLLUP_FLUSH_INTERVAL = float(os.environ.get("SYSWATCH_ROLLUP_FLUSH_INTERVAL", 10))
+
+# /api/metrics/<id>/range/ reads raw samples for spans up to this many
+# seconds; wider ones are charted from the rollups' per-bucket means.
+SYSWATCH_RANGE_MAX_RAW_SECONDS = float(os.environ.get("SYSWATCH_RANGE_MAX_RAW_SECONDS", 86400))
+
+# Exports (/api/export/, manage.py export_history) read and encode history
+# this many rows at a time.
+SYSWATCH_EXPORT_CHUNK = int(os.environ.get("SYSWATCH_EXPORT_CHUNK", 5000))
+
+# ---------- Ingest ----------
+# Sample timestamps may run this many seconds ahead of the server clock;
+# later ones are stored at server time. Samples older than
+# SYSWATCH_HISTORY_RETENTION_DAYS are rejected.
+SYSWATCH_INGEST_MAX_SKEW = float(os.environ.get("SYSWATCH_INGEST_MAX_SKEW", 300))
+# Largest JSON array accepted by a single bulk POST to /api/agent/metrics/
+SYSWATCH_INGEST_MAX_BATCH = int(os.environ.get("SYSWATCH_INGEST_MAX_BATCH", 5000))
+# Largest ingest body after gunzipping a Content-Encoding: gzip request
+SYSWATCH_INGEST_MAX_BODY = int(os.environ.get("SYSWATCH_INGEST_MAX_BODY", 8 * 1024 * 1024))
+
+# Write-behind: the ingest handler only buffers samples in memory and a
+# background thread writes them out every SYSWATCH_FLUSH_INTERVAL seconds,
+# or sooner once SYSWATCH_FLUSH_MAX_PENDING samples are waiting.
+SYSWATCH_WRITE_BEHIND = os.environ.get("SYSWATCH_WRITE_BEHIND", "True") == "True"
+SYSWATCH_FLUSH_INTERVAL = float(os.environ.get("SYSWATCH_FLUSH_INTERVAL", 1.0))
+SYSWATCH_FLUSH_MAX_PENDING = int(os.environ.get("SYSWATCH_FLUSH_MAX_PENDING", 2000))
+# Upper bound on the write-behind queue: while the database is failing, the
+# oldest samples beyond it are dropped. Load shedding below starts earlier.
+SYSWATCH_WRITE_BEHIND_MAX_QUEUE = int(os.environ.get("SYSWATCH_WRITE_BEHIND_MAX_QUEUE", 4 * SYSWATCH_FLUSH_MAX_PENDING))
+
+# Adaptive reporting (myapp/control.py): each ingest reply tells the agent
+# when to send next, every SYSWATCH_INTERVAL_WATCHED seconds while a
+# dashboard streams that system and SYSWATCH_INTERVAL_IDLE otherwise,
+# stretched under load (accepted samples/s above SYSWATCH_INGEST_TARGET_RATE,
+# or a write-behind backlog) up to SYSWATCH_INTERVAL_MAX. Once
+# SYSWATCH_INGEST_SHED_DEPTH samples wait for write-behind, ingest answers
+# 429 with a Retry-After of SYSWATCH_RETRY_AFTER seconds +/- 50%. The shed
+# depth defaults to half of SYSWATCH_WRITE_BEHIND_MAX_QUEUE and never exceeds
+# it, so agents are turned away (and spool) before the queue drops samples.
+SYSWATCH_INTERVAL_WATCHED = float(os.environ.get("SYSWATCH_INTERVAL_WATCHED", 1))
+SYSWATCH_INTERVAL_IDLE = float(os.environ.get("SYSWATCH_INTERVAL_IDLE", 30))
+SYSWATCH_INTERVAL_MAX = float(os.environ.get("SYSWATCH_INTERVAL_MAX", 300))
+SYSWATCH_INGEST_TARGET_RATE = float(os.environ.get("SYSWATCH_INGEST_TARGET_RATE", 2000))
+SYSWATCH_INGEST_SHED_DEPTH = min(
+    int(os.environ.get("SYSWATCH_INGEST_SHED_DEPTH", SYSWATCH_WRITE_BEHIND_MAX_QUEUE // 2)),
+    SYSWATCH_WRITE_BEHIND_MAX_QUEUE,
+)
+SYSWATCH_RETRY_AFTER = float(os.environ.get("SYSWATCH_RETRY_AFTER", 10))
+
+# ---------- Shared live store ----------
+# mmap-backed table of latest values shared by all worker processes on the
+# host (see myapp/shm.py). Each slot is 256 bytes; the default holds 65536
+# systems in 16 MiB. SYSWATCH_SHM_PATH defaults to a per-database file in
+# /dev/shm (or the temp dir).
+SYSWATCH_SHARED_STORE = os.environ.get("SYSWATCH_SHARED_STORE", "True") == "True"
+SYSWATCH_SHM_PATH = os.environ.get("SYSWATCH_SHM_PATH")
+SYSWATCH_SHM_SLOTS = int(os.environ.get("SYSWATCH_SHM_SLOTS", 65536))
+
+# Per-process live cache in front of the database (see myapp/cache.py):
+# at most SYSWATCH_CACHE_CAPACITY systems, each refreshed from the DB once
+# it is older than SYSWATCH_CACHE_TTL seconds.
+SYSWATCH_CACHE_CAPACITY = int(os.environ.get("SYSWATCH_CACHE_CAPACITY", 10000))
+SYSWATCH_CACHE_TTL = float(os.environ.get("SYSWATCH_CACHE_TTL", 10))
+
+# ---------- Live push ----------
+# Seconds between keepalive comments on an idle /api/metrics/<id>/stream/
+SYSWATCH_STREAM_KEEPALIVE = float(os.environ.get("SYSWATCH_STREAM_KEEPALIVE", 15))
+# Seconds between checks of the shared store for samples accepted by other
+# workers (those skip this worker's in-process hub)
+SYSWATCH_STREAM_POLL = float(os.environ.get("SYSWATCH_STREAM_POLL", 1))
+
+# ---------- Fleet overview ----------
+# /api/fleet/ pages hold SYSWATCH_FLEET_PAGE hosts by default (at most
+# SYSWATCH_FLEET_MAX_PAGE); hosts silent for SYSWATCH_FLEET_STALE_AFTER
+# seconds are flagged stale.
+SYSWATCH_FLEET_PAGE = int(os.environ.get("SYSWATCH_FLEET_PAGE", 50))
+SYSWATCH_FLEET_MAX_PAGE = int(os.environ.get("SYSWATCH_FLEET_MAX_PAGE", 1000))
+SYSWATCH_FLEET_STALE_AFTER = float(os.environ.get("SYSWATCH_FLEET_STALE_AFTER", 120))
+
+# ---------- Alerts ----------
+# Default thresholds evaluated on every accepted sample (myapp/alerts.py);
+# override per host and metric with AlertRule rows. A level fires after the
+# value has stayed above it for SYSWATCH_ALERT_FOR_SECONDS, and clears once
+# it drops SYSWATCH_ALERT_HYSTERESIS (a fraction) below the threshold.
+SYSWATCH_ALERT_THRESHOLDS = {
+    "cpu": {"warning": 70, "critical": 80},
+    "ram": {"warning": 75, "critical": 85},
+    "disk": {"warning": 80, "critical": 90},
+    "ping": {"warning": 100, "critical": 150},
+}
+SYSWATCH_ALERT_FOR_SECONDS = float(os.environ.get("SYSWATCH_ALERT_FOR_SECONDS", 15))
+SYSWATCH_ALERT_HYSTERESIS = float(os.environ.get("SYSWATCH_ALERT_HYSTERESIS", 0.05))
+# How often AlertRule overrides are reloaded (seconds)
+SYSWATCH_ALERT_RULES_TTL = float(os.environ.get("SYSWATCH_ALERT_RULES_TTL", 30))
+# POST /api/alerts/<system_id>/ (rule overrides), /api/fleet/ and
+# /api/export/ (every host's id and data) are open to staff users, and to
+# requests carrying "Authorization: Bearer <token>" when one is set.
+# SYSWATCH_ALERT_RULES_TOKEN is the older name of the same setting.
+SYSWATCH_OPERATOR_TOKEN = os.environ.get("SYSWATCH_OPERATOR_TOKEN") or os.environ.get("SYSWATCH_ALERT_RULES_TOKEN")
+
+# Agent liveness (myapp/liveness.py): a host is down, and gets a critical
+# "heartbeat" alert, once it has been silent for SYSWATCH_LIVENESS_MISSES
+# times the interval it was asked to report at, and at least
+# SYSWATCH_LIVENESS_MIN_GRACE seconds. Deadlines are checked every
+# SYSWATCH_LIVENESS_INTERVAL seconds.
+SYSWATCH_LIVENESS_MISSES = float(os.environ.get("SYSWATCH_LIVENESS_MISSES", 3))
+SYSWATCH_LIVENESS_MIN_GRACE = float(os.environ.get("SYSWATCH_LIVENESS_MIN_GRACE", 30))
+SYSWATCH_LIVENESS_INTERVAL = float(os.environ.get("SYSWATCH_LIVENESS_INTERVAL", 1))
+# Start the tracker when a server process starts (uvicorn, gunicorn or
+# runserver; not management commands, tests or scripts); otherwise it
+# starts with the first accepted sample.
+SYSWATCH_LIVENESS_AUTOSTART = os.environ.get("SYSWATCH_LIVENESS_AUTOSTART", "True") == "True"
+
+# Baseline anomalies (myapp/anomaly.py): every SYSWATCH_ANOMALY_INTERVAL
+# seconds each host's mean since the last tick is scored against its own
+# EWMA mean/std (weight SYSWATCH_ANOMALY_ALPHA). A z-score of at least
+# SYSWATCH_ANOMALY_Z is reported once SYSWATCH_ANOMALY_WARMUP ticks of
+# baseline exist; std is floored at SYSWATCH_ANOMALY_MIN_STD.
+SYSWATCH_ANOMALY_INTERVAL = float(os.environ.get("SYSWATCH_ANOMALY_INTERVAL", 10))
+SYSWATCH_ANOMALY_ALPHA = float(os.environ.get("SYSWATCH_ANOMALY_ALPHA", 0.05))
+SYSWATCH_ANOMALY_Z = float(os.environ.get("SYSWATCH_ANOMALY_Z", 4))
+SYSWATCH_ANOMALY_WARMUP = int(os.environ.get("SYSWATCH_ANOMALY_WARMUP", 30))
+SYSWATCH_ANOMALY_MIN_STD = float(os.environ.get("SYSWATCH_ANOMALY_MIN_STD", 1.0))
+
+# ---------- Self-metrics ----------
+# /internal/metrics (Prometheus text format) answers requests from these
+# addresses, or any request carrying "Authorization: Bearer <token>".
+SYSWATCH_METRICS_ALLOW = os.environ.get("SYSWATCH_METRICS_ALLOW", "127.0.0.1,::1").split(",")
+SYSWATCH_METRICS_TOKEN = os.environ.get("SYSWATCH_METRICS_TOKEN")
+
+# ---------- Latency probes ----------
+# Targets for /api/metrics/ping/: "host:port" is timed with a TCP connect,
+# a bare "host" with ICMP echo when permitted (else TCP :443).
+SYSWATCH_PROBE_TARGETS = os.environ.get("SYSWATCH_PROBE_TARGETS", "8.8.8.8:53,1.1.1.1:53").split(",")
+SYSWATCH_PROBE_INTERVAL = float(os.environ.get("SYSWATCH_PROBE_INTERVAL", 10))
+SYSWATCH_PROBE_TIMEOUT = float(os.environ.get("SYSWATCH_PROBE_TIMEOUT", 2))
+
+# ---------- Local host sampler ----------
+# /api/metrics/cpu|ram|disk|ping/ answer from a background sampler that
+# reads this host every SYSWATCH_HOST_SAMPLE_INTERVAL seconds and keeps
+# the last SYSWATCH_HOST_HISTORY samples.
+SYSWATCH_HOST_SAMPLE_INTERVAL = float(os.environ.get("SYSWATCH_HOST_SAMPLE_INTERVAL", 2))
+SYSWATCH_HOST_HISTORY = int(os.environ.get("SYSWATCH_HOST_HISTORY", 300))
+
 # ---------- General settings ----------
 SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY", "dev-secret-key")
 DEBUG = os.environ.get("DJANGO_DEBUG", "True") == "True"